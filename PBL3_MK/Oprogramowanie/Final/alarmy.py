@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+
+# Silnik reguł alarmu przymrozkowego z histerezą i powiadomieniami.
+# Reguły są deklaratywne (plik JSON, progi per stacja) i kompilowane raz
+# do funkcji Pythona - ocena odczytu to kilka porównań na regułę, więc
+# koszt nie rośnie z liczbą stacji (stan stacji to zwykły słownik).
+#
+# Format reguły:
+#   {"nazwa": "prog_bezwzgledny",
+#    "wejscie": {"temp": {"<=": 2.0}},      - wszystkie warunki muszą być spełnione
+#    "wyjscie": {"temp": {">": 2.5}},       - opcjonalne, lista słowników = dowolny z nich
+#    "margines": {"temp": 0.5},             - histereza domyślnego wyjścia (MARGINES_WYJSCIA)
+#    "min_czas": 0, "min_czas_wyjscia": 0}  - ile sekund warunek musi trwać
+#
+# Bez "wyjscie" reguła kończy się, gdy dowolny warunek wejścia przestaje
+# być spełniony z zapasem marginesu pola - np. suche powietrze (punkt rosy
+# < 0 i temp < 5) gaśnie przy punkcie rosy >= 0.5 albo temp >= 5.5.
+#
+# Samotest z lokalnymi zaślepkami SMTP i webhook:  python3 alarmy.py test
+
+import sys
+import json
+import time
+import queue
+import smtplib
+import threading
+import urllib.request
+from email.message import EmailMessage
+
+# Pola odczytu dostępne w regułach (kolejność = argumenty skompilowanej funkcji)
+POLA_REGUL = ('temp', 'punkt_rosy', 'trend', 'wiatr', 'wilgotnosc')
+OPERATORY = ('<', '<=', '>', '>=')
+_PRZECIWNY = {'<': '>=', '<=': '>', '>': '<=', '>=': '<'}
+# Histereza wyjścia wyprowadzanego z wejścia, w jednostkach pola
+MARGINES_WYJSCIA = {'temp': 0.5, 'punkt_rosy': 0.5, 'trend': 0.5, 'wiatr': 1.0, 'wilgotnosc': 5.0}
+
+# Domyślne reguły - odpowiednik dawnej funkcji ocena_ryzyka_przymrozku()
+# (próg bezwzględny, suche powietrze, gwałtowny spadek); wyjście z każdej
+# to negacja wejścia z marginesem (0.5 °C, 0.5 °C/h)
+DOMYSLNE_REGULY = [
+    {"nazwa": "prog_bezwzgledny",
+     "wejscie": {"temp": {"<=": 2.0}}},
+    {"nazwa": "suche_powietrze",
+     "wejscie": {"punkt_rosy": {"<": 0.0}, "temp": {"<": 5.0}}},
+    {"nazwa": "gwaltowny_spadek",
+     "wejscie": {"temp": {"<=": 3.5}, "trend": {"<=": -1.5}}},
+]
+
+# Powiadomienia
+ROZMIAR_KOLEJKI_POWIADOMIEN = 256
+LIMIT_POWIADOMIEN_NA_MINUTE = 6
+
+
+def _sprawdz(pole, op, nazwa):
+    if pole not in POLA_REGUL:
+        raise ValueError(f"Regula {nazwa}: nieznane pole {pole}")
+    if op not in OPERATORY:
+        raise ValueError(f"Regula {nazwa}: nieznany operator {op}")
+
+
+def _kompiluj_warunki(warunki, nazwa):
+    """
+    Zamienia {"temp": {"<=": 2.0}, ...} na funkcję f(temp, punkt_rosy, ...) -> bool.
+    Lista takich słowników to alternatywa - wystarczy jeden spełniony.
+    """
+    grupy = []
+    for grupa in warunki if isinstance(warunki, list) else [warunki]:
+        czesci = []
+        for pole, progi in grupa.items():
+            for op, prog in progi.items():
+                _sprawdz(pole, op, nazwa)
+                # float() - do kodu trafiają tylko liczby, nigdy tekst z pliku
+                czesci.append(f"({pole} is not None and {pole} {op} {float(prog)!r})")
+        if not czesci:
+            raise ValueError(f"Regula {nazwa}: brak warunkow")
+        grupy.append("(" + " and ".join(czesci) + ")")
+    if not grupy:
+        raise ValueError(f"Regula {nazwa}: brak warunkow")
+    zrodlo = f"lambda {', '.join(POLA_REGUL)}: " + " or ".join(grupy)
+    return eval(compile(zrodlo, f"<regula {nazwa}>", "eval"), {})
+
+
+def wyjscie_z_wejscia(wejscie, nazwa, margines=None):
+    """
+    Warunki wyjścia jako negacja wejścia z marginesem: lista jednowarunkowych
+    alternatyw, po jednej na każdy warunek wejścia (wystarczy, że jeden ustąpi).
+    """
+    if isinstance(wejscie, list):
+        raise ValueError(f"Regula {nazwa}: wejscie z alternatywa wymaga jawnego wyjscia")
+    marginesy = {**MARGINES_WYJSCIA, **(margines or {})}
+    wyjscie = []
+    for pole, progi in wejscie.items():
+        for op, prog in progi.items():
+            _sprawdz(pole, op, nazwa)
+            m = float(marginesy.get(pole, 0.0))
+            wyjscie.append({pole: {_PRZECIWNY[op]: float(prog) + (m if op in ('<', '<=') else -m)}})
+    return wyjscie
+
+
+class Regula:
+    __slots__ = ('nazwa', 'wejscie', 'wyjscie', 'min_czas', 'min_czas_wyjscia')
+
+    def __init__(self, opis):
+        self.nazwa = opis['nazwa']
+        self.wejscie = _kompiluj_warunki(opis['wejscie'], self.nazwa)
+        wyjscie = opis.get('wyjscie') or wyjscie_z_wejscia(opis['wejscie'], self.nazwa, opis.get('margines'))
+        self.wyjscie = _kompiluj_warunki(wyjscie, self.nazwa)
+        self.min_czas = float(opis.get('min_czas', 0))
+        self.min_czas_wyjscia = float(opis.get('min_czas_wyjscia', 0))
+
+
+def _scal_reguly(domyslne, nadpisania):
+    """Reguły stacji = domyślne z podmienionymi polami (po nazwie) + nowe reguły"""
+    wynik = []
+    nadpisania = {r['nazwa']: r for r in nadpisania}
+    for regula in domyslne:
+        wynik.append({**regula, **nadpisania.pop(regula['nazwa'], {})})
+    wynik.extend(nadpisania.values())
+    return wynik
+
+
+class _StanReguly:
+    __slots__ = ('aktywna', 'od')
+
+    def __init__(self):
+        self.aktywna = False
+        self.od = None     # od kiedy trwa warunek zmiany stanu
+
+
+class SilnikAlarmow:
+    """
+    Ocena reguł przyrostowo dla każdego odczytu. Alarm stacji = dowolna
+    aktywna reguła. Zmiany stanu (wejście/wyjście z alarmu) trafiają do
+    kolejki powiadomień, jeśli została podana.
+    """
+    def __init__(self, konfiguracja=None, powiadomienia=None):
+        konfiguracja = konfiguracja or {}
+        domyslne = konfiguracja.get('reguly', DOMYSLNE_REGULY)
+        self._domyslne = [Regula(r) for r in domyslne]
+        self._per_stacja = {
+            stacja: [Regula(r) for r in _scal_reguly(domyslne, nadpisania)]
+            for stacja, nadpisania in konfiguracja.get('stacje', {}).items()
+        }
+        self.stany = {}
+        self.powiadomienia = powiadomienia
+
+    @classmethod
+    def z_pliku(cls, sciezka, powiadomienia=True):
+        """
+        Silnik z pliku JSON {"reguly": [...], "stacje": {...}, "powiadomienia": {...}}.
+        Brak pliku = reguły domyślne bez powiadomień. powiadomienia=False
+        pomija sekcję powiadomień (ponowne przetwarzanie archiwum).
+        """
+        try:
+            with open(sciezka, encoding='utf-8') as f:
+                konfiguracja = json.load(f)
+        except FileNotFoundError:
+            konfiguracja = {}
+        kolejka = None
+        if powiadomienia and konfiguracja.get('powiadomienia'):
+            kolejka = KolejkaPowiadomien.z_konfiguracji(konfiguracja['powiadomienia'])
+        return cls(konfiguracja, kolejka)
+
+    def ocen(self, station_id, czas, temp=None, punkt_rosy=None, trend=None,
+             wiatr=None, wilgotnosc=None):
+        """Zwraca 1 gdy stacja jest w stanie alarmu, 0 w przeciwnym razie"""
+        reguly = self._per_stacja.get(station_id, self._domyslne)
+        stany = self.stany.get(station_id)
+        if stany is None:
+            stany = self.stany[station_id] = [_StanReguly() for _ in reguly]
+        odczyt = (temp, punkt_rosy, trend, wiatr, wilgotnosc)
+
+        alarm_przed = any(s.aktywna for s in stany)
+        for regula, stan in zip(reguly, stany):
+            if stan.aktywna:
+                zmiana, min_czas = regula.wyjscie(*odczyt), regula.min_czas_wyjscia
+            else:
+                zmiana, min_czas = regula.wejscie(*odczyt), regula.min_czas
+            if not zmiana:
+                stan.od = None
+                continue
+            if stan.od is None:
+                stan.od = czas
+            if czas - stan.od >= min_czas:
+                stan.aktywna = not stan.aktywna
+                stan.od = None
+
+        alarm = any(s.aktywna for s in stany)
+        if alarm != alarm_przed and self.powiadomienia is not None:
+            self.powiadomienia.zglos({
+                'station_id': station_id,
+                'alarm': int(alarm),
+                'reguly': [r.nazwa for r, s in zip(reguly, stany) if s.aktywna],
+                'temp': temp,
+                'punkt_rosy': punkt_rosy,
+                'trend': trend,
+                'timestamp': czas,
+            })
+        return int(alarm)
+
+    def stan_do_zapisu(self):
+        """Histereza reguł jako {stacja: {reguła: [aktywna, od]}} - do migawki odbiornika"""
+        wynik = {}
+        for station_id, stany in list(self.stany.items()):
+            reguly = self._per_stacja.get(station_id, self._domyslne)
+            wynik[station_id] = {r.nazwa: [s.aktywna, s.od] for r, s in zip(reguly, stany)}
+        return wynik
+
+    def przywroc_stan(self, zapis):
+        """
+        Odwrotność stan_do_zapisu(). Reguły dopasowane po nazwie - reguła
+        dodana od czasu zapisu startuje nieaktywna, usunięta jest pomijana.
+        """
+        for station_id, reguly_stacji in zapis.items():
+            stany = []
+            for regula in self._per_stacja.get(station_id, self._domyslne):
+                stan = _StanReguly()
+                stan.aktywna, stan.od = reguly_stacji.get(regula.nazwa, (False, None))
+                stany.append(stan)
+            self.stany[station_id] = stany
+
+
+# === POWIADOMIENIA ===
+
+def tekst_powiadomienia(zdarzenie):
+    if zdarzenie['alarm']:
+        return (f"ALARM przymrozkowy - stacja {zdarzenie['station_id']}: "
+                f"T={zdarzenie['temp']} C, punkt rosy={zdarzenie['punkt_rosy']} C, "
+                f"trend={zdarzenie['trend']} C/h (reguly: {', '.join(zdarzenie['reguly'])})")
+    return f"Koniec alarmu przymrozkowego - stacja {zdarzenie['station_id']}: T={zdarzenie['temp']} C"
+
+
+class UjscieWebhook:
+    """POST JSON ze zdarzeniem pod podany adres"""
+    def __init__(self, url, limit_czasu=5.0):
+        self.url = url
+        self.limit_czasu = limit_czasu
+
+    def wyslij(self, zdarzenie):
+        dane = json.dumps({**zdarzenie, 'tekst': tekst_powiadomienia(zdarzenie)}).encode('utf-8')
+        zadanie = urllib.request.Request(self.url, data=dane, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(zadanie, timeout=self.limit_czasu):
+            pass
+
+
+class UjscieSMTP:
+    """E-mail przez serwer SMTP"""
+    def __init__(self, host, port, nadawca, odbiorcy, login=None, haslo=None, limit_czasu=10.0):
+        self.host = host
+        self.port = port
+        self.nadawca = nadawca
+        self.odbiorcy = odbiorcy
+        self.login = login
+        self.haslo = haslo
+        self.limit_czasu = limit_czasu
+
+    def wyslij(self, zdarzenie):
+        wiadomosc = EmailMessage()
+        wiadomosc['Subject'] = tekst_powiadomienia(zdarzenie).split(':')[0]
+        wiadomosc['From'] = self.nadawca
+        wiadomosc['To'] = ', '.join(self.odbiorcy)
+        wiadomosc.set_content(tekst_powiadomienia(zdarzenie))
+        with smtplib.SMTP(self.host, self.port, timeout=self.limit_czasu) as smtp:
+            if self.login:
+                smtp.starttls()
+                smtp.login(self.login, self.haslo)
+            smtp.send_message(wiadomosc)
+
+
+class KolejkaPowiadomien:
+    """
+    Asynchroniczna kolejka powiadomień z wątkiem wysyłającym.
+    zglos() nigdy nie blokuje pętli radia - przy pełnej kolejce najstarsze
+    zdarzenie jest odrzucane. Limit (token bucket) chroni przed zalaniem
+    skrzynki przy migotaniu alarmu na wielu stacjach naraz.
+    """
+    def __init__(self, ujscia, limit_na_minute=LIMIT_POWIADOMIEN_NA_MINUTE,
+                 rozmiar=ROZMIAR_KOLEJKI_POWIADOMIEN):
+        self.ujscia = list(ujscia)
+        self.limit_na_minute = limit_na_minute
+        self._kolejka = queue.Queue(maxsize=rozmiar)
+        self._zetony = float(limit_na_minute)
+        self._ostatnie_uzupelnienie = time.monotonic()
+        self.wyslane = 0
+        self.odrzucone = 0
+        self.bledy = 0
+        self._watek = threading.Thread(target=self._petla, name="powiadomienia", daemon=True)
+        self._watek.start()
+
+    @classmethod
+    def z_konfiguracji(cls, konfiguracja):
+        ujscia = [UjscieWebhook(url) for url in konfiguracja.get('webhook', [])]
+        smtp = konfiguracja.get('smtp')
+        if smtp:
+            ujscia.append(UjscieSMTP(smtp['host'], smtp.get('port', 25), smtp['nadawca'],
+                                     smtp['odbiorcy'], smtp.get('login'), smtp.get('haslo')))
+        return cls(ujscia, konfiguracja.get('limit_na_minute', LIMIT_POWIADOMIEN_NA_MINUTE))
+
+    def zglos(self, zdarzenie):
+        while True:
+            try:
+                self._kolejka.put_nowait(zdarzenie)
+                return
+            except queue.Full:
+                try:
+                    self._kolejka.get_nowait()
+                    self.odrzucone += 1
+                except queue.Empty:
+                    pass
+
+    def _czekaj_na_zeton(self):
+        while True:
+            teraz = time.monotonic()
+            self._zetony = min(float(self.limit_na_minute),
+                               self._zetony + (teraz - self._ostatnie_uzupelnienie) * self.limit_na_minute / 60.0)
+            self._ostatnie_uzupelnienie = teraz
+            if self._zetony >= 1.0:
+                self._zetony -= 1.0
+                return
+            time.sleep((1.0 - self._zetony) * 60.0 / self.limit_na_minute)
+
+    def _petla(self):
+        while True:
+            zdarzenie = self._kolejka.get()
+            if zdarzenie is None:
+                break
+            self._czekaj_na_zeton()
+            for ujscie in self.ujscia:
+                try:
+                    ujscie.wyslij(zdarzenie)
+                    self.wyslane += 1
+                except Exception as e:
+                    self.bledy += 1
+                    print(f"Blad powiadomienia {type(ujscie).__name__}: {e}")
+            self._kolejka.task_done()
+
+    def oproznij(self, limit_czasu=10.0):
+        """Czeka aż kolejka zostanie wysłana (testy, zamykanie programu)"""
+        koniec = time.monotonic() + limit_czasu
+        while self._kolejka.unfinished_tasks and time.monotonic() < koniec:
+            time.sleep(0.05)
+
+
+# === SAMOTEST Z LOKALNYMI ZAŚLEPKAMI ===
+
+def _samotest():
+    import socketserver
+    import http.server
+
+    odebrane_http = []
+    odebrane_smtp = []
+
+    class ZaslepkaWebhook(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            odebrane_http.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    class ZaslepkaSMTP(socketserver.StreamRequestHandler):
+        # Minimalny dialog SMTP - wystarczający dla smtplib.send_message()
+        def handle(self):
+            self.wfile.write(b"220 zaslepka\r\n")
+            dane = False
+            tresc = []
+            for linia in self.rfile:
+                if dane:
+                    if linia == b".\r\n":
+                        odebrane_smtp.append(b"".join(tresc).decode('utf-8', errors='replace'))
+                        dane = False
+                        self.wfile.write(b"250 OK\r\n")
+                    else:
+                        tresc.append(linia)
+                    continue
+                komenda = linia[:4].upper()
+                if komenda == b"DATA":
+                    dane = True
+                    tresc = []
+                    self.wfile.write(b"354 dalej\r\n")
+                elif komenda == b"QUIT":
+                    self.wfile.write(b"221 bye\r\n")
+                    return
+                else:
+                    self.wfile.write(b"250 OK\r\n")
+
+    http_serwer = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ZaslepkaWebhook)
+    smtp_serwer = socketserver.ThreadingTCPServer(('127.0.0.1', 0), ZaslepkaSMTP)
+    for serwer in (http_serwer, smtp_serwer):
+        threading.Thread(target=serwer.serve_forever, daemon=True).start()
+
+    powiadomienia = KolejkaPowiadomien([
+        UjscieWebhook(f"http://127.0.0.1:{http_serwer.server_address[1]}/alarm"),
+        UjscieSMTP('127.0.0.1', smtp_serwer.server_address[1], 'stacja@sad', ['sadownik@sad']),
+    ], limit_na_minute=600)
+    silnik = SilnikAlarmow({
+        'stacje': {'02': [{'nazwa': 'prog_bezwzgledny', 'wejscie': {'temp': {'<=': 3.0}},
+                           'wyjscie': {'temp': {'>': 3.5}}, 'min_czas': 600}]}
+    }, powiadomienia)
+
+    # Stacja 01: domyślne reguły, temperatura spada i wraca - histereza 0.5 °C
+    przebieg = [4.0, 2.5, 1.9, 2.2, 2.4, 2.6, 3.0]
+    wyniki = [silnik.ocen('01', i * 300, temp=t) for i, t in enumerate(przebieg)]
+    print(f"01 temp {przebieg} -> alarm {wyniki}")
+    assert wyniki == [0, 0, 1, 1, 1, 0, 0]
+
+    # Stacja 03: suche powietrze i gwałtowny spadek gasną, gdy ustąpi ich własna
+    # przyczyna (punkt rosy, trend), a nie dopiero przy cieplejszym powietrzu
+    przebieg = [(4.0, -1.0, 0.0), (4.0, 0.3, 0.0), (4.0, 2.0, 0.5),
+                (3.0, 2.0, -2.0), (3.5, 2.0, -1.2), (3.9, 2.0, 1.0)]
+    wyniki = [silnik.ocen('03', 3000 + i * 300, temp=t, punkt_rosy=r, trend=tr)
+              for i, (t, r, tr) in enumerate(przebieg)]
+    print(f"03 (temp, punkt rosy, trend) {przebieg} -> alarm {wyniki}")
+    assert wyniki == [1, 1, 0, 1, 1, 0]
+    assert _kompiluj_warunki([{'temp': {'>': 5.0}}, {'trend': {'>': 0.0}}], 'x')(4.0, None, 0.1, None, None)
+
+    # Stacja 02: próg 3.0 z minimalnym czasem 10 min
+    wyniki = [silnik.ocen('02', i * 300, temp=2.8) for i in range(4)]
+    print(f"02 temp 2.8 co 5 min -> alarm {wyniki}")
+    assert wyniki == [0, 0, 1, 1]
+
+    powiadomienia.oproznij()
+    print(f"Webhook: {len(odebrane_http)} zdarzen, SMTP: {len(odebrane_smtp)} wiadomosci")
+    assert len(odebrane_http) == 7 and len(odebrane_smtp) == 7
+
+    # Koszt oceny przy setkach stacji
+    silnik = SilnikAlarmow()
+    stacje = [f"{i:04d}" for i in range(500)]
+    n = 0
+    start = time.perf_counter()
+    for krok in range(100):
+        for s in stacje:
+            silnik.ocen(s, krok * 300, temp=3.0 + (krok % 7) * 0.3, punkt_rosy=-1.0, trend=-0.5)
+            n += 1
+    czas = time.perf_counter() - start
+    print(f"Ocena: {n} odczytow, {czas / n * 1e6:.1f} us/odczyt (500 stacji)")
+    http_serwer.shutdown()
+    smtp_serwer.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == 'test':
+        _samotest()
+    else:
+        print("Uzycie: python3 alarmy.py test")
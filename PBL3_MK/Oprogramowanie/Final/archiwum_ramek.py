@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# Archiwum surowych ramek LoRa odbiornika. Każda odebrana ramka (także z błędem
+# CRC) jest dopisywana do dziennego pliku segmentu razem z czasem odbioru,
+# RSSI i SNR, a mały indeks SQLite (stacja, czas) -> (segment, przesunięcie)
+# pozwala szybko wybrać zakres. Po poprawce parsera lub logiki alarmów
+# historia może być odtworzona z archiwum:
+#
+#   python3 archiwum_ramek.py przetworz --od 2024-10-01 --do 2024-10-15 --magazyn historia.db
+#
+# Przetwarzanie idzie przez przetworz_ramke() z odbiornik_v7.py (ta sama logika
+# co na żywo), równolegle w puli procesów - jedna stacja w jednym procesie,
+# bo trend i histereza alarmu zależą od kolejności odczytów stacji.
+# Najlepiej uruchamiać przy zatrzymanym serwerze WWW (trzyma historię w pamięci).
+
+import os
+import time
+import struct
+import sqlite3
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+KATALOG_ARCHIWUM = "archiwum_ramek"
+
+# Rekord: znacznik, czas odbioru, RSSI [0.1 dBm], SNR [0.1 dB], flagi, długość | bajty ramki
+REKORD = struct.Struct('<BdhhBH')
+ZNACZNIK_REKORDU = 0xA5
+BRAK_POMIARU = -32768
+FLAGA_CRC_OK = 0x01
+
+Ramka = namedtuple('Ramka', 'czas stacja rssi snr crc_ok dane')
+
+_SCHEMAT = """
+CREATE TABLE IF NOT EXISTS ramki (
+    czas        REAL NOT NULL,
+    stacja      TEXT NOT NULL,
+    segment     TEXT NOT NULL,
+    przesuniecie INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ramki_stacja_czas ON ramki (stacja, czas);
+CREATE INDEX IF NOT EXISTS ramki_czas ON ramki (czas);
+"""
+
+
+def _na_calkowite(wartosc):
+    return BRAK_POMIARU if wartosc is None else int(round(wartosc * 10))
+
+
+def _z_calkowitych(wartosc):
+    return None if wartosc == BRAK_POMIARU else wartosc / 10.0
+
+
+def id_stacji(dane):
+    """ID stacji z początku ramki (także uszkodzonej), '??' gdy nieczytelne"""
+    try:
+        stacja = dane[:2].decode('ascii')
+    except UnicodeDecodeError:
+        return '??'
+    return stacja if len(stacja) == 2 and stacja.isprintable() else '??'
+
+
+class ArchiwumRamek:
+    """
+    Archiwum tylko do dopisywania. Segmenty to pliki ramki-RRRRMMDD.bin
+    (czas UTC), indeks można w każdej chwili odbudować z segmentów.
+    """
+    def __init__(self, katalog=KATALOG_ARCHIWUM):
+        self.katalog = katalog
+        os.makedirs(katalog, exist_ok=True)
+        self._blokada = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(katalog, 'indeks.db'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMAT)
+        self._segment = None
+        self._plik = None
+
+    def _plik_segmentu(self, czas):
+        segment = time.strftime('ramki-%Y%m%d.bin', time.gmtime(czas))
+        if segment != self._segment:
+            if self._plik is not None:
+                self._plik.close()
+            self._plik = open(os.path.join(self.katalog, segment), 'ab')
+            self._segment = segment
+        return self._plik
+
+    def dopisz(self, czas, dane, rssi=None, snr=None, crc_ok=True):
+        stacja = id_stacji(dane)
+        with self._blokada:
+            plik = self._plik_segmentu(czas)
+            przesuniecie = plik.tell()
+            plik.write(REKORD.pack(ZNACZNIK_REKORDU, czas, _na_calkowite(rssi), _na_calkowite(snr),
+                                   FLAGA_CRC_OK if crc_ok else 0, len(dane)) + dane)
+            plik.flush()
+            self._db.execute("INSERT INTO ramki (czas, stacja, segment, przesuniecie) VALUES (?, ?, ?, ?)",
+                             (czas, stacja, self._segment, przesuniecie))
+            self._db.commit()
+
+    @staticmethod
+    def _czytaj_rekord(plik):
+        naglowek = plik.read(REKORD.size)
+        if len(naglowek) < REKORD.size:
+            return None
+        znacznik, czas, rssi, snr, flagi, dlugosc = REKORD.unpack(naglowek)
+        if znacznik != ZNACZNIK_REKORDU:
+            raise ValueError(f"uszkodzony rekord w {plik.name} @ {plik.tell() - REKORD.size}")
+        dane = plik.read(dlugosc)
+        if len(dane) < dlugosc:
+            return None  # urwany ostatni rekord (awaria zasilania)
+        return Ramka(czas, id_stacji(dane), _z_calkowitych(rssi), _z_calkowitych(snr),
+                     bool(flagi & FLAGA_CRC_OK), dane)
+
+    def ramki(self, od_ts, do_ts, stacja=None):
+        """Ramki z zakresu czasu (opcjonalnie jednej stacji) w kolejności odbioru"""
+        zapytanie = "SELECT segment, przesuniecie FROM ramki WHERE czas BETWEEN ? AND ?"
+        parametry = [od_ts, do_ts]
+        if stacja is not None:
+            zapytanie += " AND stacja = ?"
+            parametry.append(stacja)
+        with self._blokada:
+            if self._plik is not None:
+                self._plik.flush()
+            pozycje = self._db.execute(zapytanie + " ORDER BY czas", parametry).fetchall()
+        pliki = {}
+        try:
+            for segment, przesuniecie in pozycje:
+                plik = pliki.get(segment)
+                if plik is None:
+                    plik = pliki[segment] = open(os.path.join(self.katalog, segment), 'rb')
+                plik.seek(przesuniecie)
+                ramka = self._czytaj_rekord(plik)
+                if ramka is not None:
+                    yield ramka
+        finally:
+            for plik in pliki.values():
+                plik.close()
+
+    def stacje(self, od_ts, do_ts):
+        with self._blokada:
+            return [w[0] for w in self._db.execute(
+                "SELECT DISTINCT stacja FROM ramki WHERE czas BETWEEN ? AND ?", (od_ts, do_ts))]
+
+    def przebuduj_indeks(self):
+        """Odbudowuje indeks z plików segmentów (np. po skopiowaniu samych .bin)"""
+        with self._blokada:
+            self._db.execute("DELETE FROM ramki")
+            for segment in sorted(n for n in os.listdir(self.katalog) if n.startswith('ramki-')):
+                with open(os.path.join(self.katalog, segment), 'rb') as plik:
+                    while True:
+                        przesuniecie = plik.tell()
+                        ramka = self._czytaj_rekord(plik)
+                        if ramka is None:
+                            break
+                        self._db.execute("INSERT INTO ramki (czas, stacja, segment, przesuniecie) "
+                                         "VALUES (?, ?, ?, ?)", (ramka.czas, ramka.stacja, segment, przesuniecie))
+            self._db.commit()
+            return self._db.execute("SELECT COUNT(*) FROM ramki").fetchone()[0]
+
+    def zamknij(self):
+        with self._blokada:
+            if self._plik is not None:
+                self._plik.close()
+                self._plik = None
+                self._segment = None
+            self._db.close()
+
+
+# === PONOWNE PRZETWARZANIE ===
+
+def _przetworz_stacje(katalog, stacja, od_ts, do_ts, plik_alarmow):
+    """
+    Praca procesu: wszystkie poprawne ramki stacji przez bieżący potok
+    odbiornika. Zwraca (pokrycie, wiersze): pokrycie to (od, do) znaczników
+    czasu, jakie nadałby odbiornik pierwszej i ostatniej poprawnej ramce
+    (None gdy ich brak), a wiersze to historia [(ts, t1, t2, hu, wi, fa)]
+    - bez powiadomień, bez MQTT.
+    """
+    import odbiornik_v7 as odbiornik
+    from magazyn import DOKLADNOSC_CZASU
+
+    silnik = odbiornik.SilnikAlarmow.z_pliku(plik_alarmow, powiadomienia=False)
+    archiwum = ArchiwumRamek(katalog)
+    pokrycie = None
+    wyniki = []
+    try:
+        for ramka in archiwum.ramki(od_ts, do_ts, stacja):
+            if not ramka.crc_ok:
+                continue
+            # Ten sam znacznik czasu co na żywo (obsluz_ramke w odbiorniku)
+            unix_time = int(ramka.czas)
+            pokrycie = (pokrycie[0] if pokrycie else unix_time, unix_time)
+            pomiar = odbiornik.przetworz_ramke(ramka.dane, unix_time, silnik)
+            if pomiar:
+                wiersz = pomiar.wiersz_historii()
+                wyniki.append((round(wiersz[0], DOKLADNOSC_CZASU),) + wiersz[1:])
+    finally:
+        archiwum.zamknij()
+    return pokrycie, wyniki
+
+
+def przetworz(katalog, od_ts, do_ts, sciezka_magazynu, plik_alarmow, procesy=None, stacje=None):
+    """Przelicza zakres archiwum i podmienia odpowiadające odczyty w magazynie"""
+    from magazyn import MagazynHistorii
+    from stacje import STATION_ID_TO_INDEX
+
+    archiwum = ArchiwumRamek(katalog)
+    stacje = stacje or [s for s in archiwum.stacje(od_ts, do_ts) if s in STATION_ID_TO_INDEX]
+    archiwum.zamknij()
+    magazyn = MagazynHistorii(sciezka_magazynu)
+    start = time.perf_counter()
+    razem = 0
+    with ProcessPoolExecutor(max_workers=procesy) as pula:
+        zadania = {stacja: pula.submit(_przetworz_stacje, katalog, stacja, od_ts, do_ts, plik_alarmow)
+                   for stacja in stacje}
+        for stacja, zadanie in zadania.items():
+            pokrycie, wiersze = zadanie.result()
+            if pokrycie is None:
+                print(f"Stacja {stacja}: brak poprawnych ramek w archiwum, historia bez zmian")
+                continue
+            # Podmieniany jest tylko zakres pokryty archiwum - odczyty spoza
+            # niego (np. sprzed włączenia archiwum) zostają w magazynie
+            usuniete = magazyn.zastap_zakres(STATION_ID_TO_INDEX[stacja], *pokrycie, wiersze)
+            alarmy = sum(w[5] for w in wiersze)
+            print(f"Stacja {stacja}: {len(wiersze)} odczytow (zastapiono {usuniete}), alarmow {alarmy}")
+            razem += len(wiersze)
+    magazyn.zamknij()
+    czas = time.perf_counter() - start
+    print(f"Przetworzono {razem} ramek w {czas:.1f} s ({razem / czas if czas else 0:.0f} ramek/s)")
+
+
+def _czas(tekst):
+    """Unix ts albo data RRRR-MM-DD[ GG:MM] (czas lokalny)"""
+    try:
+        return float(tekst)
+    except ValueError:
+        pass
+    for format_ in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(tekst, format_))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"nieprawidlowy czas: {tekst}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiwum surowych ramek LoRa")
+    parser.add_argument('--archiwum', default=KATALOG_ARCHIWUM)
+    polecenia = parser.add_subparsers(dest='polecenie', required=True)
+
+    p = polecenia.add_parser('przetworz', help="przelicz zakres i podmien historie w magazynie")
+    p.add_argument('--od', type=_czas, default=0.0)
+    p.add_argument('--do', type=_czas, default=float('inf'))
+    p.add_argument('--stacja', action='append', help="ID stacji (domyslnie wszystkie)")
+    p.add_argument('--magazyn', default='historia.db')
+    p.add_argument('--alarmy', default='alarmy.json')
+    p.add_argument('--procesy', type=int, default=None)
+
+    p = polecenia.add_parser('lista', help="wypisz ramki z zakresu")
+    p.add_argument('--od', type=_czas, default=0.0)
+    p.add_argument('--do', type=_czas, default=float('inf'))
+    p.add_argument('--stacja', default=None)
+
+    polecenia.add_parser('indeks', help="odbuduj indeks z plikow segmentow")
+
+    args = parser.parse_args()
+    if args.polecenie == 'przetworz':
+        przetworz(args.archiwum, args.od, args.do, args.magazyn, args.alarmy, args.procesy, args.stacja)
+    elif args.polecenie == 'lista':
+        archiwum = ArchiwumRamek(args.archiwum)
+        for r in archiwum.ramki(args.od, args.do, args.stacja):
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r.czas))} {r.stacja} "
+                  f"RSSI={r.rssi} SNR={r.snr} CRC={'OK' if r.crc_ok else 'BLAD'} {r.dane!r}")
+        archiwum.zamknij()
+    elif args.polecenie == 'indeks':
+        archiwum = ArchiwumRamek(args.archiwum)
+        print(f"Indeks: {archiwum.przebuduj_indeks()} ramek")
+        archiwum.zamknij()
+
+
+if __name__ == "__main__":
+    main()
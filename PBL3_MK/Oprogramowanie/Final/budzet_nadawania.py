@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# Budżet czasu nadawania stacji (duty cycle EU 868 MHz). Każda ramka kosztuje
+# swój czas nadawania (planer_lora.czas_nadawania), a wiadro żetonów pilnuje,
+# żeby w żadnej godzinie stacja nie przekroczyła limitu podpasma:
+#   pojemność = UDZIAL_SERII * limit * 3600 s, napełnianie = (1 - UDZIAL_SERII) * limit,
+# czyli seria + napełnianie przez godzinę = dokładnie limit * 3600 s.
+#
+# Ramki mają priorytety - alarm > zaległe (ponowienie nieudanej wysyłki)
+# > okresowe. Niższy priorytet musi zostawić w wiadrze rezerwę dla wyższych.
+# Gdy budżetu brakuje, ramka czeka w kolejce. Nowsza ramka alarmowa lub
+# okresowa zastępuje czekającą tego samego priorytetu (niesie świeższe
+# statystyki okna), a zaległych trzymamy najwyżej MAKS_ZALEGLYCH -
+# najstarsze są odrzucane.
+#
+#   python3 budzet_nadawania.py test    - SF12/125 kHz, ramka co 30 s, limit 1%
+
+import sys
+import time
+from collections import deque
+
+from planer_lora import czas_nadawania, limit_wypelnienia
+from ramka import CZESTOTLIWOSC, SF, BW, CR
+
+ALARM = 0
+ZALEGLE = 1
+OKRESOWA = 2
+NAZWY_PRIORYTETOW = ("alarm", "zalegle", "okresowa")
+
+OKRES_LIMITU = 3600.0     # [s] okres obserwacji limitu wypełnienia (ETSI EN 300 220)
+UDZIAL_SERII = 0.25       # część godzinnego budżetu dostępna od razu (seria)
+# Ułamek pojemności wiadra, który musi zostać po nadaniu ramki danego priorytetu
+REZERWA = (0.0, 0.3, 0.5)
+MAKS_ZALEGLYCH = 6
+
+
+class WiadroCzasuNadawania:
+    """Wiadro żetonów w sekundach czasu nadawania"""
+    def __init__(self, limit, teraz=None, udzial_serii=UDZIAL_SERII, okres=OKRES_LIMITU):
+        self.pojemnosc = udzial_serii * limit * okres
+        self.napelnianie = (1.0 - udzial_serii) * limit
+        self.zetony = self.pojemnosc
+        self._czas = time.monotonic() if teraz is None else teraz
+
+    def dostepne(self, teraz):
+        self.zetony = min(self.pojemnosc, self.zetony + (teraz - self._czas) * self.napelnianie)
+        self._czas = teraz
+        return self.zetony
+
+    def czy_mozna(self, czas, teraz, rezerwa=0.0):
+        return self.dostepne(teraz) - czas >= rezerwa * self.pojemnosc
+
+    def pobierz(self, czas, teraz):
+        self.dostepne(teraz)
+        self.zetony -= czas
+
+
+class KolejkaNadawania:
+    """
+    Ramki czekające na nadanie z kosztem liczonym z długości ramki i
+    parametrów radia. wyslij_gotowe() nadaje wszystko, na co pozwala budżet,
+    od najwyższego priorytetu.
+    """
+    def __init__(self, sf=SF, bw=BW, cr=CR, czestotliwosc=CZESTOTLIWOSC, limit=None,
+                 teraz=None, maks_zaleglych=MAKS_ZALEGLYCH):
+        self.sf, self.bw, self.cr = sf, bw, cr
+        self.limit = limit_wypelnienia(czestotliwosc, bw)[0] if limit is None else limit
+        self.wiadro = WiadroCzasuNadawania(self.limit, teraz)
+        self.kolejki = (deque(maxlen=1), deque(maxlen=maks_zaleglych), deque(maxlen=1))
+        self.wyslane = [0, 0, 0]
+        self.scalone = [0, 0, 0]
+        self.odrzucone = [0, 0, 0]
+        self.czas_nadawania = 0.0
+
+    def koszt(self, ramka):
+        return czas_nadawania(len(ramka), self.sf, self.bw, self.cr)
+
+    def dodaj(self, ramka, priorytet=OKRESOWA):
+        kolejka = self.kolejki[priorytet]
+        if len(kolejka) == kolejka.maxlen:
+            # Alarm i okresowa: nowsza zastępuje czekającą, zaległe: najstarsza wypada
+            if priorytet == ZALEGLE:
+                self.odrzucone[priorytet] += 1
+            else:
+                self.scalone[priorytet] += 1
+        kolejka.append(ramka)
+
+    def czekajace(self):
+        return sum(len(k) for k in self.kolejki)
+
+    def wyslij_gotowe(self, wyslij, teraz=None):
+        """
+        Nadaje ramki funkcją wyslij(ramka) -> bool, dopóki pozwala budżet.
+        Nieudana wysyłka wraca do kolejki (okresowa jako zaległa) - czas
+        anteny i tak został zużyty - i kończy wywołanie: ponowna próba
+        dopiero w następnym, żeby awaria radia nie przepaliła całego budżetu.
+        Zwraca liczbę prób nadania.
+        """
+        nadane = 0
+        while True:
+            teraz_ = time.monotonic() if teraz is None else teraz
+            for priorytet, kolejka in enumerate(self.kolejki):
+                if kolejka and self.wiadro.czy_mozna(self.koszt(kolejka[0]), teraz_, REZERWA[priorytet]):
+                    break
+            else:
+                return nadane
+            ramka = kolejka.popleft()
+            koszt = self.koszt(ramka)
+            self.wiadro.pobierz(koszt, teraz_)
+            self.czas_nadawania += koszt
+            nadane += 1
+            if wyslij(ramka):
+                self.wyslane[priorytet] += 1
+            else:
+                self.dodaj(ramka, min(priorytet, ZALEGLE))
+                return nadane
+
+    def statystyki(self):
+        return {
+            'limit': self.limit,
+            'budzet_s': round(self.wiadro.zetony, 3),
+            'czas_nadawania_s': round(self.czas_nadawania, 3),
+            'czekajace': {n: len(k) for n, k in zip(NAZWY_PRIORYTETOW, self.kolejki)},
+            'wyslane': dict(zip(NAZWY_PRIORYTETOW, self.wyslane)),
+            'scalone': dict(zip(NAZWY_PRIORYTETOW, self.scalone)),
+            'odrzucone': dict(zip(NAZWY_PRIORYTETOW, self.odrzucone)),
+        }
+
+
+def _test():
+    from ramka import koduj_ramke
+
+    # SF12/125 kHz: ramka 73 B to ~3.25 s anteny, przy limicie 1% mieści się ~11 ramek/h
+    kolejka = KolejkaNadawania(sf=12, bw=125000, limit=0.01, teraz=0.0)
+    koszt = kolejka.koszt(koduj_ramke("01", 1.0, 2.0, 80.0, 10, 3.0))
+    nadania = []
+
+    def wyslij(ramka):
+        nadania.append((t, ramka[0:1]))
+        return True
+
+    # Doba, ramka okresowa co 30 s, w 3. godzinie alarm co 30 s przez 10 minut
+    for krok in range(24 * 120):
+        t = krok * 30.0
+        kolejka.dodaj(b"O" * 73, OKRESOWA)
+        if 2 * 3600 <= t < 2 * 3600 + 600:
+            kolejka.dodaj(b"A" * 73, ALARM)
+        kolejka.wyslij_gotowe(wyslij, t)
+
+    # Dowolne okno godzinne (start co 30 s) nie przekracza limitu
+    czasy = [n[0] for n in nadania]
+    najwiecej = max(sum(1 for c in czasy if s <= c < s + OKRES_LIMITU) for s in range(0, 23 * 3600, 30))
+    print(f"ramka {koszt:.2f} s, {len(nadania)} nadan/dobe, maks. {najwiecej} w godzinie "
+          f"({najwiecej * koszt:.1f} s z {0.01 * OKRES_LIMITU:.0f} s)")
+    print(kolejka.statystyki())
+    assert najwiecej * koszt <= 0.01 * OKRES_LIMITU + 1e-9
+    # Alarm wychodzi od razu, a póki czeka, żadna ramka okresowa go nie wyprzedza
+    alarmy = [c for c, r in nadania if r == b"A"]
+    assert alarmy[0] == 2 * 3600 and kolejka.scalone[ALARM] > 0, alarmy
+    assert not [c for c, r in nadania if r == b"O" and alarmy[0] <= c <= alarmy[-1]]
+    assert kolejka.scalone[OKRESOWA] > 0 and kolejka.wyslane[OKRESOWA] > 100
+
+    # Nieudana wysyłka wraca jako zaległa i kończy wywołanie - ponowna
+    # próba w następnym, przed nową okresową
+    kolejka = KolejkaNadawania(limit=0.01, teraz=0.0)
+    wyniki = iter([False, True, True])
+    kolejka.dodaj(b"X" * 73, OKRESOWA)
+    assert kolejka.wyslij_gotowe(lambda r: next(wyniki), 0.0) == 1
+    assert kolejka.wyslane == [0, 0, 0] and len(kolejka.kolejki[ZALEGLE]) == 1
+    kolejka.dodaj(b"Y" * 73, OKRESOWA)
+    wyslane = []
+    assert kolejka.wyslij_gotowe(lambda r: wyslane.append(r) or next(wyniki), 30.0) == 2
+    assert wyslane == [b"X" * 73, b"Y" * 73] and kolejka.wyslane == [0, 1, 1] and kolejka.czekajace() == 0
+    print("OK")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        _test()
+    else:
+        print("Uzycie: python3 budzet_nadawania.py test")
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Decymacja szeregów czasowych algorytmem Largest-Triangle-Three-Buckets (LTTB).
+# Długie zakresy (cały sezon) są redukowane do liczby punktów, którą wykres
+# faktycznie narysuje, z zachowaniem kształtu krzywej (minima nocne zostają).
+
+import threading
+from collections import OrderedDict
+
+
+def lttb(xs, ys, prog):
+    """
+    Zwraca indeksy punktów wybranych przez LTTB (rosnąco).
+    Pierwszy i ostatni punkt są zawsze zachowane.
+    """
+    n = len(xs)
+    if prog >= n or prog < 3:
+        return list(range(n))
+
+    wybrane = [0]
+    krok = (n - 2) / (prog - 2)
+    a = 0
+    for i in range(prog - 2):
+        # Średnia z następnego kubełka - trzeci wierzchołek trójkąta
+        sr_start = int((i + 1) * krok) + 1
+        sr_koniec = min(int((i + 2) * krok) + 1, n)
+        dl = sr_koniec - sr_start
+        sr_x = sum(xs[sr_start:sr_koniec]) / dl
+        sr_y = sum(ys[sr_start:sr_koniec]) / dl
+
+        # Punkt bieżącego kubełka tworzący największy trójkąt
+        start = int(i * krok) + 1
+        koniec = int((i + 1) * krok) + 1
+        ax, ay = xs[a], ys[a]
+        max_pole = -1.0
+        max_i = start
+        for j in range(start, koniec):
+            pole = abs((ax - sr_x) * (ys[j] - ay) - (ax - xs[j]) * (sr_y - ay))
+            if pole > max_pole:
+                max_pole = pole
+                max_i = j
+        wybrane.append(max_i)
+        a = max_i
+
+    wybrane.append(n - 1)
+    return wybrane
+
+
+def decymuj(xs, ys, prog, wymuszone=()):
+    """
+    Decymacja z punktami wymuszonymi (np. chwile alarmu przymrozkowego).
+    Wymuszone indeksy są zawsze w wyniku, więc przy wielu alarmach wynik
+    może być dłuższy niż prog. Zwraca (xs, ys).
+    """
+    wymuszone = set(wymuszone)
+    indeksy = set(lttb(xs, ys, max(3, prog - len(wymuszone))))
+    indeksy.update(wymuszone)
+    indeksy = sorted(indeksy)
+    return [xs[i] for i in indeksy], [ys[i] for i in indeksy]
+
+
+class CacheDecymacji:
+    """Ograniczony cache LRU wyników decymacji"""
+    def __init__(self, rozmiar=64):
+        self.rozmiar = rozmiar
+        self._wpisy = OrderedDict()
+        self._blokada = threading.Lock()
+
+    def __len__(self):
+        return len(self._wpisy)
+
+    def pobierz(self, klucz):
+        with self._blokada:
+            wynik = self._wpisy.get(klucz)
+            if wynik is not None:
+                self._wpisy.move_to_end(klucz)
+            return wynik
+
+    def zapisz(self, klucz, wynik):
+        with self._blokada:
+            self._wpisy[klucz] = wynik
+            self._wpisy.move_to_end(klucz)
+            while len(self._wpisy) > self.rozmiar:
+                self._wpisy.popitem(last=False)
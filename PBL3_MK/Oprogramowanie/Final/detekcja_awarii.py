@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+
+# Wykrywanie awarii czujników w strumieniu ramek. Parser przyjmuje każdą
+# wartość pasującą do formatu, więc zamarznięty DS18B20 albo BME280
+# zawieszony na 100 % wilgotności trafiałby prosto do reguł alarmu.
+# Każdy detektor to kilka liczb na stację i koszt O(1) na odczyt:
+#
+#   zakres        - wartość poza zakresem pomiarowym czujnika
+#   zamrozony     - ta sama wartość dłużej niż CZAS_ZAMROZENIA
+#   skok          - zmiana szybsza niż MAKS_ZMIANA względem ostatniej dobrej wartości
+#   rozbieznosc   - różnica DS18B20 - BME280 odbiega od swojej linii bazowej
+#                   (EWMA średniej i wariancji) o więcej niż PROG_ODCHYLEN sigm
+#   odstajaca     - temperatura stacji odbiega od średniej pozostałych stacji
+#                   bardziej niż zwykle (linia bazowa EWMA tej różnicy)
+#
+# Wartości z awarią zakresu, zamrożenia lub skoku są wykluczane z wyboru
+# temperatury, punktu rosy i alarmów (wybierz_temperature_do_analizy
+# przechodzi wtedy na drugi czujnik). Rozbieżność i stacja odstająca są
+# tylko flagowane - przymrozek bywa bardzo lokalny, a odrzucenie
+# prawdziwego zimnego odczytu byłoby gorsze niż fałszywy alarm.
+#
+# Początek i koniec każdej awarii to zdarzenie (słownik JSON) - odbiornik
+# publikuje je na MQTT (lora/awarie), serwer WWW pokazuje w /api/stations/faults.
+# Stan detektorów i aktywne awarie wchodzą do migawki ciepłego restartu
+# (stan_odbiornika.py) - po restarcie awaria trwa dalej i dostaje swój koniec.
+#
+#   python3 detekcja_awarii.py test
+
+import sys
+import math
+import threading
+from collections import deque, namedtuple
+
+from ramka import INTERWAL_WYSYLANIA
+
+TEMAT_AWARII = "lora/awarie"
+
+# Kanały czujników: temperatura DS18B20, temperatura i wilgotność BME280
+KANALY = ('ds', 'bme', 'wilg')
+ZAKRES = {'ds': (-55.0, 125.0), 'bme': (-40.0, 85.0), 'wilg': (0.0, 100.0)}
+# Czasy liczone w ramkach stacji (INTERWAL_WYSYLANIA, średnie z okna),
+# żeby zmiana interwału w ramka.py nie rozstroiła detektorów.
+# [s] - średnia z 5 min w spokojną noc potrafi się powtórzyć kilka razy,
+# a wilgotność 100 % przy mgle trwa godzinami
+CZAS_ZAMROZENIA = {'ds': 12 * INTERWAL_WYSYLANIA, 'bme': 12 * INTERWAL_WYSYLANIA,
+                   'wilg': max(3 * 3600.0, 12 * INTERWAL_WYSYLANIA)}
+# [jednostka/min] i najmniejszy skok uznawany za awarię (szum i zaokrąglenia)
+MAKS_ZMIANA = {'ds': 1.0, 'bme': 1.0, 'wilg': 10.0}
+MIN_SKOK = {'ds': 2.0, 'bme': 2.0, 'wilg': 15.0}
+# Po takiej przerwie ostatnia dobra wartość nie jest punktem odniesienia skoku
+MAKS_PRZERWA = 6 * INTERWAL_WYSYLANIA      # [s]
+
+# Linia bazowa pamięta ~2 h niezależnie od interwału (24 ramki co 5 min)
+HORYZONT_EWMA = 2 * 3600.0                 # [s]
+WAGA_EWMA = min(1.0, INTERWAL_WYSYLANIA / HORYZONT_EWMA)
+# Odczyt odstający wpływa na linię bazową słabiej - trwała zmiana
+# (np. noc radiacyjna) zostaje w końcu przyjęta jako nowa norma
+WAGA_EWMA_FLAGOWANEGO = WAGA_EWMA / 4
+# Pierwsza ocena po ~1 h odczytów, ale nie z mniej niż 8 - wariancja z kilku
+# punktów jest za mało pewna
+ROZGRZEWKA = max(8, round(3600.0 / INTERWAL_WYSYLANIA))
+PROG_ODCHYLEN = 4.0
+MIN_ROZBIEZNOSC = 3.0     # [°C]
+MIN_ODSTAWANIE = 4.0      # [°C]
+MIN_SASIADOW = 3
+# Sąsiad liczy się do średniej sieci przez 3 interwały - jedna zgubiona
+# ramka go nie usuwa
+MAKS_WIEK_SASIADA = 3 * INTERWAL_WYSYLANIA  # [s]
+
+MAKS_ZDARZEN = 500
+
+Ocena = namedtuple('Ocena', 'temp_ds temp_bme wilgotnosc flagi')
+
+
+class LiniaBazowa:
+    """
+    EWMA średniej i wariancji. Odczyt daleko od średniej zmienia ją słabiej,
+    a do wariancji wchodzi przycięty - inaczej dryf czujnika rozdmuchałby
+    wariancję i sam by się zamaskował.
+    """
+    __slots__ = ('srednia', 'wariancja', 'n')
+
+    def __init__(self):
+        self.srednia = 0.0
+        self.wariancja = 0.0
+        self.n = 0
+
+    def ocen(self, x, minimum):
+        """Aktualizuje linię bazową, zwraca True gdy x odstaje o więcej niż PROG_ODCHYLEN sigm (i minimum)"""
+        if self.n == 0:
+            self.srednia = x
+            self.n = 1
+            return False
+        prog = max(PROG_ODCHYLEN * math.sqrt(self.wariancja), minimum)
+        d = x - self.srednia
+        rozgrzewka = self.n < ROZGRZEWKA
+        odstaje = not rozgrzewka and abs(d) > prog
+        if rozgrzewka:
+            # Średnia z pierwszych odczytów, potem EWMA
+            waga = max(WAGA_EWMA, 1.0 / (self.n + 1))
+        elif abs(d) > prog / 2:
+            waga = WAGA_EWMA_FLAGOWANEGO
+            d = math.copysign(prog / 2, d)
+        else:
+            waga = WAGA_EWMA
+        self.srednia += waga * d
+        self.wariancja = (1 - waga) * (self.wariancja + waga * d * d)
+        self.n += 1
+        return odstaje
+
+
+class _Kanal:
+    __slots__ = ('wartosc', 'od_kiedy', 'dobra', 'czas_dobrej')
+
+    def __init__(self):
+        self.wartosc = None
+        self.od_kiedy = None
+        self.dobra = None
+        self.czas_dobrej = None
+
+
+class _Stacja:
+    __slots__ = ('kanaly', 'roznica', 'przestrzen', 'aktywne')
+
+    def __init__(self):
+        self.kanaly = {k: _Kanal() for k in KANALY}
+        self.roznica = LiniaBazowa()
+        self.przestrzen = LiniaBazowa()
+        # (czujnik, rodzaj) -> zdarzenie początku
+        self.aktywne = {}
+
+
+class _Siec:
+    """Suma ostatnich temperatur stacji - średnia pozostałych w O(1), stare wpisy wygasają"""
+    def __init__(self, maks_wiek=MAKS_WIEK_SASIADA):
+        self.maks_wiek = maks_wiek
+        self.wartosci = {}
+        self.suma = 0.0
+        self._kolejka = deque()
+
+    def _wygas(self, czas):
+        while self._kolejka and self._kolejka[0][0] < czas - self.maks_wiek:
+            c, stacja = self._kolejka.popleft()
+            wpis = self.wartosci.get(stacja)
+            if wpis is not None and wpis[1] == c:
+                self.suma -= wpis[0]
+                del self.wartosci[stacja]
+
+    def dodaj(self, stacja, czas, temp):
+        """Zapisuje temperaturę stacji, zwraca (średnia pozostałych, ich liczba)"""
+        self._wygas(czas)
+        poprzedni = self.wartosci.get(stacja)
+        if poprzedni is not None:
+            self.suma -= poprzedni[0]
+        self.wartosci[stacja] = (temp, czas)
+        self.suma += temp
+        self._kolejka.append((czas, stacja))
+        inne = len(self.wartosci) - 1
+        return ((self.suma - temp) / inne if inne else None), inne
+
+
+class RejestrAwarii:
+    """Ostatnie zdarzenia i aktywne awarie - po stronie odbiornika i serwera WWW"""
+    def __init__(self, maks_zdarzen=MAKS_ZDARZEN):
+        self.zdarzenia = deque(maxlen=maks_zdarzen)
+        self.aktywne = {}
+        self._blokada = threading.Lock()
+
+    def dodaj(self, zdarzenie):
+        klucz = (zdarzenie['stacja'], zdarzenie['czujnik'], zdarzenie['rodzaj'])
+        with self._blokada:
+            self.zdarzenia.append(zdarzenie)
+            if zdarzenie['koniec']:
+                self.aktywne.pop(klucz, None)
+            else:
+                self.aktywne[klucz] = zdarzenie
+
+    def migawka(self, stacja=None):
+        with self._blokada:
+            zdarzenia = [z for z in reversed(self.zdarzenia) if stacja is None or z['stacja'] == stacja]
+            aktywne = [z for z in self.aktywne.values() if stacja is None or z['stacja'] == stacja]
+        return {'aktywne': sorted(aktywne, key=lambda z: z['czas']), 'zdarzenia': zdarzenia}
+
+
+class DetektorAwarii:
+    """
+    ocen() dla surowych wartości ramki, potem przestrzennie() dla wybranej
+    temperatury. Zdarzenia trafiają do self.rejestr i do sluchacz(zdarzenie).
+    """
+    def __init__(self, sluchacz=None):
+        self.sluchacz = sluchacz
+        self.stacje = {}
+        self.siec = _Siec()
+        self.rejestr = RejestrAwarii()
+        self.wykluczone = 0
+        self.oflagowane = 0
+
+    def _zglos(self, stan, stacja, czas, czujnik, rodzaj, awaria, wartosc):
+        klucz = (czujnik, rodzaj)
+        if awaria == (klucz in stan.aktywne):
+            return
+        zdarzenie = {'czas': czas, 'stacja': stacja, 'czujnik': czujnik, 'rodzaj': rodzaj,
+                     'koniec': not awaria, 'wartosc': wartosc}
+        if awaria:
+            stan.aktywne[klucz] = zdarzenie
+        else:
+            del stan.aktywne[klucz]
+        self.rejestr.dodaj(zdarzenie)
+        if self.sluchacz is not None:
+            try:
+                self.sluchacz(zdarzenie)
+            except Exception as e:
+                print(f"Detekcja awarii: blad sluchacza {e}")
+
+    def _kanal(self, stan, stacja, czas, czujnik, x):
+        """Wartość kanału albo None, jeśli awaria ją wyklucza"""
+        if x is None:
+            return None
+        k = stan.kanaly[czujnik]
+        dol, gora = ZAKRES[czujnik]
+        poza_zakresem = not dol <= x <= gora
+
+        if x != k.wartosc:
+            k.wartosc, k.od_kiedy = x, czas
+        zamrozony = czas - k.od_kiedy >= CZAS_ZAMROZENIA[czujnik]
+
+        skok = False
+        if not poza_zakresem and k.dobra is not None and czas - k.czas_dobrej <= MAKS_PRZERWA:
+            dozwolona = max(MIN_SKOK[czujnik], MAKS_ZMIANA[czujnik] * (czas - k.czas_dobrej) / 60.0)
+            skok = abs(x - k.dobra) > dozwolona
+
+        self._zglos(stan, stacja, czas, czujnik, 'zakres', poza_zakresem, x)
+        self._zglos(stan, stacja, czas, czujnik, 'zamrozony', zamrozony, x)
+        self._zglos(stan, stacja, czas, czujnik, 'skok', skok, x)
+        if poza_zakresem or zamrozony or skok:
+            self.wykluczone += 1
+            return None
+        k.dobra, k.czas_dobrej = x, czas
+        return x
+
+    def ocen(self, stacja, czas, temp_ds=None, temp_bme=None, wilgotnosc=None):
+        """-> Ocena(temp_ds, temp_bme, wilgotnosc, flagi) - wartości wykluczone jako None"""
+        stan = self.stacje.get(stacja)
+        if stan is None:
+            stan = self.stacje[stacja] = _Stacja()
+        ds = self._kanal(stan, stacja, czas, 'ds', temp_ds)
+        bme = self._kanal(stan, stacja, czas, 'bme', temp_bme)
+        wilg = self._kanal(stan, stacja, czas, 'wilg', wilgotnosc)
+
+        if ds is not None and bme is not None:
+            r = ds - bme
+            rozbiezne = stan.roznica.ocen(r, MIN_ROZBIEZNOSC)
+            self._zglos(stan, stacja, czas, 'ds-bme', 'rozbieznosc', rozbiezne, round(r, 2))
+            if rozbiezne:
+                self.oflagowane += 1
+        return Ocena(ds, bme, wilg, self.flagi(stacja))
+
+    def przestrzennie(self, stacja, czas, temp):
+        """Porównanie wybranej temperatury stacji z pozostałymi stacjami, zwraca True gdy odstaje"""
+        if temp is None:
+            return False
+        stan = self.stacje.get(stacja)
+        if stan is None:
+            stan = self.stacje[stacja] = _Stacja()
+        srednia, sasiedzi = self.siec.dodaj(stacja, czas, temp)
+        if sasiedzi < MIN_SASIADOW:
+            return False
+        d = temp - srednia
+        odstaje = stan.przestrzen.ocen(d, MIN_ODSTAWANIE)
+        self._zglos(stan, stacja, czas, 'stacja', 'odstajaca', odstaje, round(d, 2))
+        if odstaje:
+            self.oflagowane += 1
+        return odstaje
+
+    def stan_do_zapisu(self):
+        """Stan stacji i sieci jako słownik JSON - do migawki odbiornika"""
+        return {
+            'stacje': {stacja: {
+                'kanaly': {k: [c.wartosc, c.od_kiedy, c.dobra, c.czas_dobrej] for k, c in stan.kanaly.items()},
+                'roznica': [stan.roznica.srednia, stan.roznica.wariancja, stan.roznica.n],
+                'przestrzen': [stan.przestrzen.srednia, stan.przestrzen.wariancja, stan.przestrzen.n],
+                'aktywne': list(stan.aktywne.values()),
+            } for stacja, stan in list(self.stacje.items())},
+            'siec': {stacja: list(wpis) for stacja, wpis in list(self.siec.wartosci.items())},
+        }
+
+    def przywroc_stan(self, zapis):
+        """
+        Odwrotność stan_do_zapisu(). Aktywne awarie wracają bez ponownego
+        zgłoszenia początku - koniec zostanie zgłoszony jak przed restartem.
+        """
+        for stacja, opis in zapis.get('stacje', {}).items():
+            stan = self.stacje[stacja] = _Stacja()
+            for czujnik, (wartosc, od_kiedy, dobra, czas_dobrej) in opis['kanaly'].items():
+                if czujnik in stan.kanaly:
+                    k = stan.kanaly[czujnik]
+                    k.wartosc, k.od_kiedy, k.dobra, k.czas_dobrej = wartosc, od_kiedy, dobra, czas_dobrej
+            stan.roznica.srednia, stan.roznica.wariancja, stan.roznica.n = opis['roznica']
+            stan.przestrzen.srednia, stan.przestrzen.wariancja, stan.przestrzen.n = opis['przestrzen']
+            for zdarzenie in opis['aktywne']:
+                stan.aktywne[(zdarzenie['czujnik'], zdarzenie['rodzaj'])] = zdarzenie
+                self.rejestr.dodaj(zdarzenie)
+        # W kolejności czasu - wygasanie starych wpisów działa jak na żywo
+        for stacja, (temp, czas) in sorted(zapis.get('siec', {}).items(), key=lambda w: w[1][1]):
+            self.siec.dodaj(stacja, czas, temp)
+
+    def flagi(self, stacja):
+        stan = self.stacje.get(stacja)
+        return sorted(f"{c}:{r}" for c, r in stan.aktywne) if stan is not None else []
+
+    def statystyki(self):
+        return {'stacje': len(self.stacje), 'aktywne': len(self.rejestr.aktywne),
+                'wykluczone': self.wykluczone, 'oflagowane': self.oflagowane}
+
+
+def _samotest():
+    import random
+    import time
+
+    los = random.Random(5)
+    zdarzenia = []
+    detektor = DetektorAwarii(zdarzenia.append)
+    stacje = [f"{i:02d}" for i in range(1, 9)]
+    t0 = 1_700_000_000.0
+
+    def noc(krok, stacja):
+        # Wspólny spadek nocny, mikroklimat stacji i szum
+        baza = 6.0 - krok * 0.04 + int(stacja) * 0.2 + los.gauss(0, 0.1)
+        return round(baza, 2), round(baza + 0.5 + los.gauss(0, 0.1), 2), round(85 + los.gauss(0, 1), 1)
+
+    wyniki = {}
+    ramki = round(12 * 3600 / INTERWAL_WYSYLANIA)
+    for krok in range(ramki):   # 12 h nocy w rytmie ramek stacji
+        czas = t0 + INTERWAL_WYSYLANIA * krok
+        for stacja in stacje:
+            ds, bme, wilg = noc(krok, stacja)
+            if stacja == "02" and krok >= 40:
+                ds = 4.81                       # zamarznięty DS18B20
+            if stacja == "03" and krok == 60:
+                bme = 25.0                      # pojedynczy skok BME280
+            if stacja == "04" and krok >= ramki - 32:
+                wilg = 100.0                    # wilgotność zawieszona na 100 % (niecałe 3 h)
+            if stacja == "05" and krok >= 80:
+                ds += (krok - 80) * 0.15        # DS18B20 powoli rozjeżdża się z BME280
+            if stacja == "06" and krok >= 120:
+                ds -= 9.0                       # cała stacja odstaje (oba czujniki)
+                bme -= 9.0
+            if stacja == "07" and krok == 30:
+                wilg = 180.0
+            ocena = detektor.ocen(stacja, czas, ds, bme, wilg)
+            detektor.przestrzennie(stacja, czas, ocena.temp_ds if ocena.temp_ds is not None else ocena.temp_bme)
+            wyniki[(stacja, krok)] = ocena
+
+    poczatki = {(z['stacja'], z['czujnik'], z['rodzaj']) for z in zdarzenia if not z['koniec']}
+    print(sorted(poczatki))
+    print(detektor.statystyki())
+    # Zamrożony DS: wykluczony po 12 ramkach, wybór przechodzi na BME280
+    assert ('02', 'ds', 'zamrozony') in poczatki
+    assert wyniki[('02', 40 + 12)].temp_ds is None and wyniki[('02', 40 + 11)].temp_ds == 4.81
+    # Skok - tylko ten jeden odczyt, następny znów dobry
+    assert wyniki[('03', 60)].temp_bme is None and wyniki[('03', 61)].temp_bme is not None
+    assert ('04', 'wilg', 'zamrozony') not in poczatki     # < 3 h przy 100 % to jeszcze nie awaria
+    # Powolny dryf to nie skok - tylko flaga, wartość zostaje w analizie
+    assert ('05', 'ds-bme', 'rozbieznosc') in poczatki and ('05', 'ds', 'skok') not in poczatki
+    assert wyniki[('05', 130)].temp_ds is not None and 'ds-bme:rozbieznosc' in wyniki[('05', 130)].flagi
+    assert ('06', 'stacja', 'odstajaca') in poczatki
+    assert ('07', 'wilg', 'zakres') in poczatki and wyniki[('07', 30)].wilgotnosc is None
+    # Zdrowe stacje bez żadnych zdarzeń
+    assert not [p for p in poczatki if p[0] in ('01', '08')], poczatki
+    assert detektor.rejestr.migawka('07')['aktywne'] == []
+    assert [z['rodzaj'] for z in detektor.rejestr.migawka('02')['aktywne']] == ['zamrozony']
+
+    # Restart ze stanem z migawki (przez JSON): awaria trwa i dostaje koniec,
+    # linie bazowe bez ponownej rozgrzewki
+    import json
+    po_restarcie = []
+    nowy = DetektorAwarii(po_restarcie.append)
+    nowy.przywroc_stan(json.loads(json.dumps(detektor.stan_do_zapisu())))
+    assert nowy.stan_do_zapisu() == json.loads(json.dumps(detektor.stan_do_zapisu()))
+    assert nowy.flagi('02') == detektor.flagi('02') and nowy.rejestr.migawka('02')['aktywne']
+    czas = t0 + INTERWAL_WYSYLANIA * ramki
+    ocena = nowy.ocen('02', czas, *noc(ramki, '02'))
+    assert ocena.temp_ds is not None and ocena.flagi == []
+    assert [(z['rodzaj'], z['koniec']) for z in po_restarcie] == [('zamrozony', True)]
+    assert nowy.stacje['01'].roznica.n >= ROZGRZEWKA
+
+    # Koszt na odczyt nie rośnie z liczbą stacji
+    duzy = DetektorAwarii()
+    n = 20000
+    start = time.perf_counter()
+    for i in range(n):
+        stacja = str(i % 4000)
+        ocena = duzy.ocen(stacja, t0 + i * 0.01, 5.0 + (i % 7) * 0.1, 5.5, 80.0 + i % 3)
+        duzy.przestrzennie(stacja, t0 + i * 0.01, ocena.temp_ds)
+    print(f"{n} odczytow z 4000 stacji: {(time.perf_counter() - start) / n * 1e6:.1f} us/odczyt")
+    print("OK")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        _samotest()
+    else:
+        print("Uzycie: python3 detekcja_awarii.py test")
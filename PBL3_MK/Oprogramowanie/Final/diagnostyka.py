@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+# Diagnostyka działającego procesu (odbiornik, serwer WWW) bez restartu.
+# Włączana opcją --diagnostyka: lokalny serwer HTTP tylko na 127.0.0.1
+# oraz zrzut stosów wszystkich wątków na stderr po sygnale SIGUSR1.
+# Wyłączona nic nie kosztuje - żaden wątek ani hak nie jest instalowany.
+#
+#   curl localhost:5001/stosy                   stosy wątków (i greenletów eventlet)
+#   curl 'localhost:5001/profil?sekundy=10'     próbkujący profiler, najczęstsze funkcje
+#   curl localhost:5001/pamiec/start            włącza tracemalloc
+#   curl localhost:5001/pamiec/migawka          największe miejsca alokacji
+#   curl localhost:5001/pamiec/roznica          przyrost od poprzedniej migawki
+#   curl localhost:5001/pamiec/stop
+#   curl localhost:5001/liczniki                rozmiary struktur zgłoszonych przez program
+
+import gc
+import os
+import sys
+import json
+import signal
+import threading
+import traceback
+import tracemalloc
+import faulthandler
+import http.server
+import urllib.parse
+from collections import Counter
+
+MAKS_CZAS_PROFILU = 120.0
+ODSWIEZANIE_GREENLETOW = 1.0  # [s] jak często profiler szuka nowych greenletów (gc.get_objects)
+KLATKI_TRACEMALLOC = 10
+
+
+def _oryginalne(modul):
+    """Moduł sprzed monkey patchingu eventlet (prawdziwe wątki i sleep)"""
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+        return patcher.original(modul)
+    return __import__(modul)
+
+
+def _opis_klatki(klatka):
+    kod = klatka.f_code
+    return f"{kod.co_filename}:{kod.co_firstlineno} {kod.co_name}"
+
+
+def _greenlety():
+    """Greenlety eventlet (bez eventlet pusta lista)"""
+    if 'greenlet' not in sys.modules:
+        return []
+    import greenlet
+    return [g for g in gc.get_objects() if isinstance(g, greenlet.greenlet)]
+
+
+def _w_eventlet():
+    """Czy wątki są zielone - wtedy zwykłe czekanie na wątek blokuje cały hub"""
+    if 'eventlet' not in sys.modules:
+        return False
+    from eventlet import patcher
+    return patcher.is_monkey_patched('thread')
+
+
+def stosy():
+    """Tekst ze stosami wszystkich wątków, a w trybie eventlet także greenletów"""
+    nazwy = {w.ident: w.name for w in threading.enumerate()}
+    linie = []
+    for ident, klatka in sys._current_frames().items():
+        linie.append(f"--- watek {nazwy.get(ident, '?')} ({ident}) ---")
+        linie.extend(l.rstrip() for l in traceback.format_stack(klatka))
+    for obiekt in _greenlety():
+        if obiekt.gr_frame is not None:
+            linie.append(f"--- greenlet {obiekt!r} ---")
+            linie.extend(l.rstrip() for l in traceback.format_stack(obiekt.gr_frame))
+    return '\n'.join(linie) + '\n'
+
+
+def profiluj(sekundy, interwal=0.005, top=30):
+    """
+    Próbkujący profiler: co `interwal` s zapisuje stosy wszystkich wątków
+    i uśpionych greenletów (działający jest na stosie swojego wątku).
+    Koszt ponosi tylko wątek próbkujący i tylko przez `sekundy`.
+    Zwraca tekst: funkcje najczęściej na szczycie stosu (własny czas, per
+    wątek) i najczęściej gdziekolwiek na stosie (czas łączny, suma wątków).
+    """
+    czas = _oryginalne('time')
+    wlasne = Counter()
+    laczne = Counter()
+    probki = 0
+    watki = _oryginalne('threading')
+
+    def zlicz(nazwa, klatka):
+        # Nazwa w kluczu - czekające wątki (select, get) nie mylą się z pracującymi
+        wlasne[f"[{nazwa}] {_opis_klatki(klatka)}"] += 1
+        widziane = set()
+        while klatka is not None:
+            opis = _opis_klatki(klatka)
+            if opis not in widziane:
+                widziane.add(opis)
+                laczne[opis] += 1
+            klatka = klatka.f_back
+
+    def petla():
+        nonlocal probki
+        wlasny = watki.get_ident()
+        koniec = czas.monotonic() + sekundy
+        greenlety, odswiezenie = [], 0.0
+        while czas.monotonic() < koniec:
+            nazwy = {w.ident: w.name for w in threading.enumerate()}
+            for ident, klatka in sys._current_frames().items():
+                if ident != wlasny:
+                    zlicz(nazwy.get(ident, ident), klatka)
+            # Lista greenletów odświeżana rzadziej - gc.get_objects() jest drogie
+            if czas.monotonic() >= odswiezenie:
+                greenlety = _greenlety()
+                odswiezenie = czas.monotonic() + ODSWIEZANIE_GREENLETOW
+            for obiekt in greenlety:
+                klatka = obiekt.gr_frame
+                if klatka is not None:
+                    zlicz("greenlet", klatka)
+            probki += 1
+            czas.sleep(interwal)
+
+    watek = watki.Thread(target=petla, name="diagnostyka_profil", daemon=True)
+    watek.start()
+    if _w_eventlet():
+        # Żądanie obsługuje greenlet - join() na prawdziwym wątku wstrzymałby
+        # hub (i cały serwer) na czas profilowania
+        import eventlet
+        while watek.is_alive():
+            eventlet.sleep(0.1)
+    else:
+        watek.join()
+
+    linie = [f"Probek: {probki} co {interwal * 1000:.1f} ms przez {sekundy:.1f} s", "",
+             "Czas wlasny (szczyt stosu):"]
+    for opis, n in wlasne.most_common(top):
+        linie.append(f"{100.0 * n / max(probki, 1):6.1f}%  {opis}")
+    linie += ["", "Czas laczny (gdziekolwiek na stosie):"]
+    for opis, n in laczne.most_common(top):
+        linie.append(f"{100.0 * n / max(probki, 1):6.1f}%  {opis}")
+    return '\n'.join(linie) + '\n'
+
+
+class _Pamiec:
+    """Migawki tracemalloc i różnice między kolejnymi migawkami"""
+    def __init__(self):
+        self._blokada = threading.Lock()
+        self._poprzednia = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(KLATKI_TRACEMALLOC)
+        return "tracemalloc wlaczony\n"
+
+    def stop(self):
+        with self._blokada:
+            self._poprzednia = None
+        tracemalloc.stop()
+        return "tracemalloc wylaczony\n"
+
+    def _migawka(self):
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def migawka(self, top=25):
+        migawka = self._migawka()
+        if migawka is None:
+            return "tracemalloc wylaczony - najpierw /pamiec/start\n"
+        with self._blokada:
+            self._poprzednia = migawka
+        statystyki = migawka.statistics('lineno')
+        aktualna, szczyt = tracemalloc.get_traced_memory()
+        linie = [f"Sledzone: {aktualna / 1024:.0f} kB (szczyt {szczyt / 1024:.0f} kB)", ""]
+        linie += [str(s) for s in statystyki[:top]]
+        return '\n'.join(linie) + '\n'
+
+    def roznica(self, top=25):
+        migawka = self._migawka()
+        if migawka is None:
+            return "tracemalloc wylaczony - najpierw /pamiec/start\n"
+        with self._blokada:
+            poprzednia, self._poprzednia = self._poprzednia, migawka
+        if poprzednia is None:
+            return "Pierwsza migawka zapisana - wywolaj /pamiec/roznica ponownie pozniej\n"
+        roznice = migawka.compare_to(poprzednia, 'lineno')
+        return '\n'.join(str(r) for r in roznice[:top]) + '\n'
+
+
+class Diagnostyka:
+    """
+    Serwer diagnostyczny. `liczniki` to słownik nazwa -> funkcja bez
+    argumentów zwracająca liczbę lub słownik (np. rozmiar historii).
+    """
+    def __init__(self, port, liczniki=None):
+        self.port = port
+        self.liczniki = dict(liczniki or {})
+        self.pamiec = _Pamiec()
+        self._serwer = None
+
+    def rejestruj(self, nazwa, funkcja):
+        self.liczniki[nazwa] = funkcja
+
+    def odczytaj_liczniki(self):
+        wynik = {}
+        for nazwa, funkcja in self.liczniki.items():
+            try:
+                wynik[nazwa] = funkcja()
+            except Exception as e:
+                wynik[nazwa] = f"blad: {e}"
+        wynik['gc'] = {'obiekty': len(gc.get_objects()), 'pokolenia': gc.get_count()}
+        wynik['watki'] = threading.active_count()
+        return wynik
+
+    def obsluz(self, sciezka, parametry):
+        """(kod, typ, tekst) dla ścieżki żądania"""
+        if sciezka == '/stosy':
+            return 200, 'text/plain', stosy()
+        if sciezka == '/profil':
+            sekundy = min(float(parametry.get('sekundy', 10)), MAKS_CZAS_PROFILU)
+            interwal = max(float(parametry.get('interwal', 0.005)), 0.001)
+            return 200, 'text/plain', profiluj(sekundy, interwal, int(parametry.get('top', 30)))
+        if sciezka == '/pamiec/start':
+            return 200, 'text/plain', self.pamiec.start()
+        if sciezka == '/pamiec/stop':
+            return 200, 'text/plain', self.pamiec.stop()
+        if sciezka == '/pamiec/migawka':
+            return 200, 'text/plain', self.pamiec.migawka(int(parametry.get('top', 25)))
+        if sciezka == '/pamiec/roznica':
+            return 200, 'text/plain', self.pamiec.roznica(int(parametry.get('top', 25)))
+        if sciezka == '/liczniki':
+            return 200, 'application/json', json.dumps(self.odczytaj_liczniki(), indent=1, default=str) + '\n'
+        return 404, 'text/plain', "Sciezki: /stosy /profil?sekundy=N /pamiec/start|migawka|roznica|stop /liczniki\n"
+
+    def uruchom(self):
+        diagnostyka = self
+
+        class Obsluga(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                adres = urllib.parse.urlsplit(self.path)
+                parametry = dict(urllib.parse.parse_qsl(adres.query))
+                try:
+                    kod, typ, tekst = diagnostyka.obsluz(adres.path, parametry)
+                except Exception as e:
+                    kod, typ, tekst = 500, 'text/plain', f"{type(e).__name__}: {e}\n"
+                dane = tekst.encode('utf-8')
+                self.send_response(kod)
+                self.send_header('Content-Type', f"{typ}; charset=utf-8")
+                self.send_header('Content-Length', str(len(dane)))
+                self.end_headers()
+                self.wfile.write(dane)
+
+            def log_message(self, *args):
+                pass
+
+        # Tylko lokalnie - diagnostyka pokazuje kod i dane procesu
+        self._serwer = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), Obsluga)
+        threading.Thread(target=self._serwer.serve_forever, name="diagnostyka", daemon=True).start()
+        if hasattr(signal, 'SIGUSR1'):
+            faulthandler.register(signal.SIGUSR1, all_threads=True)
+        print(f"Diagnostyka: http://127.0.0.1:{self.port}/ (kill -USR1 {os.getpid()} - stosy na stderr)")
+        return self
+
+
+def z_argumentow(argumenty, port_domyslny, liczniki=None):
+    """
+    Diagnostyka gdy podano --diagnostyka [port], w przeciwnym razie None.
+    """
+    if '--diagnostyka' not in argumenty:
+        return None
+    i = argumenty.index('--diagnostyka')
+    port = port_domyslny
+    if i + 1 < len(argumenty) and argumenty[i + 1].isdigit():
+        port = int(argumenty[i + 1])
+    return Diagnostyka(port, liczniki).uruchom()
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+# Trwały dziennik wiadomości wychodzących MQTT odbiornika. Każdy odczyt jest
+# najpierw zapisywany do SQLite, a dopiero potem publikowany z QoS 1 przez
+# osobny wątek - wpis znika z dziennika po potwierdzeniu (PUBACK) brokera.
+# Restart Mosquitto, zerwane połączenie czy restart odbiornika kosztują
+# tylko opóźnienie: zaległe wpisy idą paczkami od najstarszych po powrocie
+# brokera. Pętla radia nigdy nie czeka na sieć (dopisz() to jeden INSERT).
+#
+# Dostarczanie "co najmniej raz" - po zerwaniu połączenia broker może dostać
+# wiadomość drugi raz (serwer WWW pomija odczyt nie nowszy niż ostatni stacji).
+#
+#   python3 dziennik_mqtt.py test    - samotest z udawanym brokerem
+
+import sys
+import time
+import sqlite3
+import threading
+from collections import deque
+
+PLIK_DZIENNIKA = "dziennik_mqtt.db"
+QOS = 1
+# paho: brak połączenia - wiadomość QoS 1 zostaje w kolejce klienta i wyjdzie po połączeniu
+MQTT_ERR_NO_CONN = 4
+OKNO_WYSYLANIA = 100          # wiadomości wysłanych i niepotwierdzonych naraz
+ROZMIAR_PACZKI = 500          # wpisów czytanych z dziennika jednym zapytaniem
+LIMIT_POTWIERDZENIA = 120.0   # [s] bez PUBACK - wysyłamy ponownie z dziennika
+MAKS_WPISOW = 500000          # powyżej najstarsze wpisy są usuwane (tygodnie odczytów)
+INTERWAL_PRZYCINANIA = 60.0   # [s] między sprawdzeniami rozmiaru dziennika
+OPOZNIENIE_MIN = 1            # [s] ponowne łączenie z brokerem - od 1 s ...
+OPOZNIENIE_MAX = 60           # ... podwajane do 60 s
+
+_SCHEMAT = """
+CREATE TABLE IF NOT EXISTS dziennik (
+    id    INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts    REAL NOT NULL,
+    temat TEXT NOT NULL,
+    dane  BLOB NOT NULL
+);
+"""
+
+
+class DziennikMQTT:
+    """
+    Ujście MQTT z dziennikiem na dysku. `klient` to paho Client (połączony
+    lub łączący się w tle). dopisz() zapisuje wiadomość i budzi wątek
+    wysyłający, statystyki() podaje głębokość i opóźnienie dziennika.
+    """
+    def __init__(self, klient, sciezka=PLIK_DZIENNIKA, okno=OKNO_WYSYLANIA,
+                 limit_potwierdzenia=LIMIT_POTWIERDZENIA, maks_wpisow=MAKS_WPISOW):
+        self.klient = klient
+        self.okno = okno
+        self.limit_potwierdzenia = limit_potwierdzenia
+        self.maks_wpisow = maks_wpisow
+        self._db = sqlite3.connect(sciezka, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMAT)
+        self._db.commit()
+        self._blokada = threading.Lock()
+        self._sygnal = threading.Event()
+        self._zatrzymaj = threading.Event()
+
+        self._w_locie = {}          # mid -> (id wpisu, czas wysłania)
+        self._potwierdzone = deque()  # mid z on_publish (wątek paho)
+        self._wyslane_do = 0        # największe id przekazane klientowi
+        self._polaczony = False
+        self.dopisane = 0
+        self.wyslane = 0
+        self.potwierdzone = 0
+        self.ponowione = 0
+        self.utracone = 0
+
+        klient.on_connect = self._on_connect
+        klient.on_disconnect = self._on_disconnect
+        klient.on_publish = self._on_publish
+        zalegle = self.glebokosc()
+        if zalegle:
+            print(f"Dziennik MQTT: {zalegle} zaleglych wiadomosci do wyslania")
+        self._watek = threading.Thread(target=self._petla, name="dziennik_mqtt", daemon=True)
+        self._watek.start()
+
+    # --- zapis (wątek radia) ---
+
+    def dopisz(self, temat, dane):
+        with self._blokada:
+            self._db.execute("INSERT INTO dziennik (ts, temat, dane) VALUES (?, ?, ?)",
+                             (time.time(), temat, dane))
+            self._db.commit()
+        self.dopisane += 1
+        self._sygnal.set()
+
+    # --- wywołania zwrotne paho (wątek sieciowy) ---
+
+    def _on_connect(self, klient, userdata, flags, rc, *args):
+        if rc == 0:
+            self._polaczony = True
+            zalegle = self.glebokosc()
+            print("MQTT polaczono z brokerem" + (f" - wysylanie {zalegle} zaleglych" if zalegle else ""))
+            self._sygnal.set()
+        else:
+            print(f"MQTT blad polaczenia: kod {rc}")
+
+    def _on_disconnect(self, klient, userdata, *args):
+        if self._polaczony:
+            print(f"MQTT rozlaczono - odczyty zostaja w dzienniku ({self.glebokosc()})")
+        self._polaczony = False
+
+    def _on_publish(self, klient, userdata, mid, *args):
+        self._potwierdzone.append(mid)
+        self._sygnal.set()
+
+    # --- wysyłanie (własny wątek) ---
+
+    def _usun_potwierdzone(self):
+        ids = []
+        while self._potwierdzone:
+            wpis = self._w_locie.pop(self._potwierdzone.popleft(), None)
+            if wpis is not None:
+                ids.append((wpis[0],))
+        if ids:
+            with self._blokada:
+                self._db.executemany("DELETE FROM dziennik WHERE id = ?", ids)
+                self._db.commit()
+            self.potwierdzone += len(ids)
+
+    def _ponow_przeterminowane(self):
+        """Brak PUBACK zbyt długo - zapominamy okno i wysyłamy od najstarszego wpisu"""
+        if not self._w_locie:
+            return
+        najstarszy = min(t for _, t in self._w_locie.values())
+        if time.monotonic() - najstarszy > self.limit_potwierdzenia:
+            self.ponowione += len(self._w_locie)
+            self._w_locie.clear()
+            self._wyslane_do = 0
+
+    def _przytnij(self):
+        with self._blokada:
+            nadmiar = self.glebokosc(blokada=False) - self.maks_wpisow
+            if nadmiar > 0:
+                self._db.execute("DELETE FROM dziennik WHERE id IN "
+                                 "(SELECT id FROM dziennik ORDER BY id LIMIT ?)", (nadmiar,))
+                self._db.commit()
+                self.utracone += nadmiar
+                print(f"Dziennik MQTT pelny - usunieto {nadmiar} najstarszych wiadomosci")
+
+    def _wyslij_paczke(self):
+        """Publikuje wpisy po _wyslane_do, dopóki jest miejsce w oknie"""
+        wolne = self.okno - len(self._w_locie)
+        if wolne <= 0:
+            return 0
+        with self._blokada:
+            wpisy = self._db.execute("SELECT id, temat, dane FROM dziennik WHERE id > ? ORDER BY id LIMIT ?",
+                                     (self._wyslane_do, min(wolne, ROZMIAR_PACZKI))).fetchall()
+        for id_wpisu, temat, dane in wpisy:
+            if not self._polaczony:
+                break
+            wynik = self.klient.publish(temat, dane, qos=QOS)
+            if wynik.rc not in (0, MQTT_ERR_NO_CONN):
+                break
+            self._w_locie[wynik.mid] = (id_wpisu, time.monotonic())
+            self._wyslane_do = id_wpisu
+            self.wyslane += 1
+        return len(wpisy)
+
+    def _petla(self):
+        przyciecie = time.monotonic() + INTERWAL_PRZYCINANIA
+        while not self._zatrzymaj.is_set():
+            self._sygnal.wait(1.0)
+            self._sygnal.clear()
+            self._usun_potwierdzone()
+            if time.monotonic() >= przyciecie:
+                przyciecie = time.monotonic() + INTERWAL_PRZYCINANIA
+                self._przytnij()
+            if not self._polaczony:
+                continue
+            self._ponow_przeterminowane()
+            # Zaległości paczkami, aż okno się zapełni lub dziennik opróżni
+            while self._polaczony and self._wyslij_paczke() and len(self._w_locie) < self.okno:
+                self._usun_potwierdzone()
+
+    # --- stan ---
+
+    def glebokosc(self, blokada=True):
+        """Liczba wiadomości czekających na potwierdzenie"""
+        if blokada:
+            with self._blokada:
+                return self._db.execute("SELECT COUNT(*) FROM dziennik").fetchone()[0]
+        return self._db.execute("SELECT COUNT(*) FROM dziennik").fetchone()[0]
+
+    def opoznienie(self):
+        """[s] wiek najstarszej niepotwierdzonej wiadomości, 0 gdy dziennik pusty"""
+        with self._blokada:
+            najstarszy = self._db.execute("SELECT MIN(ts) FROM dziennik").fetchone()[0]
+        return round(time.time() - najstarszy, 1) if najstarszy is not None else 0.0
+
+    def statystyki(self):
+        return {
+            'polaczony': self._polaczony,
+            'glebokosc': self.glebokosc(),
+            'opoznienie_s': self.opoznienie(),
+            'w_locie': len(self._w_locie),
+            'dopisane': self.dopisane,
+            'wyslane': self.wyslane,
+            'potwierdzone': self.potwierdzone,
+            'ponowione': self.ponowione,
+            'utracone': self.utracone,
+        }
+
+    def zamknij(self):
+        self._zatrzymaj.set()
+        self._sygnal.set()
+        self._watek.join(timeout=5.0)
+        with self._blokada:
+            self._db.close()
+
+
+def polacz(broker, port, sciezka=PLIK_DZIENNIKA, **opcje):
+    """
+    Klient paho łączący się w tle (także gdy broker jest chwilowo wyłączony)
+    z ponawianiem co 1..60 s, opakowany w DziennikMQTT.
+    """
+    import paho.mqtt.client as mqtt
+
+    klient = mqtt.Client()
+    klient.reconnect_delay_set(OPOZNIENIE_MIN, OPOZNIENIE_MAX)
+    klient.max_inflight_messages_set(opcje.get('okno', OKNO_WYSYLANIA))
+    dziennik = DziennikMQTT(klient, sciezka, **opcje)
+    klient.connect_async(broker, port, 60)
+    klient.loop_start()
+    return dziennik
+
+
+# === SAMOTEST Z UDAWANYM BROKEREM ===
+
+class _WynikPublikacji:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class _UdawanyKlient:
+    """Klient paho w skrócie: PUBACK przychodzi z wątku, broker można wyłączyć"""
+    def __init__(self):
+        self.dostepny = False
+        self.odebrane = []
+        self._kolejka = []
+        self._mid = 0
+        self._blokada = threading.Lock()
+
+    def _dostarcz(self, mid, dane):
+        self.odebrane.append(dane)
+        threading.Timer(0.001, self.on_publish, (self, None, mid)).start()
+
+    def polacz(self):
+        self.dostepny = True
+        kolejka, self._kolejka = self._kolejka, []
+        for mid, dane in kolejka:
+            self._dostarcz(mid, dane)
+        self.on_connect(self, None, {}, 0)
+
+    def rozlacz(self):
+        self.dostepny = False
+        self.on_disconnect(self, None, 1)
+
+    def publish(self, temat, dane, qos=0):
+        with self._blokada:
+            self._mid += 1
+            mid = self._mid
+        if not self.dostepny:
+            self._kolejka.append((mid, dane))
+            return _WynikPublikacji(MQTT_ERR_NO_CONN, mid)
+        self._dostarcz(mid, dane)
+        return _WynikPublikacji(0, mid)
+
+
+def _samotest():
+    import os
+    import tempfile
+
+    sciezka = os.path.join(tempfile.mkdtemp(prefix='dziennik_mqtt_'), 'dziennik.db')
+    klient = _UdawanyKlient()
+    dziennik = DziennikMQTT(klient, sciezka)
+
+    # Broker wyłączony - odczyty zostają na dysku, dopisz() nie czeka
+    n = 5000
+    start = time.perf_counter()
+    for i in range(n // 2):
+        dziennik.dopisz('lora/pogoda/bin', i.to_bytes(4, 'little'))
+    czas = time.perf_counter() - start
+    print(f"Broker wylaczony: glebokosc {dziennik.glebokosc()}, dopisz() {czas / (n // 2) * 1e6:.0f} us")
+    assert dziennik.glebokosc() == n // 2 and not klient.odebrane
+
+    # Restart procesu - dziennik przetrwał
+    dziennik.zamknij()
+    dziennik = DziennikMQTT(klient, sciezka)
+    assert dziennik.glebokosc() == n // 2
+
+    # Broker wraca - zaległości idą paczkami, nowe odczyty za nimi
+    klient.polacz()
+    for i in range(n // 2, n):
+        dziennik.dopisz('lora/pogoda/bin', i.to_bytes(4, 'little'))
+        if i == 3 * n // 4:
+            klient.rozlacz()
+            time.sleep(0.05)
+            klient.polacz()
+    koniec = time.monotonic() + 20
+    while dziennik.glebokosc() and time.monotonic() < koniec:
+        time.sleep(0.05)
+    s = dziennik.statystyki()
+    print(s)
+    odebrane = [int.from_bytes(d, 'little') for d in klient.odebrane]
+    assert s['glebokosc'] == 0 and set(odebrane) == set(range(n))
+    # Bez duplikatów odczyty przyszły w kolejności zapisu
+    unikalne = list(dict.fromkeys(odebrane))
+    assert unikalne == sorted(unikalne)
+    dziennik.zamknij()
+    print("OK")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        _samotest()
+    else:
+        print("Uzycie: python3 dziennik_mqtt.py test")
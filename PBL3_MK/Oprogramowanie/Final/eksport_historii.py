@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Strumieniowy eksport historii z magazynu (CSV, NDJSON, bloki kodeka,
+# opcjonalnie Parquet).
+# Każdy format to generator kawałków bajtów budowanych z porcji odczytów
+# (MagazynHistorii.porcje), więc eksport całego sezonu zajmuje w pamięci
+# tyle co jedna porcja, a odpowiedź HTTP płynie do klienta od pierwszej porcji.
+
+import io
+import csv
+import json
+import time
+
+import kodek
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+KOLUMNY_EKSPORTU = ('stacja', 'seq', 'ts', 'czas', 'T1', 'T2', 'Hu', 'Wi', 'Fa')
+
+
+def _czas_iso(ts):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))
+
+
+def _wiersz(w):
+    stacja, seq, ts, t1, t2, hu, wi, fa = w
+    return (stacja, seq, ts, _czas_iso(ts), t1, t2, hu, wi, fa)
+
+
+def strumien_csv(porcje):
+    bufor = io.StringIO()
+    pisarz = csv.writer(bufor, lineterminator='\n')
+    pisarz.writerow(KOLUMNY_EKSPORTU)
+    for porcja in porcje:
+        # Brakujące wartości (None) csv zapisuje jako puste pole
+        pisarz.writerows(_wiersz(w) for w in porcja)
+        yield bufor.getvalue().encode('utf-8')
+        bufor.seek(0)
+        bufor.truncate()
+    if bufor.tell():
+        yield bufor.getvalue().encode('utf-8')
+
+
+def strumien_ndjson(porcje):
+    for porcja in porcje:
+        yield ''.join(json.dumps(dict(zip(KOLUMNY_EKSPORTU, _wiersz(w))), separators=(',', ':')) + '\n'
+                      for w in porcja).encode('utf-8')
+
+
+def strumien_kodek(porcje):
+    """Seria kodeka (kodek.py): bloki po ROZMIAR_BLOKU odczytów jednej stacji"""
+    yield kodek.NAGLOWEK_SERII.pack(kodek.MAGIC_SERII, kodek.WERSJA_KODEKA, 0, 0, 0)
+    for porcja in porcje:
+        for i in range(0, len(porcja), kodek.ROZMIAR_BLOKU):
+            blok = porcja[i:i + kodek.ROZMIAR_BLOKU]
+            # Porcja zawiera odczyty jednej stacji (porcje() idzie stacja po stacji)
+            yield kodek.koduj_blok([w[1:] for w in blok], blok[0][0])
+
+
+class _Odbiornik(io.RawIOBase):
+    """Plik tylko do zapisu, z którego generator odbiera zapisane bajty"""
+    def __init__(self):
+        self._czesci = []
+        self._pozycja = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dane):
+        self._czesci.append(bytes(dane))
+        self._pozycja += len(dane)
+        return len(dane)
+
+    def tell(self):
+        return self._pozycja
+
+    def odbierz(self):
+        dane = b''.join(self._czesci)
+        self._czesci = []
+        return dane
+
+
+def strumien_parquet(porcje):
+    """Jedna grupa wierszy Parquet na porcję, stopka pliku na końcu strumienia"""
+    schemat = pyarrow.schema([
+        ('stacja', pyarrow.int32()), ('seq', pyarrow.int64()),
+        ('ts', pyarrow.timestamp('ms', tz='UTC')),
+        ('T1', pyarrow.float32()), ('T2', pyarrow.float32()), ('Hu', pyarrow.float32()),
+        ('Wi', pyarrow.float32()), ('Fa', pyarrow.int8()),
+    ])
+    odbiornik = _Odbiornik()
+    with parquet.ParquetWriter(odbiornik, schemat, compression='zstd') as pisarz:
+        for porcja in porcje:
+            kolumny = list(zip(*porcja))
+            kolumny[2] = [int(ts * 1000) for ts in kolumny[2]]
+            pisarz.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(k, typ) for k, typ in zip(kolumny, schemat.types)], schema=schemat))
+            yield odbiornik.odbierz()
+    yield odbiornik.odbierz()
+
+
+# format -> (generator, typ MIME, rozszerzenie pliku)
+FORMATY = {
+    'csv': (strumien_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (strumien_ndjson, 'application/x-ndjson', 'ndjson'),
+    'kodek': (strumien_kodek, 'application/octet-stream', 'pblk'),
+}
+if pyarrow is not None:
+    FORMATY['parquet'] = (strumien_parquet, 'application/vnd.apache.parquet', 'parquet')
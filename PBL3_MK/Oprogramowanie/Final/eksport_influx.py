@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+# Eksport odczytów do InfluxDB v2 (line protocol) bez blokowania odbioru.
+# Odczyty trafiają do kolejki w pamięci, wątek zapisujący składa je w paczki
+# wysyłane po przekroczeniu rozmiaru lub wieku. Gdy baza jest nieosiągalna,
+# paczka ląduje w katalogu bufora na dysku i jest później odtwarzana
+# (najwyżej kilka wysyłek naraz), więc przerwa w sieci nie gubi danych.
+# Paczka odrzucona przez bazę (HTTP 4xx - zły token, bucket, składnia) nie
+# wraca do bufora, bo ponowienie nic nie da i blokowałoby odtwarzanie -
+# trafia do podkatalogu odrzucone/ do wglądu.
+#
+# Samotest z lokalną zaślepką HTTP zamiast InfluxDB:
+#   python3 eksport_influx.py test
+
+import os
+import sys
+import gzip
+import time
+import queue
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROZMIAR_PACZKI = 500          # linii w jednym zapisie
+MAKS_WIEK_PACZKI = 5.0        # [s] niepełna paczka i tak idzie po tym czasie
+ROZMIAR_KOLEJKI = 20000       # odczytów czekających w pamięci
+MAKS_PLIKOW_BUFORA = 5000     # paczek na dysku - najstarsze są usuwane
+MAKS_PLIKOW_ODRZUCONYCH = 100 # odrzuconych paczek zachowanych do wglądu
+KATALOG_ODRZUCONYCH = "odrzucone"
+ROWNOLEGLE_ODTWARZANIE = 2    # jednoczesnych wysyłek z bufora
+INTERWAL_ODTWARZANIA = 10.0   # [s] między próbami opróżnienia bufora
+INTERWAL_RAPORTU = 600.0      # [s] między wpisami z przepustowością
+
+
+def _ucieczka(tekst, znaki):
+    for znak in ('\\',) + znaki:
+        tekst = tekst.replace(znak, '\\' + znak)
+    return tekst
+
+
+def linia_protokolu(pomiar, tagi, pola, ts):
+    """
+    Jedna linia line protocol z czasem w ms. Wszystkie pola są zapisywane
+    jako float (jak robi to Telegraf dla JSON), żeby typ pola w bazie nie
+    zależał od tego, czy akurat przyszło 0 czy 0.5. Pola None są pomijane.
+    Zwraca None, gdy nie ma żadnego pola.
+    """
+    czesci_pol = [f"{_ucieczka(k, (',', '=', ' '))}={float(v)!r}"
+                  for k, v in pola.items() if v is not None]
+    if not czesci_pol:
+        return None
+    glowa = _ucieczka(pomiar, (',', ' '))
+    for k, v in tagi.items():
+        glowa += f",{_ucieczka(k, (',', '=', ' '))}={_ucieczka(str(v), (',', '=', ' '))}"
+    return f"{glowa} {','.join(czesci_pol)} {int(ts * 1000)}"
+
+
+def _odrzucona(blad):
+    """Czy baza odrzuciła treść paczki (4xx) - 408 i 429 to chwilowe przeciążenie"""
+    return isinstance(blad, urllib.error.HTTPError) and 400 <= blad.code < 500 and blad.code not in (408, 429)
+
+
+class EksportInflux:
+    """
+    Asynchroniczne ujście do InfluxDB. zapisz() tylko wkłada odczyt do
+    kolejki i nigdy nie czeka na sieć - przy pełnej kolejce najstarszy
+    odczyt jest odrzucany.
+    """
+    def __init__(self, url, token, org, bucket, pomiar, katalog_bufora,
+                 rozmiar_paczki=ROZMIAR_PACZKI, maks_wiek=MAKS_WIEK_PACZKI,
+                 rownoleglosc=ROWNOLEGLE_ODTWARZANIE, limit_czasu=5.0,
+                 interwal_odtwarzania=INTERWAL_ODTWARZANIA):
+        parametry = urllib.parse.urlencode({'org': org, 'bucket': bucket, 'precision': 'ms'})
+        self.adres = f"{url.rstrip('/')}/api/v2/write?{parametry}"
+        self.token = token
+        self.pomiar = pomiar
+        self.katalog_bufora = katalog_bufora
+        self.katalog_odrzuconych = os.path.join(katalog_bufora, KATALOG_ODRZUCONYCH)
+        self.rozmiar_paczki = rozmiar_paczki
+        self.maks_wiek = maks_wiek
+        self.rownoleglosc = rownoleglosc
+        self.limit_czasu = limit_czasu
+        self.interwal_odtwarzania = interwal_odtwarzania
+        os.makedirs(self.katalog_odrzuconych, exist_ok=True)
+
+        self._kolejka = queue.Queue(maxsize=ROZMIAR_KOLEJKI)
+        self._blokada_bufora = threading.Lock()
+        self._licznik_plikow = 0
+        self._zatrzymaj = threading.Event()
+        self._niedostepna = False
+        self._start = time.monotonic()
+        self.wyslane_linie = 0
+        self.wyslane_paczki = 0
+        self.zbuforowane_paczki = 0
+        self.odtworzone_paczki = 0
+        self.utracone_paczki = 0
+        self.odrzucone_paczki = 0
+        self.odrzucone = 0
+        self.bledy = 0
+
+        self._watek = threading.Thread(target=self._petla, name="eksport_influx", daemon=True)
+        self._watek.start()
+        self._watek_odtwarzania = threading.Thread(target=self._petla_odtwarzania,
+                                                   name="eksport_influx_bufor", daemon=True)
+        self._watek_odtwarzania.start()
+
+    def zapisz(self, tagi, pola, ts):
+        linia = linia_protokolu(self.pomiar, tagi, pola, ts)
+        if linia is None:
+            return
+        while True:
+            try:
+                self._kolejka.put_nowait(linia)
+                return
+            except queue.Full:
+                try:
+                    self._kolejka.get_nowait()
+                    self.odrzucone += 1
+                except queue.Empty:
+                    pass
+
+    # --- wysyłka ---
+
+    def _wyslij(self, dane):
+        """POST skompresowanej paczki, wyjątek gdy baza nie przyjęła danych"""
+        zadanie = urllib.request.Request(self.adres, data=gzip.compress(dane, compresslevel=5), headers={
+            'Authorization': f"Token {self.token}",
+            'Content-Type': 'text/plain; charset=utf-8',
+            'Content-Encoding': 'gzip',
+        })
+        with urllib.request.urlopen(zadanie, timeout=self.limit_czasu):
+            pass
+
+    def _oproznij_paczke(self, linie):
+        dane = ('\n'.join(linie) + '\n').encode('utf-8')
+        try:
+            self._wyslij(dane)
+            self.wyslane_linie += len(linie)
+            self.wyslane_paczki += 1
+            if self._niedostepna:
+                self._niedostepna = False
+                print("InfluxDB znow dostepny")
+        except Exception as e:
+            if _odrzucona(e):
+                self._odrzuc(e, dane=dane)
+                return
+            self.bledy += 1
+            if not self._niedostepna:
+                # Jeden wpis na przerwę, a nie na każdą paczkę
+                self._niedostepna = True
+                print(f"InfluxDB niedostepny ({e}) - paczki trafiaja do bufora na dysku")
+            self._do_bufora(dane)
+
+    def _petla(self):
+        linie = []
+        poczatek_paczki = None
+        nastepny_raport = time.monotonic() + INTERWAL_RAPORTU
+        while True:
+            limit = None if poczatek_paczki is None else \
+                max(0.0, poczatek_paczki + self.maks_wiek - time.monotonic())
+            try:
+                linia = self._kolejka.get(timeout=limit)
+            except queue.Empty:
+                linia = None
+            if linia is not None:
+                if not linie:
+                    poczatek_paczki = time.monotonic()
+                linie.append(linia)
+                self._kolejka.task_done()
+            teraz = time.monotonic()
+            if linie and (len(linie) >= self.rozmiar_paczki or teraz - poczatek_paczki >= self.maks_wiek
+                          or self._zatrzymaj.is_set()):
+                self._oproznij_paczke(linie)
+                linie = []
+                poczatek_paczki = None
+            if teraz >= nastepny_raport:
+                nastepny_raport = teraz + INTERWAL_RAPORTU
+                s = self.statystyki()
+                print(f"Eksport InfluxDB: {s['linie_na_s']:.1f} linii/s, wyslane {s['wyslane_linie']}, "
+                      f"w buforze {s['w_buforze']} paczek, odrzucone {s['odrzucone_paczki']}, bledy {s['bledy']}")
+
+    # --- bufor na dysku ---
+
+    def _pliki_bufora(self):
+        return sorted(n for n in os.listdir(self.katalog_bufora) if n.endswith('.lp'))
+
+    def _do_bufora(self, dane):
+        with self._blokada_bufora:
+            self._licznik_plikow += 1
+            nazwa = f"{time.time_ns():020d}-{self._licznik_plikow:06d}.lp"
+            sciezka = os.path.join(self.katalog_bufora, nazwa)
+            # Zapis atomowy - po awarii zasilania nie zostanie urwana paczka
+            with open(sciezka + '.tmp', 'wb') as f:
+                f.write(dane)
+            os.replace(sciezka + '.tmp', sciezka)
+            self.zbuforowane_paczki += 1
+            pliki = self._pliki_bufora()
+            for stary in pliki[:max(0, len(pliki) - MAKS_PLIKOW_BUFORA)]:
+                os.remove(os.path.join(self.katalog_bufora, stary))
+                self.utracone_paczki += 1
+
+    def _odrzuc(self, blad, dane=None, nazwa=None):
+        """Paczka odrzucona przez bazę: nowa (dane) albo plik bufora (nazwa) do katalogu odrzuconych"""
+        with self._blokada_bufora:
+            if nazwa is None:
+                self._licznik_plikow += 1
+                nazwa = f"{time.time_ns():020d}-{self._licznik_plikow:06d}.lp"
+                with open(os.path.join(self.katalog_odrzuconych, nazwa), 'wb') as f:
+                    f.write(dane)
+            else:
+                os.replace(os.path.join(self.katalog_bufora, nazwa), os.path.join(self.katalog_odrzuconych, nazwa))
+            self.odrzucone_paczki += 1
+            pliki = sorted(os.listdir(self.katalog_odrzuconych))
+            for stary in pliki[:max(0, len(pliki) - MAKS_PLIKOW_ODRZUCONYCH)]:
+                os.remove(os.path.join(self.katalog_odrzuconych, stary))
+        try:
+            opis = blad.read(200).decode('utf-8', errors='replace')
+        except Exception:
+            opis = blad.reason
+        print(f"InfluxDB odrzucil paczke (HTTP {blad.code}: {opis}) - zapisana w {self.katalog_odrzuconych}")
+
+    def _odtworz_plik(self, nazwa):
+        """True - wysłana, False - nie ma jej już albo odrzucona; wyjątek gdy baza nie odpowiada"""
+        sciezka = os.path.join(self.katalog_bufora, nazwa)
+        try:
+            with open(sciezka, 'rb') as f:
+                dane = f.read()
+        except FileNotFoundError:
+            return False  # usunięty jako najstarszy przy przepełnieniu
+        try:
+            self._wyslij(dane)
+        except urllib.error.HTTPError as e:
+            if not _odrzucona(e):
+                raise
+            self._odrzuc(e, nazwa=nazwa)
+            return False
+        with self._blokada_bufora:
+            if os.path.exists(sciezka):
+                os.remove(sciezka)
+        self.wyslane_linie += dane.count(b'\n')
+        self.odtworzone_paczki += 1
+        return True
+
+    def odtworz_bufor(self):
+        """
+        Wysyła paczki z bufora od najstarszych, najwyżej `rownoleglosc`
+        naraz. Przy pierwszym błędzie sieci lub 5xx przerywa - baza wciąż
+        nie odpowiada; odrzucone (4xx) paczki są odkładane i odtwarzanie
+        idzie dalej. Zwraca liczbę odtworzonych paczek.
+        """
+        pliki = self._pliki_bufora()
+        odtworzone = 0
+        with ThreadPoolExecutor(max_workers=self.rownoleglosc) as pula:
+            for i in range(0, len(pliki), self.rownoleglosc):
+                porcja = [pula.submit(self._odtworz_plik, n) for n in pliki[i:i + self.rownoleglosc]]
+                blad = False
+                for zadanie in porcja:
+                    try:
+                        odtworzone += zadanie.result()
+                    except Exception:
+                        blad = True
+                if blad:
+                    self.bledy += 1
+                    break
+        return odtworzone
+
+    def _petla_odtwarzania(self):
+        while not self._zatrzymaj.wait(self.interwal_odtwarzania):
+            if self._pliki_bufora():
+                odtworzone = self.odtworz_bufor()
+                if odtworzone:
+                    print(f"Eksport InfluxDB: odtworzono {odtworzone} paczek z bufora")
+
+    # --- stan ---
+
+    def statystyki(self):
+        czas = time.monotonic() - self._start
+        return {
+            'wyslane_linie': self.wyslane_linie,
+            'wyslane_paczki': self.wyslane_paczki,
+            'zbuforowane_paczki': self.zbuforowane_paczki,
+            'odtworzone_paczki': self.odtworzone_paczki,
+            'utracone_paczki': self.utracone_paczki,
+            'odrzucone_paczki': self.odrzucone_paczki,
+            'w_buforze': len(self._pliki_bufora()),
+            'w_kolejce': self._kolejka.qsize(),
+            'odrzucone': self.odrzucone,
+            'bledy': self.bledy,
+            'linie_na_s': self.wyslane_linie / czas if czas > 0 else 0.0,
+        }
+
+    def oproznij(self, limit_czasu=10.0):
+        """Czeka na wysłanie kolejki i niepełnej paczki (testy, zamykanie programu)"""
+        koniec = time.monotonic() + limit_czasu
+        while self._kolejka.unfinished_tasks and time.monotonic() < koniec:
+            time.sleep(0.02)
+        # Niepełna paczka wyjdzie najpóźniej po maks_wiek
+        time.sleep(min(self.maks_wiek + 0.1, max(0.0, koniec - time.monotonic())))
+
+
+# === SAMOTEST Z LOKALNĄ ZAŚLEPKĄ INFLUXDB ===
+
+def _samotest():
+    import shutil
+    import tempfile
+    import http.server
+
+    odebrane = []
+    dostepna = threading.Event()
+
+    class ZaslepkaInflux(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            dane = self.rfile.read(int(self.headers['Content-Length']))
+            if not dostepna.is_set():
+                self.send_response(503)
+                self.end_headers()
+                return
+            if self.headers.get('Content-Encoding') == 'gzip':
+                dane = gzip.decompress(dane)
+            if b'station_id=zla' in dane:
+                odpowiedz = b'{"code":"invalid","message":"unable to parse"}'
+                self.send_response(400)
+                self.send_header('Content-Length', str(len(odpowiedz)))
+                self.end_headers()
+                self.wfile.write(odpowiedz)
+                return
+            assert self.path.startswith('/api/v2/write?') and self.headers['Authorization'] == 'Token test'
+            odebrane.extend(dane.decode('utf-8').splitlines())
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    serwer = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ZaslepkaInflux)
+    threading.Thread(target=serwer.serve_forever, daemon=True).start()
+    katalog = tempfile.mkdtemp(prefix='bufor_influx_')
+
+    linia = linia_protokolu('pogoda', {'station_id': '01'}, {'temp ds': 1, 'wiatr': None, 'hu': 80.5}, 1700000000.25)
+    print(linia)
+    assert linia == 'pogoda,station_id=01 temp\\ ds=1.0,hu=80.5 1700000000250'
+
+    eksport = EksportInflux(f"http://127.0.0.1:{serwer.server_address[1]}", 'test', 'sad', 'lora',
+                            'pogoda', katalog, rozmiar_paczki=200, maks_wiek=0.2, interwal_odtwarzania=3600)
+    n = 20000
+
+    # Baza niedostępna - wszystko musi trafić na dysk, zapisz() nie może czekać
+    start = time.perf_counter()
+    for i in range(n // 2):
+        eksport.zapisz({'station_id': f"{i % 50:02d}"}, {'temp': i / 100.0, 'frost_alert': i % 2}, 1700000000 + i)
+    czas_zapisu = time.perf_counter() - start
+    eksport.oproznij()
+    s = eksport.statystyki()
+    print(f"Baza niedostepna: {s['zbuforowane_paczki']} paczek w buforze, "
+          f"zapisz() {czas_zapisu / (n // 2) * 1e6:.1f} us/odczyt")
+    assert s['w_buforze'] > 0 and not odebrane
+
+    # Baza wraca - nowe odczyty idą od razu, bufor jest odtwarzany
+    dostepna.set()
+    start = time.perf_counter()
+    for i in range(n // 2, n):
+        eksport.zapisz({'station_id': f"{i % 50:02d}"}, {'temp': i / 100.0, 'frost_alert': i % 2}, 1700000000 + i)
+    eksport.oproznij()
+    odtworzone = eksport.odtworz_bufor()
+    czas = time.perf_counter() - start
+    s = eksport.statystyki()
+    print(f"Odtworzono {odtworzone} paczek, odebrano {len(odebrane)} / {n} linii")
+    print(f"Przepustowosc: {n / czas:.0f} linii/s (w tym odtwarzanie bufora)")
+    assert len(odebrane) == n and s['w_buforze'] == 0 and s['odrzucone'] == 0
+
+    # Paczka odrzucona przez bazę (400) nie wraca do bufora ani nie blokuje odtwarzania
+    eksport.zapisz({'station_id': 'zla'}, {'temp': 1.0}, 1700000000)
+    eksport.oproznij()
+    eksport._do_bufora(b'pogoda,station_id=zla temp=1.0 1700000000000\n')
+    eksport._do_bufora(b'pogoda,station_id=01 temp=1.0 1700000000000\n')
+    assert eksport.odtworz_bufor() == 1
+    s = eksport.statystyki()
+    print(f"Odrzucone przez baze: {s['odrzucone_paczki']} paczek")
+    assert s['odrzucone_paczki'] == 2 and s['w_buforze'] == 0 and len(odebrane) == n + 1
+    assert len(os.listdir(eksport.katalog_odrzuconych)) == 2
+
+    serwer.shutdown()
+    shutil.rmtree(katalog, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == 'test':
+        _samotest()
+    else:
+        print("Uzycie: python3 eksport_influx.py test")
@@ -1,20 +1,53 @@
-from flask import Flask, render_template, jsonify, request
+import os
+import sys
+
+# Tryb produkcyjny: asynchroniczny serwer eventlet zamiast deweloperskiego Werkzeug.
+# Monkey patching musi nastąpić przed importem pozostałych modułów.
+TRYB_PRODUKCYJNY = '--produkcja' in sys.argv or os.environ.get('TRYB_SERWERA') == 'produkcja'
+if TRYB_PRODUKCYJNY:
+    import eventlet
+    eventlet.monkey_patch()
+
+# Tryb zintegrowany: odbiornik LoRa i serwer WWW w jednym procesie (np. Pi 4 bez
+# brokera). --mqtt dodatkowo publikuje odczyty na lora/pogoda.
+TRYB_ZINTEGROWANY = '--zintegrowany' in sys.argv
+
+from flask import Flask, Response, render_template, jsonify, request
 from flask_socketio import SocketIO, emit
 import threading
+import queue
 import time
-import random
 import json
-from collections import deque
-
-# Import klienta InfluxDB
-from influxdb_client import InfluxDBClient
+import hashlib
 
 # Import MQTT client do real-time danych
 import paho.mqtt.client as mqtt
 
+from rozsylanie import RozsylaczMigawek
+from zasoby import MapaZasobow, kompresuj, odpowiedz_http
+from magazyn import MagazynHistorii, POLA, DOKLADNOSC_CZASU, koduj_kolumnowo
+from kodek import koduj_serie
+from decymacja import decymuj, CacheDecymacji
+from stan import StanWspoldzielony, SurowyJSON, JsonSocketIO
+from eksport_influx import EksportInflux
+from eksport_historii import FORMATY
+from stacje import STATION_ID_TO_INDEX
+from pomiar import Pomiar
+from zywotnosc import MonitorStacji
+from detekcja_awarii import RejestrAwarii, TEMAT_AWARII
+import diagnostyka
+import klaster
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
-socketio = SocketIO(app)
+# JsonSocketIO - gotowy JSON migawki doklejany do pakietu bez ponownego kodowania
+socketio = SocketIO(app, async_mode='eventlet' if TRYB_PRODUKCYJNY else 'threading', json=JsonSocketIO)
+# Kolejka z jedną migawką na klienta - wolni klienci nie spowalniają pozostałych
+rozsylacz = RozsylaczMigawek(socketio)
+
+# Biblioteki JS serwowane lokalnie (sieć w sadzie jest offline)
+mapa_zasobow = MapaZasobow(os.path.join(app.root_path, 'static', 'vendor'))
+app.jinja_env.globals['zasob'] = mapa_zasobow.url
 
 # ================= KONFIGURACJA INFLUXDB (Dla Pi Zero - BACKUP) =================
 INFLUX_URL = "http://localhost:8086"
@@ -23,144 +56,213 @@ INFLUX_TOKEN = "fB3HQxYQBvBfTt7U0cSz94mb1Q4AUQU7n2ycuDqEV8IFue-C9Z2uUGr7QBJ1oXnz
 INFLUX_ORG = "PBL3_Z8"       # [cite: 68]
 INFLUX_BUCKET = "lora_dane"  # [cite: 70]
 INFLUX_MEASUREMENT = "mqtt_consumer"
+# Zapis do InfluxDB z serwera (--influx): paczki line protocol, bufor na dysku
+# gdy baza nie odpowiada. Potrzebny np. w trybie zintegrowanym bez Telegrafa.
+EKSPORT_INFLUX = '--influx' in sys.argv
+KATALOG_BUFORA_INFLUX = os.environ.get('KATALOG_BUFORA_INFLUX', 'bufor_influx')
+
+# --diagnostyka [port]: lokalny endpoint profilera/pamięci (diagnostyka.py)
+PORT_DIAGNOSTYKI = 5001
 
 # ================= KONFIGURACJA MQTT (Real-time dla Pi Zero) =================
 MQTT_BROKER = "127.0.0.1"    # localhost
 MQTT_PORT = 1883
-MQTT_TOPIC = "lora/pogoda"    # topic z odbiornik.py
-
-# Mapowanie station_id (LoRa) → indeksy stron (0-7)
-STATION_ID_TO_INDEX = {
-    "01": 5,  # Pi Zero
-    "02": 0,  # Sym1
-    "03": 1,  # Sym4
-    "04": 2,  # Sym2
-    "05": 3,  # Sym3
-    "06": 6,  # Sym5
-    "07": 7   # Sym6
-}
+# Odbiornik publikuje binarny Pomiar (pomiar.py) na lora/pogoda/bin i JSON na lora/pogoda.
+# --mqtt-json: subskrypcja JSON - dla starszych odbiorników bez tematu binarnego.
+MQTT_JSON = '--mqtt-json' in sys.argv
+MQTT_TOPIC = "lora/pogoda" if MQTT_JSON else "lora/pogoda/bin"    # topic z odbiornik.py
+
+# ================= WORKERY (klaster.py) =================
+# --workery N: ten proces jest pisarzem (MQTT/radio -> magazyn) i uruchamia
+# N-1 workerów (--worker k), które dostają zapisane wiersze szyną MQTT.
+# Przed workerami reverse proxy ze sticky sessions: python3 klaster.py nginx
+NUMER_WORKERA, LICZBA_WORKEROW = klaster.z_argumentow(sys.argv)
+PISARZ = NUMER_WORKERA == 0
+PORT_WWW = klaster.port_workera(klaster.PORT_WWW, NUMER_WORKERA)
 
-# Zbiór stacji, które wysyłają prawdziwe dane (dynamiczny)
-active_real_stations = set()
+# ================= HISTORIA =================
+PLIK_HISTORII = os.environ.get('PLIK_HISTORII', 'historia.db')
+ROZMIAR_HISTORII = 72          # punktów trzymanych w pamięci na stację
+LIMIT_ODPOWIEDZI_HISTORII = 5000  # maks. odczytów w jednej odpowiedzi ?since=
+MAX_PUNKTOW_WYKRESU = 5000     # górny limit parametru ?punkty=
+
+# Mapowanie station_id (LoRa) → indeksy stron: STATION_ID_TO_INDEX w stacje.py
 
 # Konfiguracja stacji (legacy - na potrzeby kompatybilności)
 REAL_STATION_INDEX = 5  # Pi Zero ma index 5 na stronie
 REAL_STATION_ID_TAG = "01" # ID wysyłane przez LoRa
 
-# Lista indeksów, które mają być symulowane
-# Stacje 2-7 (indeksy 0,1,2,3,6,7) używają WYŁĄCZNIE danych z MQTT - brak symulacji
-SIMULATION_INDICES = []  # Pusta lista - wszystkie dane z prawdziwych pomiarów
+# Stacje wirtualne do testów: generator_stacji.py (przez MQTT lub radio UDP odbiornika)
 # =======================================================================
 
-# Przechowywanie danych
-latest_values = {}
-historical_values = {}
-
-# Inicjalizacja struktur danych
-for i in range(8):
-    latest_values[str(i)] = []
-    historical_values[str(i)] = {
-        'T1': deque(maxlen=72), 
-        'T2': deque(maxlen=72), 
-        'Hu': deque(maxlen=72),
-        'Wi': deque(maxlen=72),  # Wiatr
-        'Fa': deque(maxlen=72)   # Frost Alert
-    }
+# Przechowywanie danych - niezmienne migawki (stan.py): wątek MQTT publikuje
+# nową wersję, wątki HTTP/Socket.IO czytają bieżącą bez blokad.
+# migawka.wartosci[klucz] = (t1, t2, hu, wi, fa, seq)
+# migawka.historie[klucz].wiersze = ((seq, ts, t1, t2, hu, wi, fa), ...)
+stan = StanWspoldzielony([str(i) for i in range(8)], ROZMIAR_HISTORII)
+magazyn = MagazynHistorii(PLIK_HISTORII)
 
-# Funkcja pomocnicza do aktualizacji danych
-def update_data(index, t1, t2, hu, wi=0.0, fa=0):
-    """Aktualizuje pamięć i wysyła dane do przeglądarek"""
-    key = str(index)
-    
-    # Aktualizacja wartości
-    latest_values[key] = [t1, t2, hu, wi, fa]
-    historical_values[key]['T1'].append(t1)
-    historical_values[key]['T2'].append(t2)
-    historical_values[key]['Hu'].append(hu)
-    historical_values[key]['Wi'].append(wi)
-    historical_values[key]['Fa'].append(fa)
+
+# Wyrenderowane strony
+_cache_stron = {}
+# Zdecymowane serie dla długich zakresów - klucz (stacja, od, do, punkty, wersja)
+cache_decymacji = CacheDecymacji()
+
+eksport = EksportInflux(INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET, INFLUX_MEASUREMENT,
+                        KATALOG_BUFORA_INFLUX) if EKSPORT_INFLUX and PISARZ else None
+
+# Żywotność stacji (ok / opozniona / offline) i jakość łącza - klucze jak w migawce
+monitor = MonitorStacji()
+
+# Awarie czujników wykryte przez odbiornik (detekcja_awarii.py) - z MQTT
+# lora/awarie albo bezpośrednio z odbiornika w trybie zintegrowanym;
+# workery dostają je od pisarza przez szynę
+rejestr_awarii = RejestrAwarii()
+
+# Szyna do pozostałych workerów (pisarz) albo od pisarza (worker) - tylko z --workery
+szyna = None
+
+def zaladuj_z_magazynu():
+    """
+    Ostatnie punkty z magazynu - po restarcie, a na workerze także po
+    ponownym połączeniu z szyną (wiersze z przerwy są tylko w magazynie)
+    """
+    for i in range(8):
+        wiersze = magazyn.ostatnie(i, ROZMIAR_HISTORII)
+        stan.zaladuj_historie(str(i), wiersze, wiersze[-1][0] if wiersze else 0)
+        if wiersze:
+            # Stacja milcząca od przed restartu szybko przejdzie w offline
+            monitor.zarejestruj(str(i), wiersze[-1][1])
+
+# Odtworzenie ostatnich punktów z magazynu po restarcie
+zaladuj_z_magazynu()
+
+def zastosuj_wiersz(key, wiersz):
+    """Wiersz (seq, ts, t1, t2, hu, wi, fa) już zapisany w magazynie -> migawka i przeglądarki"""
+    seq = wiersz[0]
+    # Nowa migawka (ostatni element wartości - seq, kursor dla klientów).
+    # Wersja = seq, więc ETagi API nie powtarzają się po restarcie serwera
+    # i są takie same na wszystkich workerach.
+    migawka = stan.opublikuj(key, wiersz[2:] + (seq,), wiersz, seq)
     
-    # Wysłanie tylko zmienionych danych (optymalizacja) lub całości
-    # Tutaj wysyłamy całość 'latest_values' tak jak w oryginale
-    socketio.emit('values_update', latest_values)
+    # Wysyłamy całość wartości tak jak w oryginale - JSON kodowany raz na wersję
+    rozsylacz.publikuj('values_update', SurowyJSON(migawka.json_wartosci()))
+
+# Funkcja pomocnicza do aktualizacji danych
+def update_data(index, t1, t2, hu, wi=None, fa=0, ts=None):
+    """Zapisuje odczyt, aktualizuje pamięć i przeglądarki (None = brak odczytu, Wi w km/h), zwraca wiersz"""
+    if ts is None:
+        ts = time.time()
+    ts = round(ts, DOKLADNOSC_CZASU)
+    seq = magazyn.zapisz(index, ts, t1, t2, hu, wi, fa)
+    wiersz = (seq, ts, t1, t2, hu, wi, fa)
+    zastosuj_wiersz(str(index), wiersz)
+    return wiersz
+
+def zastosuj_lacze(key, probki, rssi, snr):
+    """Ramka stacji dla monitora żywotności - rozsyła stan przy zmianie"""
+    zmiany = monitor.odebrano(key, time.time(), probki, rssi, snr)
+    if zmiany:
+        publikuj_stan_stacji(zmiany)
 
 # === MQTT CALLBACK (Real-time data) ===
 def on_mqtt_connect(client, userdata, flags, rc):
-    """Callback wywoływany po połączeniu z MQTT broker"""
+    """Callback wywoływany po połączeniu z MQTT broker (userdata - tematy do subskrypcji)"""
     if rc == 0:
-        print(f"MQTT polaczono: subskrybuje {MQTT_TOPIC}")
-        client.subscribe(MQTT_TOPIC)
+        print(f"MQTT polaczono: subskrybuje {', '.join(userdata)}")
+        for temat in userdata:
+            client.subscribe(temat)
     else:
         print(f"MQTT blad polaczenia: kod {rc}")
 
+
+# Pomiary pominięte jako powtórzenia (diagnostyka)
+licznik_powtorzen = [0]
+
+
+def przyjmij_pomiar(pomiar):
+    """
+    Wspólne przyjęcie odczytu (Pomiar z pomiar.py) - z MQTT albo
+    bezpośrednio z odbiornika w trybie zintegrowanym.
+    """
+    station_id = pomiar.stacja
+    
+    # Sprawdź czy stacja jest w mapowaniu
+    if station_id in STATION_ID_TO_INDEX:
+        station_index = STATION_ID_TO_INDEX[station_id]
+
+        # Dziennik MQTT odbiornika dostarcza "co najmniej raz" - po zerwanym
+        # połączeniu ten sam odczyt może przyjść ponownie, pomijamy go
+        historia = stan.migawka().historie.get(str(station_index))
+        if historia is not None and historia.wiersze and round(pomiar.ts, DOKLADNOSC_CZASU) <= historia.wiersze[-1][1]:
+            licznik_powtorzen[0] += 1
+            return
+
+        # Eksport wszystkich pól liczbowych (jak Telegraf) - tylko kolejka, bez czekania na sieć
+        if eksport is not None:
+            eksport.zapisz({'station_id': station_id}, pomiar.pola_liczbowe(), pomiar.ts)
+        
+        # Wiersz historii w jednostkach pomiaru - brak odczytu zostaje None
+        ts, t1, t2, hu, wi, fa = pomiar.wiersz_historii()
+        
+        # Aktualizacja danych
+        station_names = {0:"Stacja 2 (S)", 1:"Stacja 3 (S)", 2:"Stacja 4 (S)", 3:"Stacja 5 (S)", 4:"Pi 4", 5:"Pi Zero", 6:"Stacja 6 (S)", 7:"Stacja 7 (S)"}
+        station_name = station_names.get(station_index, f"Stacja {station_index}")
+        print(f"Pomiar -> {station_name} (ID={station_id}): T1={t1}, T2={t2}, Hu={hu}, Wi={wi}km/h, FA={fa}")
+        wiersz = update_data(station_index, t1, t2, hu, wi, fa, ts)
+        zastosuj_lacze(str(station_index), pomiar.probki, pomiar.rssi, pomiar.snr)
+        if szyna is not None:
+            szyna.publikuj(str(station_index), wiersz, pomiar.probki, pomiar.rssi, pomiar.snr)
+    else:
+        print(f"Nieznane station_id: {station_id}")
+
+def przyjmij_awarie(zdarzenie):
+    """Pisarz: zdarzenie awarii do własnego rejestru i do workerów"""
+    rejestr_awarii.dodaj(zdarzenie)
+    if szyna is not None:
+        szyna.publikuj_awarie(zdarzenie)
+
+def przyjmij_z_szyny(key, wiersz, probki, rssi, snr):
+    """Worker: wiersz zapisany przez pisarza (QoS 1 - możliwe powtórzenie)"""
+    historia = stan.migawka().historie.get(key)
+    if historia is None or (historia.wiersze and wiersz[0] <= historia.wiersze[-1][0]):
+        return
+    zastosuj_wiersz(key, wiersz)
+    zastosuj_lacze(key, probki, rssi, snr)
+
+def publikuj_stan_stacji(zmiany):
+    """Rozsyła stan wszystkich stacji po zmianie (ok / opozniona / offline)"""
+    for klucz, stan_stacji in zmiany:
+        if stan_stacji != 'ok':
+            print(f"Stacja {klucz}: {stan_stacji} - brak ramek")
+    rozsylacz.publikuj('station_status', SurowyJSON(json.dumps(monitor.migawka())))
+
+def zywotnosc_thread():
+    """Takt koła czasowego monitora - co sekundę, koszt O(1) na takt"""
+    while True:
+        socketio.sleep(1.0)
+        zmiany = monitor.tik(time.time())
+        if zmiany:
+            publikuj_stan_stacji(zmiany)
+
 def on_mqtt_message(client, userdata, msg):
     """Callback wywoływany przy nowej wiadomości MQTT (REAL-TIME!)"""
     try:
-        payload = json.loads(msg.payload.decode('utf-8'))
-        station_id = payload.get('station_id')
-        
-        # Sprawdź czy stacja jest w mapowaniu
-        if station_id in STATION_ID_TO_INDEX:
-            station_index = STATION_ID_TO_INDEX[station_id]
-            
-            # Oznacz stację jako aktywną (wyłączy symulację)
-            active_real_stations.add(station_index)
-            
-            # Pobierz dane
-            t1 = payload.get('temp_ds18b20')
-            t2 = payload.get('temp_bme280')
-            hu = payload.get('humidity')
-            wi = payload.get('wiatr')
-            fa = payload.get('frost_alert', 0)  # Domyślnie 0 (brak alarmu)
-            
-            # Konwersja None -> 0.0
-            if t1 is None: t1 = 0.0
-            if t2 is None: t2 = 0.0
-            if hu is None: hu = 0.0
-            if wi is None: wi = 0.0
-            if fa is None: fa = 0
-            
-            # Konwersja wiatru z m/s na km/h
-            wi_kmh = float(wi) * 3.6
-            
-            # Aktualizacja danych
-            station_names = {0:"Stacja 2 (S)", 1:"Stacja 3 (S)", 2:"Stacja 4 (S)", 3:"Stacja 5 (S)", 4:"Pi 4", 5:"Pi Zero", 6:"Stacja 6 (S)", 7:"Stacja 7 (S)"}
-            station_name = station_names.get(station_index, f"Stacja {station_index}")
-            print(f"MQTT -> {station_name} (ID={station_id}): T1={t1}, T2={t2}, Hu={hu}, Wi={wi_kmh:.1f}km/h, FA={fa}")
-            update_data(station_index, round(float(t1), 2), round(float(t2), 2), round(float(hu), 2), round(wi_kmh, 1), int(fa))
+        if msg.topic == TEMAT_AWARII:
+            przyjmij_awarie(json.loads(msg.payload.decode('utf-8')))
+            return
+        if MQTT_JSON:
+            pomiar = Pomiar.z_slownika(json.loads(msg.payload.decode('utf-8')))
         else:
-            print(f"Nieznane station_id: {station_id}")
-            
+            pomiar = Pomiar.dekoduj(msg.payload)
+        przyjmij_pomiar(pomiar)
     except Exception as e:
         print(f"Blad MQTT message: {e}")
 
-# === WĄTEK 1: SYMULACJA (Dla stacji wirtualnych) ===
-def simulation_thread():
-    """Generuje losowe dane dla stacji SymX (przywrócona funkcjonalność)"""
-    print("Start symulacji dla stacji wirtualnych...")
-    while True:
-        for idx in SIMULATION_INDICES:
-            # Pomiń stacje, które wysyłają prawdziwe dane przez MQTT
-            if idx in active_real_stations:
-                continue
-                
-            # Generowanie losowych wartości
-            t1 = round(random.uniform(5, 25), 2)
-            t2 = round(random.uniform(5, 25), 2)
-            hu = round(random.uniform(40, 95), 2)
-            wi_ms = random.uniform(0, 15)  # Wiatr 0-15 m/s
-            wi_kmh = round(wi_ms * 3.6, 1)  # Konwersja na km/h
-            fa = random.choice([0, 0, 0, 1])  # 25% szans na alarm
-            
-            update_data(idx, t1, t2, hu, wi_kmh, fa)
-        
-        # Symulacja aktualizuje się co 10 sekund
-        time.sleep(10)
-
-# === WĄTEK 2: MQTT SUBSCRIBER (Real-time dla Pi Zero) ===
-def mqtt_subscriber_thread():
+# === WĄTEK MQTT SUBSCRIBER (Real-time dla Pi Zero) ===
+def mqtt_subscriber_thread(tematy=(MQTT_TOPIC, TEMAT_AWARII)):
     """Subskrybuje MQTT i odbiera dane w czasie rzeczywistym"""
-    mqtt_client = mqtt.Client()
+    mqtt_client = mqtt.Client(userdata=tematy)
     mqtt_client.on_connect = on_mqtt_connect
     mqtt_client.on_message = on_mqtt_message
     
@@ -171,52 +273,277 @@ def mqtt_subscriber_thread():
     except Exception as e:
         print(f"Blad polaczenia MQTT: {e}")
 
+# === TRYB ZINTEGROWANY: ODBIORNIK LORA W TYM SAMYM PROCESIE ===
+def ingest_thread(kolejka):
+    """Przyjmuje odczyty z odbiornika przez kolejkę w pamięci (bez brokera)"""
+    while True:
+        pomiar = kolejka.get()
+        try:
+            przyjmij_pomiar(pomiar)
+        except Exception as e:
+            print(f"Blad przyjecia pomiaru: {e}")
+
+def odbiornik_thread(kolejka, publikuj_mqtt):
+    """
+    Pętla radia z odbiornik_v7.py - to samo przetwarzanie ramek co w trybie
+    osobnych procesów. Odczyty trafiają do kolejki, a MQTT (gdy włączone)
+    jest tylko dodatkowym ujściem, np. dla Telegrafa/InfluxDB.
+    """
+    import odbiornik_v7 as odbiornik
+
+    silnik_alarmow = odbiornik.SilnikAlarmow.z_pliku(odbiornik.PLIK_ALARMOW)
+    stan_odbiornika = odbiornik.StanOdbiornika(odbiornik.historia_pomiarow, silnik_alarmow,
+                                                odbiornik.detektor_awarii)
+    stan_odbiornika.zaladuj()
+    klient = odbiornik.polacz_mqtt() if publikuj_mqtt else None
+    radia, konfiguracja = odbiornik.wybierz_radia(sys.argv)
+    if not radia:
+        print("LoRa: inicjalizacja nieudana")
+        return
+
+    def obsluga(pomiar):
+        kolejka.put(pomiar)
+        if klient is not None:
+            odbiornik.publikuj_mqtt(klient, pomiar)
+
+    def awaria(zdarzenie):
+        przyjmij_awarie(zdarzenie)
+        if klient is not None:
+            odbiornik.publikuj_awarie(klient, zdarzenie)
+
+    odbiornik.detektor_awarii.sluchacz = awaria
+
+    odbiornik.petla_wielu_radii(radia, silnik_alarmow, obsluga,
+                                odbiornik.ArchiwumRamek(odbiornik.KATALOG_ARCHIWUM), stan_odbiornika,
+                                konfiguracja)
+
 # === TRASY FLASK (Bez zmian) ===
 POINT_MAPPING = {
     "Stacja_2_(S)": 0, "Stacja_3_(S)": 1, "Stacja_4_(S)": 2, "Stacja_5_(S)": 3,
     "Pi_4": 4, "Pi_Zero": 5, "Stacja_6_(S)": 6, "Stacja_7_(S)": 7
 }
 
+def strona(szablon, **kontekst):
+    """Renderuje szablon raz i serwuje z pamięci (ETag + gzip)"""
+    klucz = (szablon, tuple(sorted(kontekst.items())))
+    wpis = _cache_stron.get(klucz)
+    if wpis is None:
+        dane = render_template(szablon, **kontekst).encode('utf-8')
+        etag = hashlib.sha256(dane).hexdigest()[:16]
+        wpis = (dane, etag, kompresuj(dane))
+        _cache_stron[klucz] = wpis
+    return odpowiedz_http(wpis[0], 'text/html', wpis[1], warianty=wpis[2])
+
+def zakoduj_odpowiedz(dane):
+    """Obiekt JSON lub gotowe bajty -> (bajty, warianty skompresowane)"""
+    if not isinstance(dane, bytes):
+        dane = json.dumps(dane).encode('utf-8')
+    return dane, kompresuj(dane)
+
+def odpowiedz_migawki(obiekt, klucz, etag, budowanie, typ='application/json'):
+    """Odpowiedź zapamiętana w niezmiennej migawce - kodowana raz na wersję"""
+    dane, warianty = obiekt.pochodna(klucz, lambda: zakoduj_odpowiedz(budowanie()))
+    return odpowiedz_http(dane, typ, etag, warianty=warianty)
+
+def wiersze_historii(key, historia, since):
+    """
+    Odczyty stacji z seq > since jako [(seq, ts, t1, t2, hu, wi, fa)].
+    Gdy kursor mieści się w buforze w pamięci - bez zapytania do bazy.
+    """
+    wiersze = historia.wiersze
+    if since is None:
+        return list(wiersze)
+    if wiersze and since >= wiersze[0][0] - 1:
+        return [w for w in wiersze if w[0] > since]
+    return magazyn.od_kursora(int(key), since, LIMIT_ODPOWIEDZI_HISTORII)
+
 @app.route("/")
 def index():
-    return render_template('index.html')
+    return strona('index.html')
 
 @app.route("/<point_name>", methods=['GET'])
 def point_details(point_name):
     if point_name not in POINT_MAPPING: return "Not found", 404
     idx = POINT_MAPPING[point_name]
-    return render_template('point.html', point_name=point_name.replace("_", " "), point_index=idx)
+    return strona('point.html', point_name=point_name.replace("_", " "), point_index=idx)
+
+@app.route("/zasoby/<skrot>/<nazwa>")
+def zasob_statyczny(skrot, nazwa):
+    odp = mapa_zasobow.odpowiedz(skrot, nazwa)
+    if odp is None: return "Not found", 404
+    return odp
+
+def historia_zdecymowana(key, od_ts, do_ts, punkty):
+    """
+    Seria z magazynu dla zakresu czasu zredukowana LTTB do `punkty` punktów
+    na każde pole. Odczyty z alarmem przymrozkowym (Fa) zawsze zostają.
+    Wynik: {'T1': {'Ts': [...], 'Y': [...]}, ..., 'Fa': [ts alarmów]}
+    """
+    wiersze = magazyn.zakres(int(key), od_ts, do_ts)
+    alarmy = [w[1] for w in wiersze if w[6]]
+    wynik = {'Fa': alarmy, 'kursor': max((w[0] for w in wiersze), default=0)}
+    for i, pole in enumerate(POLA[:-1], start=2):
+        # Pomijamy brakujące wartości, indeksy alarmów liczone w przefiltrowanej serii
+        seria = [(w[1], w[i], w[6]) for w in wiersze if w[i] is not None]
+        xs = [p[0] for p in seria]
+        ys = [p[1] for p in seria]
+        wymuszone = [j for j, p in enumerate(seria) if p[2]]
+        xs, ys = decymuj(xs, ys, punkty, wymuszone)
+        wynik[pole] = {'Ts': xs, 'Y': ys}
+    return wynik
 
 @app.route("/api/history/<int:point_index>")
 def get_history(point_index):
+    """
+    Historia stacji. Parametry:
+      since=<seq>  - tylko odczyty nowsze niż kursor (przyrostowa synchronizacja)
+      format=bin   - kolumny binarne (typed arrays) zamiast JSON
+      format=kodek - skompresowane bloki kodeka (kodek.py), ~6 B na odczyt
+      punkty=<N>   - seria z magazynu zdecymowana LTTB do N punktów,
+                     zakres od=<ts>&do=<ts> (unix, domyślnie cała historia)
+    """
     key = str(point_index)
-    if key not in historical_values: return jsonify({'T1':[], 'T2':[], 'Hu':[], 'Wi':[], 'Fa':[]})
-    return jsonify({
-        'T1': list(historical_values[key]['T1']),
-        'T2': list(historical_values[key]['T2']),
-        'Hu': list(historical_values[key]['Hu']),
-        'Wi': list(historical_values[key]['Wi']),
-        'Fa': list(historical_values[key]['Fa'])
-    })
+    historia = stan.migawka().historie.get(key)
+    if historia is None: return jsonify({'T1':[], 'T2':[], 'Hu':[], 'Wi':[], 'Fa':[], 'Ts':[], 'Seq':[], 'kursor':0})
+    wersja = historia.wersja
+    punkty = request.args.get('punkty', type=int)
+    if punkty:
+        punkty = max(3, min(punkty, MAX_PUNKTOW_WYKRESU))
+        od_ts = request.args.get('od', 0.0, type=float)
+        do_ts = request.args.get('do', float('inf'), type=float)
+        klucz = (key, od_ts, do_ts, punkty, wersja)
+        wpis = cache_decymacji.pobierz(klucz)
+        if wpis is None:
+            dane = json.dumps(historia_zdecymowana(key, od_ts, do_ts, punkty)).encode('utf-8')
+            wpis = (dane, kompresuj(dane))
+            cache_decymacji.zapisz(klucz, wpis)
+        return odpowiedz_http(wpis[0], 'application/json', f"d{key}:{od_ts}:{do_ts}:{punkty}-{wersja}",
+                              warianty=wpis[1])
+    since = request.args.get('since', type=int)
+    format_ = request.args.get('format')
+    binarny = format_ in ('bin', 'kodek')
+
+    def budowanie():
+        wiersze = wiersze_historii(key, historia, since)
+        kursor = wiersze[-1][0] if wiersze else (since or 0)
+        if format_ == 'kodek':
+            return koduj_serie(wiersze, kursor, point_index)
+        if binarny:
+            return koduj_kolumnowo(wiersze, kursor)
+        kolumny = dict(zip(('Seq', 'Ts') + POLA, map(list, zip(*wiersze)))) if wiersze else \
+            {pole: [] for pole in ('Seq', 'Ts') + POLA}
+        kolumny['kursor'] = kursor
+        return kolumny
+
+    typ = 'application/octet-stream' if binarny else 'application/json'
+    etag = f"h{key}:{since}:{format_ if binarny else 'json'}-{wersja}"
+    if since is None:
+        return odpowiedz_migawki(historia, ('h', format_ if binarny else None), etag, budowanie, typ)
+    dane, warianty = zakoduj_odpowiedz(budowanie())
+    return odpowiedz_http(dane, typ, etag, warianty=warianty)
+
+@app.route("/api/export")
+def export_history():
+    """
+    Strumieniowy eksport historii z magazynu. Parametry:
+      stacje=0,5   - indeksy stacji (domyślnie wszystkie)
+      od=<ts>&do=<ts> - zakres czasu (unix, domyślnie cała historia)
+      format=csv | ndjson | kodek | parquet (parquet gdy zainstalowany pyarrow)
+    """
+    format_ = request.args.get('format', 'csv')
+    if format_ not in FORMATY:
+        return jsonify({'blad': f"nieobslugiwany format, dostepne: {', '.join(FORMATY)}"}), 400
+    try:
+        stacje = [int(s) for s in request.args.get('stacje', ','.join(map(str, range(8)))).split(',') if s]
+    except ValueError:
+        return jsonify({'blad': 'stacje: lista indeksow, np. 0,5'}), 400
+    od_ts = request.args.get('od', 0.0, type=float)
+    do_ts = request.args.get('do', float('inf'), type=float)
+    generator, typ, rozszerzenie = FORMATY[format_]
+    odp = Response(generator(magazyn.porcje(stacje, od_ts, do_ts)), mimetype=typ)
+    odp.headers['Content-Disposition'] = f'attachment; filename="historia.{rozszerzenie}"'
+    odp.headers['Cache-Control'] = 'no-store'
+    return odp
 
 @app.route("/api/values")
 def get_values():
-    return jsonify(latest_values)
+    migawka = stan.migawka()
+    return odpowiedz_migawki(migawka, 'v', f"v-{migawka.wersja}",
+                             lambda: migawka.json_wartosci().encode('utf-8'))
+
+@app.route("/api/stations/status")
+def get_stations_status():
+    """Stan stacji: ok/opozniona/offline, wiek ostatniej ramki, zgubione ramki, RSSI/SNR"""
+    odp = jsonify(monitor.migawka())
+    odp.headers['Cache-Control'] = 'no-store'
+    return odp
+
+@app.route("/api/stations/faults")
+def get_station_faults():
+    """
+    Awarie czujników: aktywne i ostatnie zdarzenia (najnowsze pierwsze).
+      stacja=<id>  - tylko jedna stacja (ID z ramki LoRa, np. 01)
+    """
+    odp = jsonify(rejestr_awarii.migawka(request.args.get('stacja')))
+    odp.headers['Cache-Control'] = 'no-store'
+    return odp
 
 @socketio.on('connect')
 def handle_connect():
-    emit('values_update', latest_values)
+    emit('values_update', SurowyJSON(stan.migawka().json_wartosci()))
+    emit('station_status', SurowyJSON(json.dumps(monitor.migawka())))
+    rozsylacz.dodaj_klienta(request.sid)
 
-if __name__ == "__main__":
-    # Uruchamiamy WĄTEK SYMULACJI (dla Sym1, Sym2...)
-    t_sim = threading.Thread(target=simulation_thread, daemon=True)
-    t_sim.start()
+@socketio.on('disconnect')
+def handle_disconnect():
+    rozsylacz.usun_klienta(request.sid)
 
-    # Uruchamiamy WĄTEK MQTT SUBSCRIBER (dla Pi Zero - REAL-TIME)
-    t_mqtt = threading.Thread(target=mqtt_subscriber_thread, daemon=True)
-    t_mqtt.start()
+if __name__ == "__main__":
+    if PISARZ and LICZBA_WORKEROW > 1:
+        szyna = klaster.SzynaOdczytow(MQTT_BROKER, MQTT_PORT)
+        klaster.uruchom_workery(sys.argv, LICZBA_WORKEROW)
+        print(f"Pisarz + {LICZBA_WORKEROW - 1} workerow, porty "
+              + ", ".join(str(klaster.port_workera(klaster.PORT_WWW, k)) for k in range(LICZBA_WORKEROW)))
+    if not PISARZ:
+        # Worker: bez MQTT odbiornika i radia - odczyty od pisarza przez szynę
+        # Awarie czujników też od pisarza - w trybie zintegrowanym bez --mqtt
+        # nie ma ich na lora/awarie
+        szyna = klaster.SzynaOdczytow(MQTT_BROKER, MQTT_PORT, odbior=przyjmij_z_szyny,
+                                      po_polaczeniu=zaladuj_z_magazynu, odbior_awarii=rejestr_awarii.dodaj)
+        print(f"Worker {NUMER_WORKERA}: odczyty z szyny {klaster.TEMAT_SZYNY}")
+    elif TRYB_ZINTEGROWANY:
+        # Odbiornik LoRa w tym procesie - pomiary przez kolejkę, bez brokera MQTT
+        kolejka_pomiarow = queue.Queue()
+        threading.Thread(target=ingest_thread, args=(kolejka_pomiarow,), daemon=True).start()
+        threading.Thread(target=odbiornik_thread, args=(kolejka_pomiarow, '--mqtt' in sys.argv),
+                         daemon=True).start()
+        print("Tryb zintegrowany: odbiornik LoRa w procesie serwera"
+              + (" (+ publikacja MQTT)" if '--mqtt' in sys.argv else ""))
+    else:
+        # Uruchamiamy WĄTEK MQTT SUBSCRIBER (dla Pi Zero - REAL-TIME)
+        t_mqtt = threading.Thread(target=mqtt_subscriber_thread, daemon=True)
+        t_mqtt.start()
+        print(f"Real-time MQTT: Wszystkie stacje ID 01-07 ({MQTT_TOPIC})")
+    socketio.start_background_task(zywotnosc_thread)
     
-    print("Serwer WWW startuje na porcie 5000...")
-    print("Real-time MQTT: Wszystkie stacje ID 01-07 (lora/pogoda)")
-    print("Stacje bez danych MQTT: czekaja na pomiary...")
-    socketio.run(app, host="0.0.0.0", port=5000, debug=False, allow_unsafe_werkzeug=True)
+    diagnostyka.z_argumentow(sys.argv, klaster.port_workera(PORT_DIAGNOSTYKI, NUMER_WORKERA), {
+        'klienci_socketio': rozsylacz.statystyki,
+        'sesje_engineio': lambda: len(socketio.server.eio.sockets),
+        'wersja_migawki': lambda: stan.migawka().wersja,
+        'powtorzone_pomiary': lambda: licznik_powtorzen[0],
+        'cache_stron': lambda: len(_cache_stron),
+        'cache_decymacji': lambda: len(cache_decymacji),
+        'eksport_influx': lambda: eksport.statystyki() if eksport is not None else None,
+        'zywotnosc': monitor.statystyki,
+        'szyna_workerow': lambda: szyna.statystyki() if szyna is not None else None,
+        'magazyn': magazyn.statystyki,
+        'awarie_czujnikow': lambda: len(rejestr_awarii.aktywne),
+    })
+
+    print(f"Serwer WWW startuje na porcie {PORT_WWW}...")
+    print("Stacje bez danych: czekaja na pomiary...")
+    if TRYB_PRODUKCYJNY:
+        print("Tryb produkcyjny: serwer eventlet")
+        socketio.run(app, host="0.0.0.0", port=PORT_WWW, debug=False)
+    else:
+        socketio.run(app, host="0.0.0.0", port=PORT_WWW, debug=False, allow_unsafe_werkzeug=True)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+# Generator obciążenia - tysiące wirtualnych stacji przymrozkowych.
+# Każda stacja ma własny mikroklimat: dobowy przebieg temperatury (sinus w dzień,
+# wykładnicze wychłodzenie radiacyjne w nocy - silniejsze przy bezchmurnym niebie
+# i ciszy), inwersję przy gruncie (DS18B20 zimniejszy od BME280 w spokojne noce),
+# wilgotność z punktu rosy, wiatr z przebiegiem dobowym i porywami oraz braki:
+# zgubione ramki, chwilowe awarie czujników i dłuższe wyłączenia stacji.
+#
+# Tryby wysyłki:
+#   radio - zakodowane ramki LoRa (ramka.py) jako datagramy UDP do odbiornika
+#           z udawanym radiem:  python3 odbiornik_v7.py --radio-udp 1700 --cicho
+#   mqtt  - ramki przechodzą przez przetworz_ramke() odbiornika (ta sama logika)
+#           i trafiają na lora/pogoda(/bin) jak z prawdziwego odbiornika
+#
+# Przykład: 2000 stacji, doba symulacji w 24 minuty (60x):
+#   python3 generator_stacji.py --stacje 2000 --przyspieszenie 60 --tryb radio
+# Kilka kanałów (udawane radia "udp" w radia.json, odbiornik z --radia radia.json):
+#   python3 generator_stacji.py --stacje 2000 --przyspieszenie 60 --radia radia.json
+#
+# Pierwsze stacje mają ID 01-07, więc trafiają też na stronę serwera WWW.
+
+import math
+import time
+import heapq
+import random
+import socket
+import argparse
+
+from ramka import koduj_ramke, INTERWAL_WYSYLANIA
+from radio_udp import pakiet_udp, adres_udp
+
+# Dwuznakowe ID w ramce: 62 * 62 = 3844 stacji
+ALFABET_ID = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+MAKS_STACJI = len(ALFABET_ID) ** 2 - 1
+
+PROBKI_W_OKNIE = 10           # INTERWAL_WYSYLANIA / INTERWAL_PROBEK stacji
+WSCHOD, ZACHOD = 6.0, 18.0    # [h] uproszczone - bez pory roku
+GODZINA_MAKSIMUM = 14.0
+INTERWAL_RAPORTU = 10.0       # [s] rzeczywistego czasu
+PLIK_DZIENNIKA_MQTT = "dziennik_generatora.db"
+
+
+def id_stacji(numer):
+    return ALFABET_ID[numer // len(ALFABET_ID)] + ALFABET_ID[numer % len(ALFABET_ID)]
+
+
+def dzien_lokalny(t):
+    """Numer kolejnego dnia (czas lokalny) - ciągły także na przełomie roku"""
+    r, m, d = time.localtime(t)[:3]
+    return int(time.mktime((r, m, d, 12, 0, 0, 0, 0, -1)) // 86400)
+
+
+def punkt_rosy_do_wilgotnosci(temp, punkt_rosy):
+    """Wilgotność względna [%] ze wzoru Magnusa"""
+    a, b = 17.62, 243.12
+    return 100.0 * math.exp(a * punkt_rosy / (b + punkt_rosy) - a * temp / (b + temp))
+
+
+class WirtualnaStacja:
+    """
+    Mikroklimat jednej stacji. Pogoda dnia (zachmurzenie nocy, wiatr,
+    przesunięcie synoptyczne) jest deterministyczna dla (ziarno, dzień),
+    więc temperatura jest ciągłą funkcją czasu i nie zależy od tempa wysyłki.
+    """
+    def __init__(self, numer, ziarno, srednia, amplituda):
+        los = random.Random(ziarno * 100003 + numer)
+        self.numer = numer
+        self.id = id_stacji(numer)
+        self.ziarno_wspolne = ziarno
+        self.ziarno = ziarno * 100003 + numer
+        self.srednia = srednia + los.gauss(0.0, 1.0)
+        self.amplituda = max(4.0, amplituda + los.gauss(0.0, 1.5))
+        self.niecka = -abs(los.gauss(0.0, 1.0))       # zastoisko zimnego powietrza
+        self.wietrznosc = max(0.3, los.gauss(1.0, 0.3))
+        self.los = los
+        self.offline_do = 0.0
+        self._pogoda = {}
+
+    def pogoda(self, dzien):
+        p = self._pogoda.get(dzien)
+        if p is None:
+            los = random.Random(self.ziarno * 7919 + dzien)
+            # Wspólny dla wszystkich stacji układ synoptyczny + lokalny szum
+            wspolny = random.Random(self.ziarno_wspolne * 7919 + dzien)
+            zachmurzenie = min(1.0, max(0.0, wspolny.random() + los.gauss(0.0, 0.1)))
+            wiatr = max(0.0, wspolny.gauss(8.0, 4.0) * self.wietrznosc + los.gauss(0.0, 1.0))  # km/h
+            przesuniecie = wspolny.gauss(0.0, 2.5)
+            cisza = math.exp(-wiatr / 7.0)
+            tmax = self.srednia + przesuniecie + self.amplituda / 2
+            # Noc po dniu `dzien`: wychłodzenie radiacyjne zależy od nieba i wiatru
+            tmin_rano = self.srednia + przesuniecie - self.amplituda / 2 \
+                - 5.0 * (1.0 - zachmurzenie) * cisza + self.niecka * cisza
+            tau = 2.0 + 5.0 * zachmurzenie + 3.0 * (1.0 - cisza)
+            p = (zachmurzenie, wiatr, cisza, tmax, tmin_rano, tau)
+            if len(self._pogoda) > 4:
+                self._pogoda.clear()
+            self._pogoda[dzien] = p
+        return p
+
+    def temperatura(self, t):
+        """
+        (temperatura powietrza 2 m, inwersja przy gruncie, wiatr średni [km/h],
+        minimum bieżącej/ostatniej nocy) w chwili t
+        """
+        lokalny = time.localtime(t)
+        godzina = lokalny.tm_hour + lokalny.tm_min / 60.0 + lokalny.tm_sec / 3600.0
+        dzien = dzien_lokalny(t)
+        if WSCHOD <= godzina < ZACHOD:
+            _, wiatr, _, tmax, _, _ = self.pogoda(dzien)
+            tmin = self.pogoda(dzien - 1)[4]
+            temp = tmin + (tmax - tmin) * math.sin(math.pi * (godzina - WSCHOD) / (2 * (GODZINA_MAKSIMUM - WSCHOD)))
+            wiatr *= 0.6 + 0.8 * math.sin(math.pi * (godzina - WSCHOD) / (ZACHOD - WSCHOD))
+            return temp, -0.3, wiatr, tmin
+        # Noc: od zachodu dnia d do wschodu dnia d+1
+        d = dzien if godzina >= ZACHOD else dzien - 1
+        n = godzina - ZACHOD if godzina >= ZACHOD else godzina + 24.0 - ZACHOD
+        zachmurzenie, wiatr, cisza, tmax, tmin, tau = self.pogoda(d)
+        poprzedni_tmin = self.pogoda(d - 1)[4]
+        dlugosc = 24.0 - ZACHOD + WSCHOD
+        t_zachod = poprzedni_tmin + (tmax - poprzedni_tmin) * math.sin(
+            math.pi * (ZACHOD - WSCHOD) / (2 * (GODZINA_MAKSIMUM - WSCHOD)))
+        koniec = math.exp(-dlugosc / tau)
+        temp = tmin + (t_zachod - tmin) * (math.exp(-n / tau) - koniec) / (1.0 - koniec)
+        inwersja = 2.5 * (1.0 - zachmurzenie) * cisza * min(1.0, n / 2.0)
+        return temp, inwersja, wiatr * 0.6, tmin
+
+    def ramka(self, t, braki):
+        """Odczyt z okna [t - INTERWAL_WYSYLANIA, t] zakodowany jak na stacji"""
+        los = self.los
+        ds, bme, wiatry = [], [], []
+        for i in range(PROBKI_W_OKNIE):
+            temp, inwersja, wiatr, _ = self.temperatura(t - INTERWAL_WYSYLANIA * (PROBKI_W_OKNIE - 1 - i) / PROBKI_W_OKNIE)
+            bme.append(temp + los.gauss(0.0, 0.08))
+            ds.append(temp - inwersja + los.gauss(0.0, 0.06))
+            wiatry.append(max(0.0, wiatr * los.lognormvariate(0.0, 0.35)))
+        # Powietrze nad sadem jest blisko nasycenia o świcie - punkt rosy ~ minimum nocy
+        temp, _, _, tmin = self.temperatura(t)
+        wilgotnosc = min(100.0, max(15.0, punkt_rosy_do_wilgotnosci(temp, tmin + 1.0) + los.gauss(0.0, 2.0)))
+
+        def statystyki(wartosci):
+            sr = sum(wartosci) / len(wartosci)
+            sd = math.sqrt(sum((x - sr) ** 2 for x in wartosci) / (len(wartosci) - 1))
+            return sr, (min(wartosci), max(wartosci), sd)
+
+        sr_ds, stat_ds = statystyki(ds)
+        sr_bme, stat_bme = statystyki(bme)
+        wiatr = sum(wiatry) / len(wiatry)
+        poryw = max(wiatry) * los.uniform(1.2, 1.8)
+        zmiennosc = math.sqrt(sum((w - wiatr) ** 2 for w in wiatry) / (len(wiatry) - 1))
+        if los.random() < braki:
+            sr_ds, stat_ds = None, (None, None, None)
+        if los.random() < braki:
+            sr_bme, stat_bme, wilgotnosc = None, (None, None, None), None
+        return koduj_ramke(self.id, sr_ds, sr_bme, wilgotnosc, PROBKI_W_OKNIE, wiatr, poryw, zmiennosc,
+                           stat_ds, stat_bme, czas=t)
+
+
+def jakosc_lacza(stacja):
+    """Losowe (RSSI, SNR) odbioru ramki stacji"""
+    rssi = -80.0 - 40.0 * stacja.los.random()
+    return rssi, 10.0 + (rssi + 80.0) / 4.0
+
+
+class UjscieRadio:
+    """
+    Ramki jako datagramy UDP do odbiornika z RadioUDP. Z konfiguracją radiów
+    (kanaly.py) każda stacja nadaje do udawanego radia swojego kanału.
+    """
+    def __init__(self, adres, konfiguracja=None):
+        self.adres = adres
+        self.konfiguracja = konfiguracja
+        self._adresy = {}
+        self._gniazdo = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _adres_stacji(self, stacja):
+        adres = self._adresy.get(stacja.id)
+        if adres is None:
+            radio = self.konfiguracja.radio_stacji(stacja.id) if self.konfiguracja else None
+            adres = self._adresy[stacja.id] = adres_udp(radio.udp) if radio and radio.udp else self.adres
+        return adres
+
+    def wyslij(self, stacja, dane, t):
+        self._gniazdo.sendto(pakiet_udp(dane, *jakosc_lacza(stacja)), self._adres_stacji(stacja))
+
+
+class UjscieMQTT:
+    """Ramki przez potok odbiornika na tematy MQTT lora/pogoda (JSON i binarny)"""
+    def __init__(self, broker, port, plik_alarmow):
+        import odbiornik_v7 as odbiornik
+
+        self.odbiornik = odbiornik
+        self.silnik = odbiornik.SilnikAlarmow.z_pliku(plik_alarmow, powiadomienia=False)
+        # Osobny dziennik - zaległości generatora nie mieszają się z odbiornikiem
+        self.klient = odbiornik.polacz_mqtt(broker, port, PLIK_DZIENNIKA_MQTT)
+
+    def wyslij(self, stacja, dane, t):
+        # Czas symulacji bez obcinania do sekund - przy --interwal poniżej
+        # sekundy kolejne ramki stacji miałyby ten sam ts i serwer by je odrzucił
+        pomiar = self.odbiornik.przetworz_ramke(dane, t, self.silnik)
+        if pomiar:
+            pomiar.rssi, pomiar.snr = jakosc_lacza(stacja)
+            self.odbiornik.publikuj_mqtt(self.klient, pomiar)
+
+
+def generuj(args):
+    konfiguracja = None
+    if args.radia:
+        from kanaly import KonfiguracjaRadiow
+        # Stacje spoza pliku przydzielone do kanałów tylko na czas symulacji
+        konfiguracja = KonfiguracjaRadiow.z_pliku(args.radia)
+        konfiguracja.przydziel([id_stacji(i) for i in range(1, args.stacje + 1)], args.interwal)
+    ujscie = UjscieRadio(adres_udp(args.cel), konfiguracja) if args.tryb == 'radio' else \
+        UjscieMQTT(args.broker, args.port_mqtt, args.alarmy)
+    start_symulacji = args.start if args.start is not None else time.time()
+    start = time.monotonic()
+
+    def czas_symulacji():
+        return start_symulacji + (time.monotonic() - start) * args.przyspieszenie
+
+    # Kolejka zdarzeń (czas nadania, numer stacji) - fazy rozłożone losowo jak w terenie
+    stacje = [WirtualnaStacja(i, args.ziarno, args.srednia, args.amplituda) for i in range(1, args.stacje + 1)]
+    kolejka = [(start_symulacji + s.los.uniform(0, args.interwal), s.numer) for s in stacje]
+    heapq.heapify(kolejka)
+
+    wyslane = zgubione = offline = 0
+    ostatnio_wyslane = 0
+    nastepny_raport = time.monotonic() + INTERWAL_RAPORTU
+    koniec = time.monotonic() + args.czas if args.czas else None
+    print(f"{args.stacje} stacji, co {args.interwal} s czasu symulacji, przyspieszenie {args.przyspieszenie}x "
+          f"-> {args.stacje * args.przyspieszenie / args.interwal:.1f} ramek/s, tryb {args.tryb}")
+    while koniec is None or time.monotonic() < koniec:
+        teraz = czas_symulacji()
+        while kolejka and kolejka[0][0] <= teraz:
+            t, numer = heapq.heappop(kolejka)
+            stacja = stacje[numer - 1]
+            # Nadawanie z lekkim rozrzutem zegara stacji
+            heapq.heappush(kolejka, (t + args.interwal + stacja.los.uniform(-2.0, 2.0), numer))
+            if t < stacja.offline_do:
+                offline += 1
+                continue
+            if stacja.los.random() < args.wylaczenia:
+                stacja.offline_do = t + stacja.los.uniform(1800, 6 * 3600)
+                offline += 1
+                continue
+            if stacja.los.random() < args.utrata:
+                zgubione += 1
+                continue
+            ujscie.wyslij(stacja, stacja.ramka(t, args.braki), t)
+            wyslane += 1
+        if time.monotonic() >= nastepny_raport:
+            nastepny_raport += INTERWAL_RAPORTU
+            print(f"[{time.strftime('%Y-%m-%d %H:%M', time.localtime(teraz))}] wyslane {wyslane} "
+                  f"({(wyslane - ostatnio_wyslane) / INTERWAL_RAPORTU:.1f}/s), zgubione {zgubione}, "
+                  f"pominiete (stacja wylaczona) {offline}")
+            ostatnio_wyslane = wyslane
+        if kolejka:
+            time.sleep(min(0.05, max(0.0, (kolejka[0][0] - czas_symulacji()) / args.przyspieszenie)))
+    czas = time.monotonic() - start
+    print(f"Koniec: wyslane {wyslane} ramek w {czas:.0f} s ({wyslane / czas:.1f}/s), zgubione {zgubione}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generator obciazenia - wirtualne stacje przymrozkowe")
+    parser.add_argument('--stacje', type=int, default=100)
+    parser.add_argument('--tryb', choices=('radio', 'mqtt'), default='radio')
+    parser.add_argument('--cel', default='127.0.0.1:1700', help="adres radia UDP odbiornika")
+    parser.add_argument('--radia', default=None,
+                        help="plik radiow (kanaly.py) - stacje nadaja do radia UDP swojego kanalu")
+    parser.add_argument('--broker', default='127.0.0.1')
+    parser.add_argument('--port-mqtt', type=int, default=1883)
+    parser.add_argument('--alarmy', default='alarmy.json', help="reguly alarmow dla trybu mqtt")
+    parser.add_argument('--interwal', type=float, default=INTERWAL_WYSYLANIA, help="[s] miedzy ramkami stacji")
+    parser.add_argument('--przyspieszenie', type=float, default=1.0, help="sekund symulacji na sekunde")
+    parser.add_argument('--start', type=float, default=None, help="unix ts poczatku symulacji (domyslnie teraz)")
+    parser.add_argument('--czas', type=float, default=None, help="[s] czasu rzeczywistego (domyslnie bez konca)")
+    parser.add_argument('--srednia', type=float, default=6.0, help="srednia temperatura dobowa [C]")
+    parser.add_argument('--amplituda', type=float, default=10.0, help="dobowa amplituda temperatury [C]")
+    parser.add_argument('--utrata', type=float, default=0.02, help="prawdopodobienstwo zgubienia ramki")
+    parser.add_argument('--braki', type=float, default=0.005, help="prawdopodobienstwo braku odczytu czujnika")
+    parser.add_argument('--wylaczenia', type=float, default=0.0005, help="szansa wylaczenia stacji na ramke")
+    parser.add_argument('--ziarno', type=int, default=1)
+    args = parser.parse_args()
+    if not 1 <= args.stacje <= MAKS_STACJI:
+        parser.error(f"--stacje: 1..{MAKS_STACJI} (dwuznakowe ID w ramce)")
+    try:
+        generuj(args)
+    except KeyboardInterrupt:
+        print("\nZatrzymano generator")
+
+
+if __name__ == "__main__":
+    main()
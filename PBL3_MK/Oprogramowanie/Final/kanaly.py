@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+# Odbiornik z kilkoma modułami SX1262 - każdy na własnym kanale (częstotliwość,
+# SF, BW), z własnymi pinami i w osobnym wątku. Jeden kanał to twardy sufit
+# przepustowości sieci (planer_lora.py), N kanałów daje ~N razy więcej stacji.
+#
+# Konfiguracja radia.json - odbiornik bierze z niej radia, generator kanały
+# stacji, a stacja (kod_zero.py, kopia pliku na Pi Zero) swój kanał z "stacje":
+#   {"radia": [
+#      {"nazwa": "r0", "czestotliwosc": 868100000, "sf": 7, "bw": 125000,
+#       "piny": {"cs": 8, "reset": 22, "busy": 17, "dio1": 25, "rxen": 5, "txen": 6}, "spi": [0, 0]},
+#      {"nazwa": "r1", "czestotliwosc": 868300000, "sf": 7, "bw": 125000,
+#       "piny": {"cs": 7, "reset": 23, "busy": 24, "dio1": 26, "rxen": 12, "txen": 13}, "spi": [0, 1]},
+#      {"nazwa": "test", "czestotliwosc": 868500000, "udp": "1701"}],     <- udawane radio UDP
+#    "stacje": {"01": "r0", "02": "r1"}}
+#
+# Ramki ze wszystkich radiów trafiają do ScalaczRamek: krótkie wstrzymanie
+# (OPOZNIENIE_SCALANIA) układa je w kolejności czasu odbioru, a ta sama ramka
+# usłyszana przez dwa radia (np. dwie anteny na jednym kanale) przechodzi raz -
+# z lepszym RSSI. Dalej działa jeden wątek przetwarzania, jak z jednym radiem.
+#
+#   python3 kanaly.py przydziel radia.json --liczba 200   - stacje 01.. na kanały wg obciążenia
+#   python3 kanaly.py test
+
+import json
+import heapq
+import time
+import argparse
+import threading
+from collections import namedtuple, deque
+
+from planer_lora import czas_nadawania
+from ramka import CZESTOTLIWOSC, SF, BW, CR, DLUGOSC_RAMKI, INTERWAL_WYSYLANIA
+
+PLIK_RADIOW = "radia.json"
+OPOZNIENIE_SCALANIA = 0.1   # [s] wstrzymanie ramki na ułożenie kolejności między radiami
+OKNO_DUPLIKATOW = 2.0       # [s] ta sama ramka z innego radia w tym czasie = duplikat
+
+# Piny pierwszego modułu - jak w odbiornik_v7.py
+PINY_DOMYSLNE = {'reset': 22, 'busy': 17, 'dio1': 25, 'rxen': 5, 'txen': 6, 'cs': 8}
+
+Radio = namedtuple('Radio', 'nazwa czestotliwosc sf bw cr piny spi udp')
+Odebrana = namedtuple('Odebrana', 'czas radio dane rssi snr crc_ok')
+
+
+def radio_z_opisu(opis, numer=0):
+    return Radio(opis.get('nazwa', f"r{numer}"), int(opis.get('czestotliwosc', CZESTOTLIWOSC)),
+                 int(opis.get('sf', SF)), int(opis.get('bw', BW)), int(opis.get('cr', CR)),
+                 {**PINY_DOMYSLNE, **opis.get('piny', {})}, tuple(opis.get('spi', (0, 0))),
+                 opis.get('udp'))
+
+
+RADIO_DOMYSLNE = radio_z_opisu({'nazwa': 'radio'})
+
+
+class KonfiguracjaRadiow:
+    """Radia odbiornika i przydział stacji do nich (a więc do kanałów)"""
+    def __init__(self, radia, stacje=None):
+        self.radia = list(radia) or [RADIO_DOMYSLNE]
+        self.stacje = dict(stacje or {})
+        self._po_nazwie = {r.nazwa: r for r in self.radia}
+        nieznane = set(self.stacje.values()) - set(self._po_nazwie)
+        if nieznane:
+            raise ValueError(f"stacje przypisane do nieznanych radiow: {', '.join(sorted(nieznane))}")
+
+    @classmethod
+    def z_pliku(cls, sciezka=PLIK_RADIOW):
+        """Brak pliku = jedno radio z parametrami z ramka.py"""
+        try:
+            with open(sciezka, encoding='utf-8') as f:
+                opis = json.load(f)
+        except FileNotFoundError:
+            return cls([])
+        return cls([radio_z_opisu(r, i) for i, r in enumerate(opis.get('radia', []))], opis.get('stacje'))
+
+    def jako_slownik(self):
+        return {
+            'radia': [{'nazwa': r.nazwa, 'czestotliwosc': r.czestotliwosc, 'sf': r.sf, 'bw': r.bw, 'cr': r.cr,
+                       'piny': r.piny, 'spi': list(r.spi), **({'udp': r.udp} if r.udp else {})}
+                      for r in self.radia],
+            'stacje': dict(sorted(self.stacje.items())),
+        }
+
+    def radio_stacji(self, id_stacji):
+        """Radio (kanał) stacji - nieprzypisana stacja nadaje na pierwszym"""
+        return self._po_nazwie.get(self.stacje.get(id_stacji), self.radia[0])
+
+    def obciazenie(self, interwal=INTERWAL_WYSYLANIA, dlugosc=DLUGOSC_RAMKI):
+        """Obciążenie kanału każdego radia (czas nadawania / interwał) przy obecnym przydziale"""
+        wynik = {r.nazwa: 0.0 for r in self.radia}
+        for stacja in self.stacje.values():
+            r = self._po_nazwie[stacja]
+            wynik[r.nazwa] += czas_nadawania(dlugosc, r.sf, r.bw, r.cr) / interwal
+        return wynik
+
+    def przydziel(self, stacje, interwal=INTERWAL_WYSYLANIA, dlugosc=DLUGOSC_RAMKI):
+        """
+        Przypisuje nieprzypisane stacje do radia z najmniejszym obciążeniem
+        kanału po dodaniu stacji - kanał z wyższym SF "kosztuje" więcej.
+        Zwraca liczbę nowo przypisanych stacji.
+        """
+        obciazenie = self.obciazenie(interwal, dlugosc)
+        koszt = {r.nazwa: czas_nadawania(dlugosc, r.sf, r.bw, r.cr) / interwal for r in self.radia}
+        nowe = 0
+        for stacja in stacje:
+            if stacja in self.stacje:
+                continue
+            nazwa = min(obciazenie, key=lambda n: obciazenie[n] + koszt[n])
+            obciazenie[nazwa] += koszt[nazwa]
+            self.stacje[stacja] = nazwa
+            nowe += 1
+        return nowe
+
+
+class ScalaczRamek:
+    """
+    Ramki z wątków radiów -> jeden strumień w kolejności czasu odbioru.
+    dodaj() woła wątek radia, pobierz() wątek przetwarzania.
+    """
+    def __init__(self, opoznienie=OPOZNIENIE_SCALANIA, okno_duplikatow=OKNO_DUPLIKATOW):
+        self.opoznienie = opoznienie
+        self.okno_duplikatow = okno_duplikatow
+        self._warunek = threading.Condition()
+        self._kopiec = []
+        self._czekajace = {}            # dane -> wpis w kopcu (łączenie duplikatów)
+        self._wydane = {}               # dane -> czas wydania
+        self._kolejnosc_wydanych = deque()
+        self._numer = 0
+        self.odebrane = {}
+        self.duplikaty = {}
+
+    def dodaj(self, czas, radio, dane, rssi=None, snr=None, crc_ok=True):
+        with self._warunek:
+            self.odebrane[radio] = self.odebrane.get(radio, 0) + 1
+            if crc_ok:
+                wpis = self._czekajace.get(dane)
+                if wpis is not None or czas - self._wydane.get(dane, -1e18) < self.okno_duplikatow:
+                    self.duplikaty[radio] = self.duplikaty.get(radio, 0) + 1
+                    # Czekający duplikat - zostaje odbiór z lepszym RSSI
+                    if wpis is not None and rssi is not None and (wpis[2].rssi is None or rssi > wpis[2].rssi):
+                        wpis[2] = wpis[2]._replace(radio=radio, rssi=rssi, snr=snr)
+                    return
+            self._numer += 1
+            wpis = [czas, self._numer, Odebrana(czas, radio, dane, rssi, snr, crc_ok)]
+            heapq.heappush(self._kopiec, wpis)
+            if crc_ok:
+                self._czekajace[dane] = wpis
+            self._warunek.notify()
+
+    def pobierz(self, limit_czasu=1.0, teraz=None):
+        """Ramki gotowe do przetworzenia (wstrzymane >= opoznienie), czeka do limit_czasu"""
+        koniec = time.time() + limit_czasu
+        with self._warunek:
+            while True:
+                teraz_ = time.time() if teraz is None else teraz
+                if self._kopiec and self._kopiec[0][0] + self.opoznienie <= teraz_:
+                    return self._wydaj(teraz_)
+                if teraz is not None:
+                    return []
+                pozostalo = koniec - teraz_
+                if pozostalo <= 0:
+                    return []
+                if self._kopiec:
+                    pozostalo = min(pozostalo, self._kopiec[0][0] + self.opoznienie - teraz_)
+                self._warunek.wait(max(pozostalo, 0.001))
+
+    def _wydaj(self, teraz):
+        gotowe = []
+        while self._kopiec and self._kopiec[0][0] + self.opoznienie <= teraz:
+            odebrana = heapq.heappop(self._kopiec)[2]
+            gotowe.append(odebrana)
+            if odebrana.crc_ok:
+                del self._czekajace[odebrana.dane]
+                self._wydane[odebrana.dane] = odebrana.czas
+                self._kolejnosc_wydanych.append(odebrana.dane)
+        # Pamięć wydanych tylko na czas okna duplikatów
+        while self._kolejnosc_wydanych:
+            dane = self._kolejnosc_wydanych[0]
+            if self._wydane.get(dane, teraz) > teraz - self.okno_duplikatow:
+                break
+            self._kolejnosc_wydanych.popleft()
+            self._wydane.pop(dane, None)
+        return gotowe
+
+    def statystyki(self):
+        with self._warunek:
+            return {'odebrane': dict(self.odebrane), 'duplikaty': dict(self.duplikaty),
+                    'czekajace': len(self._kopiec)}
+
+
+def _test():
+    # Przydział: kanał SF7 jest ~2x tańszy od SF8, więc dostaje ~2x więcej stacji
+    konf = KonfiguracjaRadiow([radio_z_opisu({'nazwa': 'a', 'sf': 7, 'bw': 125000}),
+                               radio_z_opisu({'nazwa': 'b', 'sf': 8, 'bw': 125000})], {'01': 'b'})
+    konf.przydziel([f"{i:02d}" for i in range(1, 100)])
+    liczby = {n: list(konf.stacje.values()).count(n) for n in ('a', 'b')}
+    obciazenie = konf.obciazenie()
+    print(f"przydzial {liczby}, obciazenie {obciazenie}")
+    assert konf.stacje['01'] == 'b' and liczby['a'] > 1.5 * liczby['b']
+    assert abs(obciazenie['a'] - obciazenie['b']) < 0.1 * max(obciazenie.values())
+    assert KonfiguracjaRadiow.z_pliku('/nie/ma/pliku').radio_stacji('01') == RADIO_DOMYSLNE
+    assert KonfiguracjaRadiow([radio_z_opisu(r) for r in konf.jako_slownik()['radia']],
+                              konf.jako_slownik()['stacje']).stacje == konf.stacje
+
+    # Scalanie: kolejność czasu mimo kolejności dodania, duplikat z lepszym RSSI
+    s = ScalaczRamek(opoznienie=0.1)
+    s.dodaj(10.02, 'r1', b'B', -100.0)
+    s.dodaj(10.00, 'r0', b'A', -110.0)
+    s.dodaj(10.01, 'r1', b'A', -95.0)
+    s.dodaj(10.03, 'r0', b'C', None, None, False)
+    assert s.pobierz(teraz=10.05) == []
+    gotowe = s.pobierz(teraz=10.2)
+    assert [(o.dane, o.radio, o.rssi) for o in gotowe] == [(b'A', 'r1', -95.0), (b'B', 'r1', -100.0),
+                                                           (b'C', 'r0', None)], gotowe
+    s.dodaj(10.5, 'r0', b'A', -90.0)          # spóźniony duplikat już wydanej ramki
+    s.dodaj(13.0, 'r0', b'A', -90.0)          # po oknie - nowa ramka
+    assert [o.czas for o in s.pobierz(teraz=14.0)] == [13.0]
+    print(s.statystyki())
+    assert s.duplikaty == {'r1': 1, 'r0': 1}
+
+    # Wątki: 4 radia po 2000 ramek, wynik uporządkowany i bez strat
+    s = ScalaczRamek(opoznienie=0.05)
+    def radio(nazwa):
+        for i in range(2000):
+            s.dodaj(time.time(), nazwa, f"{nazwa}{i}".encode())
+    watki = [threading.Thread(target=radio, args=(f"r{k}",)) for k in range(4)]
+    start = time.perf_counter()
+    for w in watki:
+        w.start()
+    wynik = []
+    while len(wynik) < 8000:
+        wynik += s.pobierz(1.0)
+    czas = time.perf_counter() - start
+    assert all(a.czas <= b.czas for a, b in zip(wynik, wynik[1:]))
+    print(f"8000 ramek z 4 radiow: {czas:.2f} s")
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Radia odbiornika i przydzial stacji do kanalow")
+    polecenia = parser.add_subparsers(dest='polecenie', required=True)
+    p = polecenia.add_parser('przydziel', help="dopisuje nieprzypisane stacje do pliku radiow")
+    p.add_argument('plik', nargs='?', default=PLIK_RADIOW)
+    p.add_argument('--stacje', nargs='*', default=[], help="ID stacji, np. 01 02 0A")
+    p.add_argument('--liczba', type=int, default=0, help="stacje o kolejnych ID jak w generatorze")
+    p.add_argument('--interwal', type=float, default=INTERWAL_WYSYLANIA)
+    polecenia.add_parser('test', help="samotest przydzialu i scalania")
+    args = parser.parse_args()
+    if args.polecenie == 'test':
+        _test()
+        return
+    from generator_stacji import id_stacji
+    konf = KonfiguracjaRadiow.z_pliku(args.plik)
+    stacje = args.stacje + [id_stacji(i) for i in range(1, args.liczba + 1)]
+    nowe = konf.przydziel(stacje, args.interwal)
+    with open(args.plik, 'w', encoding='utf-8') as f:
+        json.dump(konf.jako_slownik(), f, indent=2)
+    print(f"Przypisano {nowe} stacji")
+    for nazwa, obciazenie in konf.obciazenie(args.interwal).items():
+        print(f"  {nazwa}: obciazenie kanalu {obciazenie * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
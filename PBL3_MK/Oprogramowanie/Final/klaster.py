@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+# Serwer WWW na kilku rdzeniach: N procesów (workerów) ff (2).py za
+# reverse proxy z sesjami "przyklejonymi" do workera (nginx ip_hash).
+# Jeden proces Pythona obsługuje Socket.IO na jednym rdzeniu - z N workerami
+# liczba klientów rośnie mniej więcej liniowo z liczbą rdzeni.
+#
+#   worker 0 (pisarz) - jak dotąd: MQTT/radio -> magazyn historii (SQLite),
+#                       eksport Influx; każdy zapisany wiersz publikuje na
+#                       szynie serwer/odczyty (broker MQTT bramki, QoS 1),
+#                       a zdarzenia awarii czujników na serwer/awarie
+#   worker 1..N-1     - czytają szynę: migawka w pamięci, żywotność stacji,
+#                       awarie i rozsyłanie do własnych klientów Socket.IO;
+#                       historię spoza pamięci czytają z tego samego magazynu (WAL)
+#
+# Porty: worker k słucha na 5000 + 100*k, diagnostyka na 5001 + 100*k.
+# Sticky sessions są konieczne - transport polling Socket.IO to wiele
+# żądań HTTP, które muszą trafić do tego samego procesu.
+#
+#   python3 "ff (2).py" --produkcja --workery 4     - pisarz + 3 workery
+#   python3 klaster.py nginx --workery 4 > /etc/nginx/conf.d/sad.conf
+#   python3 klaster.py test
+
+import sys
+import json
+import atexit
+import argparse
+import subprocess
+
+TEMAT_SZYNY = "serwer/odczyty"
+TEMAT_AWARII_SZYNY = "serwer/awarie"
+QOS_SZYNY = 1
+PRZESUNIECIE_PORTU = 100
+PORT_WWW = 5000
+
+
+def port_workera(port, numer):
+    """Port usługi (WWW, diagnostyka) dla workera `numer` - 0 to port bazowy"""
+    return port + PRZESUNIECIE_PORTU * numer
+
+
+def z_argumentow(argumenty):
+    """(numer workera, liczba workerów) z --worker k / --workery N"""
+    def liczba(flaga, domyslna):
+        if flaga not in argumenty:
+            return domyslna
+        i = argumenty.index(flaga)
+        if i + 1 < len(argumenty) and argumenty[i + 1].isdigit():
+            return int(argumenty[i + 1])
+        return domyslna
+    return liczba('--worker', 0), max(liczba('--workery', 1), 1)
+
+
+def argumenty_workera(argumenty, numer):
+    """
+    Linia poleceń workera `numer` z linii pisarza: bez --workery N,
+    z --worker k i przesuniętym jawnym portem diagnostyki.
+    """
+    wynik = []
+    pomin = False
+    for i, a in enumerate(argumenty):
+        if pomin:
+            pomin = False
+            continue
+        if a == '--workery':
+            pomin = i + 1 < len(argumenty) and argumenty[i + 1].isdigit()
+            continue
+        if i > 0 and argumenty[i - 1] == '--diagnostyka' and a.isdigit():
+            a = str(port_workera(int(a), numer))
+        wynik.append(a)
+    return wynik + ['--worker', str(numer)]
+
+
+def uruchom_workery(argumenty, liczba):
+    """Startuje workery 1..liczba-1 jako procesy potomne, kończone razem z pisarzem"""
+    procesy = [subprocess.Popen([sys.executable] + argumenty_workera(argumenty, k))
+               for k in range(1, liczba)]
+
+    def zakoncz():
+        for p in procesy:
+            if p.poll() is None:
+                p.terminate()
+        for p in procesy:
+            try:
+                p.wait(5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    atexit.register(zakoncz)
+    return procesy
+
+
+def koduj_odczyt(klucz, wiersz, probki, rssi, snr):
+    return json.dumps([klucz, wiersz, probki, rssi, snr], separators=(',', ':'))
+
+
+def dekoduj_odczyt(dane):
+    """-> (klucz, wiersz, probki, rssi, snr), wiersz jako krotka jak w magazynie"""
+    klucz, wiersz, probki, rssi, snr = json.loads(dane)
+    return klucz, tuple(wiersz), probki, rssi, snr
+
+
+class SzynaOdczytow:
+    """
+    Szyna między workerami na brokerze MQTT. Pisarz woła publikuj() po
+    zapisie wiersza do magazynu; worker z `odbior` dostaje każdy wiersz
+    jako odbior(klucz, wiersz, probki, rssi, snr), a zdarzenia awarii
+    (publikuj_awarie) jako odbior_awarii(zdarzenie). `po_polaczeniu` woła się
+    po każdym (ponownym) połączeniu - wiersze z przerwy są tylko w magazynie.
+    """
+    def __init__(self, broker, port, odbior=None, po_polaczeniu=None, temat=TEMAT_SZYNY, klient=None,
+                 odbior_awarii=None, temat_awarii=TEMAT_AWARII_SZYNY):
+        if klient is None:
+            import paho.mqtt.client as mqtt
+            klient = mqtt.Client()
+            klient.reconnect_delay_set(1, 30)
+        self.klient = klient
+        self.temat = temat
+        self.temat_awarii = temat_awarii
+        self.odbior = odbior
+        self.odbior_awarii = odbior_awarii
+        self.po_polaczeniu = po_polaczeniu
+        self.wyslane = 0
+        self.odebrane = 0
+        self.bledy = 0
+        klient.on_connect = self._on_connect
+        klient.on_message = self._on_message
+        if broker is not None:
+            klient.connect_async(broker, port, 60)
+            klient.loop_start()
+
+    def _on_connect(self, klient, userdata, flags, rc):
+        if rc != 0:
+            print(f"Szyna workerow: blad polaczenia, kod {rc}")
+            return
+        if self.odbior_awarii is not None:
+            klient.subscribe(self.temat_awarii, QOS_SZYNY)
+        if self.odbior is not None:
+            klient.subscribe(self.temat, QOS_SZYNY)
+            if self.po_polaczeniu is not None:
+                self.po_polaczeniu()
+
+    def _on_message(self, klient, userdata, msg):
+        try:
+            if msg.topic == self.temat_awarii:
+                self.odbior_awarii(json.loads(msg.payload))
+            else:
+                self.odbior(*dekoduj_odczyt(msg.payload))
+            self.odebrane += 1
+        except Exception as e:
+            self.bledy += 1
+            print(f"Szyna workerow: blad wiadomosci {e}")
+
+    def publikuj(self, klucz, wiersz, probki=None, rssi=None, snr=None):
+        self.klient.publish(self.temat, koduj_odczyt(klucz, wiersz, probki, rssi, snr), QOS_SZYNY)
+        self.wyslane += 1
+
+    def publikuj_awarie(self, zdarzenie):
+        """Zdarzenie awarii czujnika (detekcja_awarii.py) do rejestrów workerów"""
+        self.klient.publish(self.temat_awarii, json.dumps(zdarzenie, separators=(',', ':')), QOS_SZYNY)
+        self.wyslane += 1
+
+    def statystyki(self):
+        return {'wyslane': self.wyslane, 'odebrane': self.odebrane, 'bledy': self.bledy}
+
+
+def konfiguracja_nginx(liczba, port=PORT_WWW, port_nginx=80):
+    """Upstream z ip_hash (sticky sessions) i przekazaniem WebSocket"""
+    serwery = "\n".join(f"    server 127.0.0.1:{port_workera(port, k)};" for k in range(liczba))
+    return f"""upstream sad_workery {{
+    ip_hash;
+{serwery}
+}}
+
+server {{
+    listen {port_nginx};
+
+    location / {{
+        proxy_pass http://sad_workery;
+        proxy_http_version 1.1;
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    }}
+
+    location /socket.io {{
+        proxy_pass http://sad_workery/socket.io;
+        proxy_http_version 1.1;
+        proxy_buffering off;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "Upgrade";
+        proxy_set_header Host $host;
+        proxy_read_timeout 3600s;
+    }}
+}}
+"""
+
+
+# === SAMOTEST ===
+
+class _Wiadomosc:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class _UdawanyBroker:
+    """Doręczenie synchroniczne do wszystkich subskrybentów tematu"""
+    def __init__(self):
+        self.klienci = []
+
+    def klient(self):
+        broker = self
+
+        class Klient:
+            subskrypcje = ()
+
+            def subscribe(self, temat, qos=0):
+                self.subskrypcje += (temat,)
+
+            def publish(self, temat, dane, qos=0):
+                for k in broker.klienci:
+                    if temat in k.subskrypcje:
+                        k.on_message(k, None, _Wiadomosc(temat, dane.encode('utf-8')))
+
+        k = Klient()
+        self.klienci.append(k)
+        return k
+
+
+def _samotest():
+    assert z_argumentow(['ff.py']) == (0, 1)
+    assert z_argumentow(['ff.py', '--workery', '4', '--produkcja']) == (0, 4)
+    args = argumenty_workera(['ff.py', '--produkcja', '--workery', '4', '--diagnostyka', '5001'], 2)
+    assert args == ['ff.py', '--produkcja', '--diagnostyka', '5201', '--worker', '2'], args
+    assert z_argumentow(args) == (2, 1)
+    # Porty WWW i diagnostyki workerów nie kolidują
+    porty = [port_workera(p, k) for k in range(8) for p in (PORT_WWW, PORT_WWW + 1)]
+    assert len(set(porty)) == len(porty)
+    konfiguracja = konfiguracja_nginx(3)
+    assert 'ip_hash' in konfiguracja and '127.0.0.1:5200' in konfiguracja
+
+    broker = _UdawanyBroker()
+    pisarz = SzynaOdczytow(None, None, klient=broker.klient())
+    odebrane = []
+    polaczenia = []
+    awarie = []
+    worker = SzynaOdczytow(None, None, klient=broker.klient(),
+                           odbior=lambda *odczyt: odebrane.append(odczyt),
+                           po_polaczeniu=lambda: polaczenia.append(1), odbior_awarii=awarie.append)
+    worker._on_connect(worker.klient, None, {}, 0)
+    wiersz = (17, 1700000000.5, 1.25, None, 85.0, 12.0, 1)
+    pisarz.publikuj('5', wiersz, 10, -97.0, 6.5)
+    assert odebrane == [('5', wiersz, 10, -97.0, 6.5)] and polaczenia == [1], odebrane
+    assert pisarz.statystyki()['wyslane'] == 1 and worker.statystyki()['odebrane'] == 1
+    zdarzenie = {'czas': 1700000000, 'stacja': '01', 'czujnik': 'ds', 'rodzaj': 'zamrozony',
+                 'koniec': False, 'wartosc': 4.81}
+    pisarz.publikuj_awarie(zdarzenie)
+    assert awarie == [zdarzenie] and len(odebrane) == 1
+    print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serwer WWW na wielu procesach (workerach)")
+    polecenia = parser.add_subparsers(dest='polecenie', required=True)
+    p = polecenia.add_parser('nginx', help="konfiguracja reverse proxy ze sticky sessions")
+    p.add_argument('--workery', type=int, default=4)
+    p.add_argument('--port', type=int, default=PORT_WWW, help="port WWW pisarza")
+    p.add_argument('--port-nginx', type=int, default=80)
+    polecenia.add_parser('test', help="samotest szyny i argumentow workerow")
+    args = parser.parse_args()
+    if args.polecenie == 'test':
+        _samotest()
+    else:
+        print(konfiguracja_nginx(args.workery, args.port, args.port_nginx), end='')
@@ -4,17 +4,29 @@
 # Ramka 32B BEZ SEPARATORÓW - stałe pozycje pól
 # Format: ID(2) + TDS(6) + TBME(6) + HUM(5) + N(2) + CZAS(6) + WIATR(5) = 32B
 # Przykład: 01+22.5+21.3045.210143052005.2
+# Rozszerzenie (bajty 32-40): PORYW(5) + ZMIENNOSC(4) = 41B
+# Statystyki okna (bajty 41-72): TMIN/TMAX DS(6+6) + TMIN/TMAX BME(6+6) + SD DS/BME(4+4) = 73B
 
 import time
 import glob
+import math
+import threading
+import statistics
+from array import array
+from collections import namedtuple, deque
 import RPi.GPIO as GPIO
 from gpiozero import Button
 from LoRaRF import SX126x, LoRaSpi, LoRaGpio
 
-# Konfig 
+from ramka import koduj_ramke, DLUGOSC_PREAMBULY, DLUGOSC_RAMKI, INTERWAL_WYSYLANIA
+from budzet_nadawania import KolejkaNadawania, ALARM, OKRESOWA
+from kanaly import KonfiguracjaRadiow, PLIK_RADIOW
+
+# Konfig (INTERWAL_WYSYLANIA wspólny z odbiornikiem - ramka.py). Kanał
+# (częstotliwość, SF, BW, CR) z przydziału stacji w radia.json - ten sam plik
+# co na odbiorniku; bez pliku domyślny kanał z ramka.py
 ID_STACJI = "01"
 INTERWAL_PROBEK = 30
-INTERWAL_WYSYLANIA = 5 * 60
 
 # Piny LORY
 PIN_RESET = 17
@@ -27,39 +39,203 @@ PIN_CS = 8
 PIN_WIATR = 16
 
 # LoRa Setup
-CZESTOTLIWOSC = 868000000
 MOC_TX = 14
-SF = 7
-BW = 500000
-CR = 5
+
+# Ramka z minimum temperatury okna <= progu idzie z priorytetem alarmu -
+# przy wyczerpanym budżecie nadawania (budzet_nadawania.py) wyprzedza pozostałe
+PROG_ALARMU_STACJI = 2.0  # °C
 
 # Kalibracja wiatromierza - 1 Hz == 2.4 km/h
 WSPOLCZYNNIK_WIATRU = 2.4
 
+# Odrzucanie odczytów odstających - maksymalna odległość od mediany
+# ostatnich OKNO_MEDIANY surowych próbek (co INTERWAL_PROBEK sekund)
+OKNO_MEDIANY = 5
+PROG_ODRZUCENIA_TEMP = 5.0   # °C
+PROG_ODRZUCENIA_WILG = 20.0  # %
+
+# Limity czasu odczytu czujników [s] liczone od początku cyklu.
+# Konwersja 12-bit DS18B20 trwa ~750 ms, BME280 w trybie forced ~50 ms.
+LIMIT_DS18B20 = 2.0
+LIMIT_BME280 = 1.0
+
+# Bufor znaczników czasu impulsów. Przy wichurze ~150 km/h wiatromierz daje
+# ~63 Hz, czyli ~1900 impulsów na okno 30 s - 8192 zostawia duży zapas.
+ROZMIAR_BUFORA_IMPULSOW = 8192
+# Poryw liczony jako maksimum średniej 3-sekundowej (standard WMO)
+OKNO_PORYWU = 3.0
+
+OdczytWiatru = namedtuple('OdczytWiatru', ['srednia', 'poryw', 'zmiennosc'])
+
 #wiatromierz
 class LicznikWiatru:
-    def __init__(self):
-        self.impulsy = 0
-        self.ostatni_czas = time.time()
-    
+    """
+    Licznik impulsów wiatromierza odporny na wyścigi z wątkiem gpiozero.
+    Callback tylko zapisuje znacznik czasu do bufora kołowego pod blokadą,
+    cała analiza (średnia, poryw 3 s, zmienność) dzieje się w odczytaj().
+    Licznik impulsów jest dokładny nawet gdy bufor się przepełni - wtedy
+    poryw liczony jest z najnowszych ROZMIAR_BUFORA_IMPULSOW impulsów.
+    """
+    def __init__(self, rozmiar=ROZMIAR_BUFORA_IMPULSOW):
+        self._blokada = threading.Lock()
+        self._rozmiar = rozmiar
+        self._czasy = array('d', bytes(8 * rozmiar))
+        self._zapisane = 0      # wszystkie impulsy od startu
+        self._odczytane = 0     # stan licznika przy ostatnim odczycie
+        self.ostatni_czas = time.monotonic()
+        self._reset_okna()
+
+    def _reset_okna(self):
+        # Statystyki okna wysyłki (sumy po przedziałach 3 s)
+        self._okno_impulsy = 0
+        self._okno_czas = 0.0
+        self._okno_poryw = 0.0
+        self._okno_n = 0
+        self._okno_suma = 0.0
+        self._okno_suma_kw = 0.0
+
     def impuls(self):
-        self.impulsy += 1
-    
+        teraz = time.monotonic()
+        with self._blokada:
+            self._czasy[self._zapisane % self._rozmiar] = teraz
+            self._zapisane += 1
+
+    def _pobierz_znaczniki(self, ile):
+        # Wywoływane pod blokadą - kopiuje ostatnie `ile` znaczników w kolejności
+        poczatek = (self._zapisane - ile) % self._rozmiar
+        koniec = poczatek + ile
+        if koniec <= self._rozmiar:
+            return self._czasy[poczatek:koniec]
+        return self._czasy[poczatek:] + self._czasy[:koniec - self._rozmiar]
+
     def odczytaj(self):
-        #Odczyt predkosci wiatru od ostatniego wywołania 
-        teraz = time.time()
-        czas_pomiaru = teraz - self.ostatni_czas
-        
+        """Odczyt wiatru od ostatniego wywołania: średnia, poryw 3 s i zmienność [km/h]"""
+        with self._blokada:
+            teraz = time.monotonic()
+            impulsy = self._zapisane - self._odczytane
+            znaczniki = self._pobierz_znaczniki(min(impulsy, self._rozmiar))
+            start = self.ostatni_czas
+            self._odczytane = self._zapisane
+            self.ostatni_czas = teraz
+
+        czas_pomiaru = teraz - start
         if czas_pomiaru <= 0:
-            return 0.0
-        
-        czestotliwosc = self.impulsy / czas_pomiaru
-        predkosc = czestotliwosc * WSPOLCZYNNIK_WIATRU
-            
-        self.impulsy = 0
-        self.ostatni_czas = teraz
-        
-        return round(predkosc, 1)
+            return OdczytWiatru(0.0, 0.0, 0.0)
+
+        srednia = impulsy / czas_pomiaru * WSPOLCZYNNIK_WIATRU
+
+        # Poryw - najwięcej impulsów w dowolnym oknie 3 s (dwa wskaźniki)
+        okno = min(OKNO_PORYWU, czas_pomiaru)
+        max_w_oknie = 0
+        lewy = 0
+        for prawy in range(len(znaczniki)):
+            while znaczniki[prawy] - znaczniki[lewy] >= okno:
+                lewy += 1
+            max_w_oknie = max(max_w_oknie, prawy - lewy + 1)
+        poryw = max(max_w_oknie / okno * WSPOLCZYNNIK_WIATRU, srednia)
+
+        # Zmienność - odchylenie std. prędkości w kolejnych przedziałach 3 s.
+        # Przy przepełnionym buforze liczymy tylko odcinek pokryty znacznikami.
+        if impulsy > len(znaczniki) and znaczniki:
+            start = znaczniki[0]
+        liczba_przedzialow = max(1, int((teraz - start) // OKNO_PORYWU))
+        przedzialy = [0] * liczba_przedzialow
+        for t in znaczniki:
+            i = int((t - start) // OKNO_PORYWU)
+            if 0 <= i < liczba_przedzialow:
+                przedzialy[i] += 1
+        predkosci = [n / OKNO_PORYWU * WSPOLCZYNNIK_WIATRU for n in przedzialy]
+        zmiennosc = statistics.pstdev(predkosci) if len(predkosci) > 1 else 0.0
+
+        # Akumulacja do okna wysyłki
+        self._okno_impulsy += impulsy
+        self._okno_czas += czas_pomiaru
+        self._okno_poryw = max(self._okno_poryw, poryw)
+        self._okno_n += len(predkosci)
+        self._okno_suma += sum(predkosci)
+        self._okno_suma_kw += sum(v * v for v in predkosci)
+
+        return OdczytWiatru(round(srednia, 1), round(poryw, 1), round(zmiennosc, 1))
+
+    def podsumuj_okno(self):
+        """Podsumowanie okna wysyłki (od poprzedniego wywołania) i reset statystyk"""
+        if self._okno_czas <= 0:
+            self._reset_okna()
+            return OdczytWiatru(0.0, 0.0, 0.0)
+        srednia = self._okno_impulsy / self._okno_czas * WSPOLCZYNNIK_WIATRU
+        zmiennosc = 0.0
+        if self._okno_n > 1:
+            sr = self._okno_suma / self._okno_n
+            zmiennosc = math.sqrt(max(0.0, self._okno_suma_kw / self._okno_n - sr * sr))
+        wynik = OdczytWiatru(round(srednia, 1), round(self._okno_poryw, 1), round(zmiennosc, 1))
+        self._reset_okna()
+        return wynik
+
+
+class AgregatorKanalu:
+    """
+    Strumieniowe statystyki jednego kanału w oknie wysyłki - stała pamięć.
+    Średnia i wariancja metodą Welforda, min/max/ostatnia, liczba poprawnych,
+    brakujących i odrzuconych próbek. Próbka jest odrzucana, gdy odbiega od
+    mediany ostatnich OKNO_MEDIANY surowych odczytów o więcej niż `prog`.
+    """
+    def __init__(self, prog=None, okno_mediany=OKNO_MEDIANY):
+        self.prog = prog
+        # Mediana liczona z surowych odczytów (także odrzuconych), dzięki czemu
+        # rzeczywisty skok wartości zostaje przyjęty po kilku próbkach
+        self._ostatnie_surowe = deque(maxlen=okno_mediany)
+        self.reset()
+
+    def reset(self):
+        # Bufor mediany przechodzi między oknami - ciągłość filtra
+        self.n = 0
+        self.braki = 0
+        self.odrzucone = 0
+        self.srednia = None
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.ostatnia = None
+
+    def dodaj(self, x):
+        """Dodaje próbkę, zwraca True jeśli została uwzględniona w statystykach"""
+        if x is None:
+            self.braki += 1
+            return False
+
+        odstajaca = False
+        if self.prog is not None and len(self._ostatnie_surowe) >= 3:
+            odstajaca = abs(x - statistics.median(self._ostatnie_surowe)) > self.prog
+        self._ostatnie_surowe.append(x)
+        if odstajaca:
+            self.odrzucone += 1
+            return False
+
+        self.n += 1
+        if self.n == 1:
+            self.srednia = x
+            self.min = x
+            self.max = x
+        else:
+            delta = x - self.srednia
+            self.srednia += delta / self.n
+            self._m2 += delta * (x - self.srednia)
+            self.min = min(self.min, x)
+            self.max = max(self.max, x)
+        self.ostatnia = x
+        return True
+
+    @property
+    def wariancja(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else None
+
+    @property
+    def odchylenie(self):
+        w = self.wariancja
+        return math.sqrt(w) if w is not None else None
+
+    def zaokraglona_srednia(self):
+        return round(self.srednia, 1) if self.srednia is not None else None
 
 
 licznik_wiatru = LicznikWiatru()
@@ -156,8 +332,79 @@ class BME280:
         except:
             return None, None
 
+#AKWIZYCJA
+# Jedna próbka z cyklu - wszystkie kanały przypisane do tego samego taktu
+Probka = namedtuple('Probka', ['czas', 'temp_ds', 'temp_bme', 'wilg_bme', 'wiatr'])
+
+class OdczytZLimitem:
+    """
+    Odczyt jednego czujnika w wątku w tle z limitem czasu.
+    Zawieszony odczyt (np. blokujący sysfs 1-Wire) nie jest dublowany -
+    dopóki poprzedni wątek nie skończy, czujnik zwraca wartość domyślną.
+    """
+    def __init__(self, nazwa, funkcja, limit, domyslna=None):
+        self.nazwa = nazwa
+        self.funkcja = funkcja
+        self.limit = limit
+        self.domyslna = domyslna
+        self.przekroczenia = 0
+        self._watek = None
+        self._gotowe = None
+        self._wynik = None
+
+    def start(self):
+        if self._watek is not None and self._watek.is_alive():
+            self._gotowe = None
+            return False
+        # Osobny pojemnik na każdy odczyt - spóźniony wynik nie trafi do innego cyklu
+        self._gotowe = threading.Event()
+        self._wynik = [self.domyslna]
+        self._watek = threading.Thread(target=self._uruchom, args=(self._gotowe, self._wynik),
+                                       name=f"czujnik-{self.nazwa}", daemon=True)
+        self._watek.start()
+        return True
+
+    def _uruchom(self, gotowe, wynik):
+        try:
+            wynik[0] = self.funkcja()
+        except Exception:
+            pass
+        gotowe.set()
+
+    def wynik(self, poczatek_cyklu):
+        if self._gotowe is None:
+            print(f"  {self.nazwa}: poprzedni odczyt nadal trwa - pomijam")
+            return self.domyslna
+        pozostalo = poczatek_cyklu + self.limit - time.monotonic()
+        if not self._gotowe.wait(max(0.0, pozostalo)):
+            self.przekroczenia += 1
+            print(f"  {self.nazwa}: przekroczony limit {self.limit} s")
+            return self.domyslna
+        return self._wynik[0]
+
+class AkwizycjaCzujnikow:
+    """
+    Równoległy odczyt DS18B20 i BME280 z osobnymi limitami czasu.
+    Wiatr jest odczytywany dokładnie w chwili taktu, więc okno wiatru i znacznik
+    czasu próbki nie zależą od tego, jak długo odpowiadają inne czujniki.
+    """
+    def __init__(self, czujnik_ds, bme, licznik):
+        self.licznik = licznik
+        self.ds = OdczytZLimitem("DS18B20", lambda: odczyt_ds18b20(czujnik_ds), LIMIT_DS18B20)
+        self.bme = OdczytZLimitem("BME280", bme.odczyt, LIMIT_BME280, (None, None))
+
+    def odczytaj(self):
+        poczatek = time.monotonic()
+        czas = time.time()
+        wiatr = self.licznik.odczytaj()
+        self.ds.start()
+        self.bme.start()
+        temp_ds = self.ds.wynik(poczatek)
+        temp_bme, wilg_bme = self.bme.wynik(poczatek)
+        return Probka(czas, temp_ds, temp_bme, wilg_bme, wiatr)
+
 #LORA
-def inicjalizacja_lory():
+def inicjalizacja_lory(radio):
     GPIO.setmode(GPIO.BCM)
     GPIO.setwarnings(False)
         
@@ -176,10 +423,10 @@ def inicjalizacja_lory():
     lora.setDio3AsTcxoCtrl(SX126x.DIO3_OUTPUT_1_8, SX126x.TCXO_DELAY_10)
     lora.calibrate(0xFF)
     time.sleep(0.1)
-    lora.setFrequency(CZESTOTLIWOSC)
+    lora.setFrequency(radio.czestotliwosc)
     lora.setTxPower(MOC_TX, SX126x.TX_POWER_SX1262)
-    lora.setLoRaModulation(SF, BW, CR)
-    lora.setLoRaPacket(SX126x.HEADER_EXPLICIT, 12, 32, True, False)
+    lora.setLoRaModulation(radio.sf, radio.bw, radio.cr)
+    lora.setLoRaPacket(SX126x.HEADER_EXPLICIT, DLUGOSC_PREAMBULY, DLUGOSC_RAMKI, True, False)
     lora.setSyncWord(SX126x.LORA_SYNC_WORD_PRIVATE)
     
     return lora, txen, rxen
@@ -215,112 +462,109 @@ def wyslanie_danych(lora, txen, rxen, dane):
     return sukces
 
 
-def format_temp(t):    
-    if t is None:
-        return "  N/A "
-    znak = "+" if t >= 0 else "-"
-    return f"{znak}{abs(t):05.1f}"
-
-def format_wilg(h):    
-    if h is None:
-        return " N/A "
-    return f"{h:05.1f}"
-
-def format_wiatr(w):
-    """Formatuje prędkość wiatru do 5 znaków: XXX.X"""
-    if w is None:
-        return " N/A "
-    # Ograniczenie do 999.9 km/h
-    w = min(w, 999.9)
-    return f"{w:05.1f}"
-
-def budowanie_ramki(id_stacji, temp_ds, temp_bme, wilg_bme, liczba_probek, wiatr):
+def budowanie_ramki(id_stacji, temp_ds, temp_bme, wilg_bme, liczba_probek, wiatr,
+                    poryw=None, zmiennosc=None, agr_ds=None, agr_bme=None):
     """
-    Buduje ramkę 32B BEZ SEPARATORÓW - stałe pozycje pól.
-    Format: ID(2) + TDS(6) + TBME(6) + HUM(5) + N(2) + CZAS(6) + WIATR(5) = 32B
-    Przykład: 01+22.5+21.3045.210143052005.2
+    Buduje ramkę 73B (format w ramka.py). Statystyki okna pochodzą
+    z agregatorów DS18B20 i BME280 (AgregatorKanalu).
     """
-    czas = time.strftime("%H%M%S")
-    ramka = (
-        f"{id_stacji:2s}"           # 0-1:   ID stacji (2)
-        f"{format_temp(temp_ds)}"   # 2-7:   Temp DS18B20 (6)
-        f"{format_temp(temp_bme)}"  # 8-13:  Temp BME280 (6)
-        f"{format_wilg(wilg_bme)}"  # 14-18: Wilgotność (5)
-        f"{liczba_probek:02d}"      # 19-20: Liczba próbek (2)
-        f"{czas}"                   # 21-26: Czas HHMMSS (6)
-        f"{format_wiatr(wiatr)}"    # 27-31: Wiatr km/h (5)
-    )
-    return ramka.encode('utf-8')[:32].ljust(32)
+    agr_ds = agr_ds or AgregatorKanalu()
+    agr_bme = agr_bme or AgregatorKanalu()
+    return koduj_ramke(id_stacji, temp_ds, temp_bme, wilg_bme, liczba_probek, wiatr, poryw, zmiennosc,
+                       (agr_ds.min, agr_ds.max, agr_ds.odchylenie),
+                       (agr_bme.min, agr_bme.max, agr_bme.odchylenie))
 
 # ============ MAIN ============
 def main():
     global last_wind_time, pulse_count
     
     print("Stacja przymrozkowa ZERO (z wiatromierzem)")
-    print("Format ramki: ID|TDS|TBME|HUM|N|CZAS|WIATR (bez separatorów)")
+    print("Format ramki: ID|TDS|TBME|HUM|N|CZAS|WIATR|PORYW|ZMIENNOSC|MIN/MAX/SD (bez separatorów)")
     
     czujnik_ds = szukanie_ds18b20()
     bme = BME280()
     bme.inicjalizacja()
-    lora, txen, rxen = inicjalizacja_lory()
+    radio = KonfiguracjaRadiow.z_pliku(PLIK_RADIOW).radio_stacji(ID_STACJI)
+    print(f"Kanał {radio.nazwa}: {radio.czestotliwosc / 1e6:g} MHz, SF{radio.sf}, BW {radio.bw // 1000} kHz")
+    lora, txen, rxen = inicjalizacja_lory(radio)
+    akwizycja = AkwizycjaCzujnikow(czujnik_ds, bme, licznik_wiatru)
     
     print(f"Wysyłanie ramki co {INTERWAL_WYSYLANIA // 60} min")
     print(f"Próbkowanie co {INTERWAL_PROBEK} s")
     
-    probki_ds = []
-    probki_bme_t = []
-    probki_bme_h = []
-    probki_wiatr = []
+    # Statystyki okna liczone strumieniowo - bez list próbek
+    agr_ds = AgregatorKanalu(PROG_ODRZUCENIA_TEMP)
+    agr_bme_t = AgregatorKanalu(PROG_ODRZUCENIA_TEMP)
+    agr_bme_h = AgregatorKanalu(PROG_ODRZUCENIA_WILG)
     ostatnie_wyslanie = time.time()
+    # Budżet czasu nadawania wg limitu podpasma - ramki ponad budżet czekają
+    kolejka_nadawania = KolejkaNadawania(sf=radio.sf, bw=radio.bw, cr=radio.cr, czestotliwosc=radio.czestotliwosc)
+    print(f"Limit wypełnienia kanału: {kolejka_nadawania.limit * 100:g}%")
+
+    def nadaj(ramka):
+        czas = time.strftime("%H:%M:%S")
+        sukces = wyslanie_danych(lora, txen, rxen, ramka)
+        print(f"[{czas}] {'OK' if sukces else 'BŁĄD'} | {ramka.decode().strip()}")
+        return sukces
+
+    # Takty w stałym rytmie (bez dryfu o czas trwania odczytów)
+    nastepny_takt = time.monotonic()
     
     try:
         while True:
-            # Odczyt czujników temperatury/wilgotności
-            temp_ds = odczyt_ds18b20(czujnik_ds)
-            temp_bme, wilg_bme = bme.odczyt()
-            
-            # Odczyt wiatru (od ostatniego próbkowania)
-            wiatr = licznik_wiatru.odczytaj()
+            # Jeden cykl = jedna wyrównana w czasie próbka wszystkich czujników
+            probka = akwizycja.odczytaj()
             
             # Zbieranie próbek
-            if temp_ds is not None:
-                probki_ds.append(temp_ds)
-            if temp_bme is not None:
-                probki_bme_t.append(temp_bme)
-            if wilg_bme is not None:
-                probki_bme_h.append(wilg_bme)
-            probki_wiatr.append(wiatr)
+            agr_ds.dodaj(probka.temp_ds)
+            agr_bme_t.dodaj(probka.temp_bme)
+            agr_bme_h.dodaj(probka.wilg_bme)
             
             # Debug - wyświetl aktualne odczyty
-            print(f"  DS:{temp_ds} BME:{temp_bme}/{wilg_bme} Wiatr:{wiatr} km/h")
+            wiatr = probka.wiatr
+            print(f"  DS:{probka.temp_ds} BME:{probka.temp_bme}/{probka.wilg_bme} "
+                  f"Wiatr:{wiatr.srednia} km/h (poryw {wiatr.poryw}, zm. {wiatr.zmiennosc})")
             
             # Czas wysłania?
             if time.time() - ostatnie_wyslanie >= INTERWAL_WYSYLANIA:
                 # Oblicz średnie
-                sr_ds = round(sum(probki_ds) / len(probki_ds), 1) if probki_ds else None
-                sr_bme_t = round(sum(probki_bme_t) / len(probki_bme_t), 1) if probki_bme_t else None
-                sr_bme_h = round(sum(probki_bme_h) / len(probki_bme_h), 1) if probki_bme_h else None
-                sr_wiatr = round(sum(probki_wiatr) / len(probki_wiatr), 1) if probki_wiatr else 0.0
-                
-                n = max(min(len(probki_ds), len(probki_bme_t)), 1)
+                sr_ds = agr_ds.zaokraglona_srednia()
+                sr_bme_t = agr_bme_t.zaokraglona_srednia()
+                sr_bme_h = agr_bme_h.zaokraglona_srednia()
+                okno_wiatru = licznik_wiatru.podsumuj_okno()
                 
-                # Buduj i wyślij ramkę
-                ramka = budowanie_ramki(ID_STACJI, sr_ds, sr_bme_t, sr_bme_h, n, sr_wiatr)
-                czas = time.strftime("%H:%M:%S")
+                # Liczba poprawnych (nieodrzuconych) próbek temperatury
+                n = min(max(min(agr_ds.n, agr_bme_t.n), 1), 99)
+                if agr_ds.odrzucone or agr_bme_t.odrzucone or agr_bme_h.odrzucone:
+                    print(f"  Odrzucone próbki DS:{agr_ds.odrzucone} "
+                          f"BME:{agr_bme_t.odrzucone}/{agr_bme_h.odrzucone}")
                 
-                if wyslanie_danych(lora, txen, rxen, ramka):
-                    print(f"[{czas}] OK | {ramka.decode().strip()}")
-                else:
-                    print(f"[{czas}] BŁĄD | {ramka.decode().strip()}")
+                # Buduj ramkę i dodaj do kolejki nadawania
+                ramka = budowanie_ramki(ID_STACJI, sr_ds, sr_bme_t, sr_bme_h, n,
+                                        okno_wiatru.srednia, okno_wiatru.poryw,
+                                        okno_wiatru.zmiennosc, agr_ds, agr_bme_t)
+                alarm = any(t is not None and t <= PROG_ALARMU_STACJI for t in (agr_ds.min, agr_bme_t.min))
+                kolejka_nadawania.dodaj(ramka, ALARM if alarm else OKRESOWA)
                 
-                # Wyczyść bufory
-                probki_ds.clear()
-                probki_bme_t.clear()
-                probki_bme_h.clear()
-                probki_wiatr.clear()
+                # Nowe okno statystyk
+                agr_ds.reset()
+                agr_bme_t.reset()
+                agr_bme_h.reset()
                 ostatnie_wyslanie = time.time()
             
-            time.sleep(INTERWAL_PROBEK)
+            # Nadanie czekających ramek, na które pozwala budżet (także odłożonych wcześniej)
+            if kolejka_nadawania.czekajace():
+                kolejka_nadawania.wyslij_gotowe(nadaj)
+                if kolejka_nadawania.czekajace():
+                    print(f"  Budżet nadawania wyczerpany - czeka {kolejka_nadawania.czekajace()} ramek")
+            
+            nastepny_takt += INTERWAL_PROBEK
+            opoznienie = nastepny_takt - time.monotonic()
+            if opoznienie > 0:
+                time.sleep(opoznienie)
+            else:
+                # Cykl trwał dłużej niż interwał - zaczynamy nowy rytm od teraz
+                nastepny_takt = time.monotonic()
             
     except KeyboardInterrupt:
         print("\n[STOP]")
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+
+# Kolumnowy kodek serii pomiarów (w stylu Gorilla) dla magazynu historii
+# i odpowiedzi API. Odczyty (seq, ts, t1, t2, hu, wi, fa) są dzielone na
+# bloki po ROZMIAR_BLOKU wierszy, każdy blok dekoduje się niezależnie
+# (dostęp swobodny - nagłówek bloku ma zakres seq i czasu oraz długość).
+#
+# Każda kolumna bloku wybiera najmniejsze bezstratne kodowanie:
+#   seq, ts        - delta-of-delta liczb całkowitych (ts w ms)
+#   T1, T2, Hu, Wi - delty stałoprzecinkowe (10^d), także dla wartości float32
+#                    z ramki; gdy się nie da - XOR kolejnych float64
+#   Fa             - jeden bit na odczyt
+# Liczby zapisujemy w kubełkach o zmiennej długości ('0' = zero,
+# '10' + 7 bitów, '110' + 12, ...), brakujące wartości (None) maską bitową.
+#
+#   blok:  nagłówek 40 B | strumień bitów (kolumny po kolei)
+#   seria: nagłówek 12 B (PBLS, kursor) | bloki do końca danych
+#
+#   python3 kodek.py test
+#   python3 kodek.py porownaj historia.db   - rozmiar bloków względem SQLite/JSON
+
+import sys
+import json
+import math
+import struct
+from array import array
+
+ROZMIAR_BLOKU = 256
+WERSJA_KODEKA = 1
+
+# magic, wersja, zarezerwowane, liczba wierszy, długość bloku w bajtach,
+# stacja, seq_od, seq_do, ts_od, ts_do
+NAGLOWEK_BLOKU = struct.Struct('<4sBBHIIIIdd')
+MAGIC_BLOKU = b'PBLK'
+# magic, wersja, zarezerwowane, kursor (jak w formacie kolumnowym magazynu)
+NAGLOWEK_SERII = struct.Struct('<4sBBHI')
+MAGIC_SERII = b'PBLS'
+
+# Tryby kolumny (2 bity)
+_PUSTA, _STALOPRZECINKOWA, _XOR, _FLAGI = range(4)
+# Kolumny bloku: (całkowita, rząd różnicowania)
+_KOLUMNY = ((True, 2), (False, 2), (False, 1), (False, 1), (False, 1), (False, 1), (True, 1))
+_MAKS_MIEJSC = 7
+_KUBELKI = ((7, '10'), (12, '110'), (20, '1110'), (32, '11110'), (64, '11111'))
+_DLUGOSCI = tuple(d for d, _ in _KUBELKI)
+
+
+class BladKodeka(ValueError):
+    pass
+
+
+def _zigzag(v):
+    return v * 2 if v >= 0 else -v * 2 - 1
+
+
+def _odzigzag(z):
+    return -(z >> 1) - 1 if z & 1 else z >> 1
+
+
+def _liczba(bity, v):
+    z = _zigzag(v)
+    if z == 0:
+        bity.append('0')
+        return
+    for dlugosc, prefiks in _KUBELKI:
+        if z >> dlugosc == 0:
+            bity.append(prefiks + format(z, f'0{dlugosc}b'))
+            return
+    raise BladKodeka(f"liczba poza zakresem 64 bitow: {v}")
+
+
+def _staloprzecinkowa(wartosci, calkowita):
+    """(miejsca dziesiętne, float32, [liczby całkowite]) albo None"""
+    if calkowita:
+        if all(type(v) is int for v in wartosci):
+            return 0, False, wartosci
+        return None
+    for miejsca in range(_MAKS_MIEJSC + 1):
+        skala = 10 ** miejsca
+        try:
+            k = [round(v * skala) for v in wartosci]
+        except (OverflowError, ValueError):   # inf / NaN
+            return None
+        if max(map(abs, k)) >> 62:
+            return None
+        odtworzone = [x / skala for x in k]
+        if odtworzone == wartosci:
+            return miejsca, False, k
+        try:
+            if array('f', odtworzone).tolist() == wartosci:
+                return miejsca, True, k
+        except OverflowError:
+            pass
+    return None
+
+
+def _bity_float(v):
+    return struct.unpack('<Q', struct.pack('<d', v))[0]
+
+
+def _koduj_xor(bity, wartosci):
+    poprzednia = _bity_float(wartosci[0])
+    bity.append(format(poprzednia, '064b'))
+    okno = None
+    for v in wartosci[1:]:
+        b = _bity_float(v)
+        x = b ^ poprzednia
+        poprzednia = b
+        if x == 0:
+            bity.append('0')
+            continue
+        wiodace = 64 - x.bit_length()
+        koncowe = (x & -x).bit_length() - 1
+        if okno is not None and wiodace >= okno[0] and koncowe >= okno[1]:
+            dlugosc = 64 - okno[0] - okno[1]
+            bity.append('10' + format(x >> okno[1], f'0{dlugosc}b'))
+        else:
+            okno = (wiodace, koncowe)
+            dlugosc = 64 - wiodace - koncowe
+            bity.append('11' + format(wiodace, '06b') + format(dlugosc - 1, '06b')
+                        + format(x >> koncowe, f'0{dlugosc}b'))
+
+
+def _koduj_kolumne(bity, wartosci, calkowita, rzad):
+    obecne = [v for v in wartosci if v is not None]
+    if not obecne:
+        bity.append('00')
+        return
+    if calkowita and rzad == 1 and len(obecne) == len(wartosci) and all(v == 0 or v == 1 for v in obecne):
+        bity.append('11' + ''.join('1' if v else '0' for v in wartosci))
+        return
+    stala = _staloprzecinkowa(obecne, calkowita)
+    bity.append('01' if stala else '10')
+    if len(obecne) < len(wartosci):
+        bity.append('1' + ''.join('0' if v is None else '1' for v in wartosci))
+    else:
+        bity.append('0')
+    if stala is None:
+        _koduj_xor(bity, obecne)
+        return
+    miejsca, f32, k = stala
+    bity.append(format(miejsca, '03b') + ('1' if f32 else '0') + ('1' if rzad == 2 else '0'))
+    poprzednia, delta = 0, 0
+    for x in k:
+        if rzad == 2:
+            _liczba(bity, x - poprzednia - delta)
+            delta = x - poprzednia
+        else:
+            _liczba(bity, x - poprzednia)
+        poprzednia = x
+
+
+def koduj_blok(wiersze, stacja=0):
+    """Koduje odczyty [(seq, ts, t1, t2, hu, wi, fa)] (najwyżej 65535) jako jeden blok"""
+    n = len(wiersze)
+    if not 0 < n <= 0xFFFF:
+        raise BladKodeka(f"blok musi miec od 1 do 65535 wierszy, jest {n}")
+    kolumny = list(zip(*wiersze))
+    bity = []
+    for wartosci, (calkowita, rzad) in zip(kolumny, _KOLUMNY):
+        _koduj_kolumne(bity, list(wartosci), calkowita, rzad)
+    ciag = ''.join(bity)
+    ciag += '0' * (-len(ciag) % 8)
+    dane = int(ciag, 2).to_bytes(len(ciag) // 8, 'big') if ciag else b''
+    seq, ts = kolumny[0], kolumny[1]
+    naglowek = NAGLOWEK_BLOKU.pack(MAGIC_BLOKU, WERSJA_KODEKA, 0, n, NAGLOWEK_BLOKU.size + len(dane),
+                                   stacja, min(seq), max(seq), min(ts), max(ts))
+    return naglowek + dane
+
+
+def naglowek_bloku(dane, przesuniecie=0):
+    """-> (liczba wierszy, długość bloku, stacja, seq_od, seq_do, ts_od, ts_do)"""
+    magic, wersja, _, n, dlugosc, stacja, seq_od, seq_do, ts_od, ts_do = \
+        NAGLOWEK_BLOKU.unpack_from(dane, przesuniecie)
+    if magic != MAGIC_BLOKU or wersja != WERSJA_KODEKA:
+        raise BladKodeka(f"nieznany blok {magic!r} w{wersja} na pozycji {przesuniecie}")
+    return n, dlugosc, stacja, seq_od, seq_do, ts_od, ts_do
+
+
+class _Czytnik:
+    """Strumień bitów bloku jako napis '0101...' - wycinki są szybkie w czystym Pythonie"""
+    def __init__(self, dane):
+        self.bity = format(int.from_bytes(dane, 'big'), f'0{len(dane) * 8}b') if dane else ''
+        self.pozycja = 0
+
+    def czytaj(self, n):
+        p = self.pozycja
+        self.pozycja = p + n
+        return int(self.bity[p:p + n], 2)
+
+    def liczba(self):
+        bity, p = self.bity, self.pozycja
+        jedynki = 0
+        while jedynki < 5 and bity[p + jedynki] == '1':
+            jedynki += 1
+        if jedynki == 0:
+            self.pozycja = p + 1
+            return 0
+        dlugosc = _DLUGOSCI[jedynki - 1]
+        p += jedynki + (jedynki < 5)
+        self.pozycja = p + dlugosc
+        return _odzigzag(int(bity[p:p + dlugosc], 2))
+
+    def napis(self, n):
+        p = self.pozycja
+        self.pozycja = p + n
+        return self.bity[p:p + n]
+
+
+def _dekoduj_xor(czytnik, n):
+    poprzednia = czytnik.czytaj(64)
+    wynik = [poprzednia]
+    wiodace = koncowe = 0
+    for _ in range(n - 1):
+        if czytnik.czytaj(1):
+            if czytnik.czytaj(1):
+                wiodace = czytnik.czytaj(6)
+                dlugosc = czytnik.czytaj(6) + 1
+                koncowe = 64 - wiodace - dlugosc
+            poprzednia ^= czytnik.czytaj(64 - wiodace - koncowe) << koncowe
+        wynik.append(poprzednia)
+    return list(struct.unpack(f'<{n}d', struct.pack(f'<{n}Q', *wynik)))
+
+
+def _dekoduj_kolumne(czytnik, n, calkowita):
+    tryb = czytnik.czytaj(2)
+    if tryb == _PUSTA:
+        return [None] * n
+    if tryb == _FLAGI:
+        return [int(b) for b in czytnik.napis(n)]
+    maska = czytnik.napis(n) if czytnik.czytaj(1) else None
+    liczba_obecnych = n if maska is None else maska.count('1')
+    if tryb == _XOR:
+        obecne = _dekoduj_xor(czytnik, liczba_obecnych)
+    else:
+        miejsca, f32, rzad2 = czytnik.czytaj(3), czytnik.czytaj(1), czytnik.czytaj(1)
+        obecne = []
+        poprzednia = delta = 0
+        for _ in range(liczba_obecnych):
+            if rzad2:
+                delta += czytnik.liczba()
+                poprzednia += delta
+            else:
+                poprzednia += czytnik.liczba()
+            obecne.append(poprzednia)
+        if not calkowita:
+            skala = 10 ** miejsca
+            obecne = [x / skala for x in obecne]
+            if f32:
+                obecne = array('f', obecne).tolist()
+    if maska is None:
+        return obecne
+    it = iter(obecne)
+    return [next(it) if b == '1' else None for b in maska]
+
+
+def dekoduj_blok(dane, przesuniecie=0):
+    """Blok -> [(seq, ts, t1, t2, hu, wi, fa)] w kolejności zapisu"""
+    n, dlugosc = naglowek_bloku(dane, przesuniecie)[:2]
+    czytnik = _Czytnik(bytes(dane[przesuniecie + NAGLOWEK_BLOKU.size:przesuniecie + dlugosc]))
+    kolumny = [_dekoduj_kolumne(czytnik, n, calkowita) for calkowita, _ in _KOLUMNY]
+    return list(zip(*kolumny))
+
+
+def koduj_serie(wiersze, kursor, stacja=0, rozmiar_bloku=ROZMIAR_BLOKU):
+    """Odpowiedź API: nagłówek serii i bloki po rozmiar_bloku wierszy"""
+    czesci = [NAGLOWEK_SERII.pack(MAGIC_SERII, WERSJA_KODEKA, 0, 0, kursor)]
+    for i in range(0, len(wiersze), rozmiar_bloku):
+        czesci.append(koduj_blok(wiersze[i:i + rozmiar_bloku], stacja))
+    return b''.join(czesci)
+
+
+def bloki(dane, przesuniecie=0):
+    """Generator (przesunięcie, nagłówek bloku) - przeskakuje bloki bez dekodowania"""
+    while przesuniecie < len(dane):
+        naglowek = naglowek_bloku(dane, przesuniecie)
+        yield przesuniecie, naglowek
+        przesuniecie += naglowek[1]
+
+
+def dekoduj_serie(dane, od_ts=None, do_ts=None):
+    """
+    Seria -> (wiersze, kursor). Z od_ts/do_ts dekodowane są tylko bloki
+    nachodzące na zakres, a wiersze są zawężone do [od_ts, do_ts].
+    """
+    magic, wersja, _, _, kursor = NAGLOWEK_SERII.unpack_from(dane)
+    if magic != MAGIC_SERII or wersja != WERSJA_KODEKA:
+        raise BladKodeka(f"nieznana seria {magic!r} w{wersja}")
+    od_ts = -math.inf if od_ts is None else od_ts
+    do_ts = math.inf if do_ts is None else do_ts
+    wiersze = []
+    for przesuniecie, (_, _, _, _, _, ts_od, ts_do) in bloki(dane, NAGLOWEK_SERII.size):
+        if ts_do >= od_ts and ts_od <= do_ts:
+            wiersze.extend(w for w in dekoduj_blok(dane, przesuniecie) if od_ts <= w[1] <= do_ts)
+    return wiersze, kursor
+
+
+# === SAMOTEST ===
+
+def _seria_testowa(n, t0=1_700_000_000.0, seq0=1):
+    import random
+    los = random.Random(7)
+    wiersze = []
+    t, temp, wilg = t0, 4.0, 80.0
+    for i in range(n):
+        t = round(t + 30 + los.uniform(-0.05, 0.05), 3)
+        temp += los.choice((-0.1, 0.0, 0.0, 0.1))
+        wilg = min(100.0, max(30.0, wilg + los.choice((-0.5, 0.0, 0.5))))
+        t1 = array('f', [round(temp, 1)])[0]    # DS18B20 przez float32 ramki Pomiar
+        t2 = array('f', [round(temp + 0.37, 2)])[0]
+        wiatr = None if i % 50 == 7 else round(abs(los.gauss(5, 2)), 1)
+        wiersze.append((seq0 + 8 * i + los.randint(0, 3), t, t1, t2, wilg, wiatr, int(temp < 2.0)))
+    return wiersze
+
+
+def _samotest():
+    import time
+
+    wiersze = _seria_testowa(2000)
+    # Przypadki brzegowe: pojedynczy wiersz, same braki, NaN, ts z pełną precyzją
+    przypadki = [
+        wiersze[:1],
+        [(1, 1.5, None, None, None, None, None)],
+        [(1, 1e9 + 1 / 3, float('nan'), 1e300, -0.1, float('inf'), 3), (9, 1e9 + 2 / 3, 2.5, 0.0, None, 1.0, 0)],
+        [(5, 10.0, 0.1 + 0.2, 1.0, 2.0, 3.0, 1), (6, 40.0, 7.25, -1.0, 2.0, 3.0, 0)],
+    ]
+    for przypadek in przypadki:
+        odtworzone = dekoduj_blok(koduj_blok(przypadek))
+        assert json.dumps(odtworzone) == json.dumps(przypadek), (przypadek, odtworzone)
+
+    start = time.perf_counter()
+    seria = koduj_serie(wiersze, wiersze[-1][0], stacja=5)
+    czas_kodowania = time.perf_counter() - start
+    start = time.perf_counter()
+    odtworzone, kursor = dekoduj_serie(seria)
+    czas_dekodowania = time.perf_counter() - start
+    assert odtworzone == wiersze and kursor == wiersze[-1][0]
+
+    surowe = len(json.dumps(wiersze))
+    kolumnowe = 16 + len(wiersze) * (8 + 4 + 4 * 4 + 1)
+    print(f"{len(wiersze)} odczytow: kodek {len(seria)} B ({len(seria) / len(wiersze):.1f} B/odczyt), "
+          f"kolumnowy {kolumnowe} B, JSON {surowe} B")
+    print(f"kodowanie {czas_kodowania * 1000:.1f} ms, dekodowanie {czas_dekodowania * 1000:.1f} ms")
+    assert len(seria) * 3 < kolumnowe
+
+    # Dostęp swobodny: zakres z jednego bloku dekoduje tylko ten blok
+    od_ts, do_ts = wiersze[300][1], wiersze[310][1]
+    zakres, _ = dekoduj_serie(seria, od_ts, do_ts)
+    assert zakres == wiersze[300:311]
+    naglowki = [n for _, n in bloki(seria, NAGLOWEK_SERII.size)]
+    assert len(naglowki) == 8 and naglowki[1][2] == 5 and naglowki[1][3] == wiersze[256][0]
+    try:
+        dekoduj_blok(b'XXXX' + seria[NAGLOWEK_SERII.size + 4:])
+    except BladKodeka:
+        pass
+    else:
+        raise AssertionError("zly magic")
+    print("OK")
+
+
+def _porownaj(sciezka):
+    """Rozmiar historii w blokach kodeka względem wierszy SQLite i JSON"""
+    import sqlite3
+    db = sqlite3.connect(sciezka)
+    razem_wierszy = razem_kodek = razem_json = 0
+    for (stacja,) in db.execute("SELECT DISTINCT stacja FROM odczyty ORDER BY stacja"):
+        wiersze = db.execute("SELECT seq, ts, t1, t2, hu, wi, fa FROM odczyty WHERE stacja = ? ORDER BY seq",
+                             (stacja,)).fetchall()
+        kodek = len(koduj_serie(wiersze, 0, stacja))
+        surowe = len(json.dumps(wiersze))
+        print(f"stacja {stacja}: {len(wiersze)} odczytow, kodek {kodek} B, JSON {surowe} B")
+        razem_wierszy += len(wiersze)
+        razem_kodek += kodek
+        razem_json += surowe
+    if razem_wierszy:
+        print(f"razem: {razem_kodek / razem_wierszy:.1f} B/odczyt (JSON {razem_json / razem_wierszy:.1f})")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        _samotest()
+    elif sys.argv[1:2] == ['porownaj'] and len(sys.argv) == 3:
+        _porownaj(sys.argv[2])
+    else:
+        print("Uzycie: python3 kodek.py test | porownaj <historia.db>")
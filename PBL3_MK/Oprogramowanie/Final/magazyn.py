@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+# Trwały magazyn historii pomiarów (SQLite) dla serwera WWW.
+# Każdy zapisany odczyt dostaje rosnący numer sekwencyjny (seq), który
+# przetrwa restart serwera - klient może więc pytać "co nowego od seq X".
+#
+# Najnowsze odczyty stacji (GORACE_ODCZYTY) są zwykłymi wierszami tabeli
+# odczyty, starsze są pakowane po ROZMIAR_BLOKU w bloki kodeka (kodek.py,
+# ~6 B na odczyt zamiast ~60 B wiersza SQLite) w tabeli bloki. Zapytania
+# scalają oba źródła, więc dla wywołującego nic się nie zmienia.
+#
+#   python3 magazyn.py kompaktuj historia.db   - spakowanie istniejącej bazy
+#   python3 magazyn.py test
+
+import os
+import sys
+import heapq
+import struct
+import sqlite3
+import threading
+from array import array
+
+import kodek
+from kodek import ROZMIAR_BLOKU
+
+# Kolumny historii w kolejności używanej przez API i wykresy
+POLA = ('T1', 'T2', 'Hu', 'Wi', 'Fa')
+# Czas odczytu zapisujemy z dokładnością do 1 ms - kodek zapisuje go wtedy
+# jako delty-delt całkowitych milisekund (kilka bitów zamiast 8 B)
+DOKLADNOSC_CZASU = 3
+GORACE_ODCZYTY = ROZMIAR_BLOKU
+# Najwięcej bloków pakowanych przy jednym zapisie - zaległości (np. baza
+# sprzed kompresji) schodzą stopniowo, bez długiej przerwy w zapisie
+MAKS_BLOKOW_NA_ZAPIS = 4
+
+_SCHEMAT = """
+CREATE TABLE IF NOT EXISTS odczyty (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    stacja  INTEGER NOT NULL,
+    ts      REAL NOT NULL,
+    t1      REAL,
+    t2      REAL,
+    hu      REAL,
+    wi      REAL,
+    fa      INTEGER
+);
+CREATE INDEX IF NOT EXISTS odczyty_stacja_seq ON odczyty (stacja, seq);
+CREATE INDEX IF NOT EXISTS odczyty_stacja_ts ON odczyty (stacja, ts);
+CREATE TABLE IF NOT EXISTS bloki (
+    stacja  INTEGER NOT NULL,
+    seq_od  INTEGER NOT NULL,
+    seq_do  INTEGER NOT NULL,
+    ts_od   REAL NOT NULL,
+    ts_do   REAL NOT NULL,
+    n       INTEGER NOT NULL,
+    dane    BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bloki_stacja_seq ON bloki (stacja, seq_do);
+CREATE INDEX IF NOT EXISTS bloki_stacja_ts ON bloki (stacja, ts_od);
+"""
+
+_KOLUMNY = "seq, ts, t1, t2, hu, wi, fa"
+
+# Nagłówek formatu kolumnowego: magic, wersja, zarezerwowane, liczba wierszy, kursor
+NAGLOWEK_KOLUMNOWY = struct.Struct('<4sBBHII')
+MAGIC_KOLUMNOWY = b'PBLH'
+
+
+class MagazynHistorii:
+    """
+    Magazyn odczytów z jednym współdzielonym połączeniem chronionym blokadą.
+    Długie odczyty (eksport) powinny używać własnego połączenia z
+    nowe_polaczenie(), żeby nie blokować bieżących zapisów.
+    rozmiar_bloku=0 wyłącza pakowanie nowych odczytów w bloki.
+    """
+    def __init__(self, sciezka, rozmiar_bloku=ROZMIAR_BLOKU, gorace=GORACE_ODCZYTY):
+        self.sciezka = sciezka
+        self.rozmiar_bloku = rozmiar_bloku
+        self.gorace = gorace
+        self._zapisy = {}
+        self._blokada = threading.Lock()
+        self._db = self.nowe_polaczenie()
+        with self._blokada:
+            self._db.executescript(_SCHEMAT)
+            self._db.commit()
+
+    def nowe_polaczenie(self):
+        db = sqlite3.connect(self.sciezka, check_same_thread=False)
+        # WAL - czytelnicy nie blokują zapisu i odwrotnie
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def zapisz(self, stacja, ts, t1, t2, hu, wi, fa):
+        """Zapisuje odczyt i zwraca jego numer sekwencyjny"""
+        with self._blokada:
+            kursor = self._db.execute(
+                "INSERT INTO odczyty (stacja, ts, t1, t2, hu, wi, fa) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stacja, ts, t1, t2, hu, wi, fa))
+            self._db.commit()
+            if self.rozmiar_bloku:
+                # Sprawdzenie co rozmiar_bloku zapisów stacji (pierwsze - od razu po starcie)
+                zapisy = self._zapisy.get(stacja, self.rozmiar_bloku) + 1
+                if zapisy >= self.rozmiar_bloku:
+                    zapisy = 0
+                    if self._kompaktuj(stacja, MAKS_BLOKOW_NA_ZAPIS) == MAKS_BLOKOW_NA_ZAPIS:
+                        zapisy = self.rozmiar_bloku
+                self._zapisy[stacja] = zapisy
+            return kursor.lastrowid
+
+    def _kompaktuj(self, stacja, maks_blokow=None):
+        """Pakuje najstarsze odczyty stacji ponad `gorace` w bloki, zwraca liczbę bloków"""
+        spakowane = 0
+        while maks_blokow is None or spakowane < maks_blokow:
+            (liczba,) = self._db.execute("SELECT COUNT(*) FROM odczyty WHERE stacja = ?", (stacja,)).fetchone()
+            if liczba < self.rozmiar_bloku + self.gorace:
+                break
+            wiersze = self._db.execute(
+                f"SELECT {_KOLUMNY} FROM odczyty WHERE stacja = ? ORDER BY seq LIMIT ?",
+                (stacja, self.rozmiar_bloku)).fetchall()
+            dane = kodek.koduj_blok(wiersze, stacja)
+            n, _, _, seq_od, seq_do, ts_od, ts_do = kodek.naglowek_bloku(dane)
+            with self._db:
+                self._db.execute("INSERT INTO bloki (stacja, seq_od, seq_do, ts_od, ts_do, n, dane) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)", (stacja, seq_od, seq_do, ts_od, ts_do, n, dane))
+                self._db.execute("DELETE FROM odczyty WHERE stacja = ? AND seq BETWEEN ? AND ?",
+                                 (stacja, seq_od, seq_do))
+            spakowane += 1
+        return spakowane
+
+    def kompaktuj(self):
+        """Pakuje zaległe odczyty wszystkich stacji (migracja istniejącej bazy), zwraca liczbę bloków"""
+        with self._blokada:
+            stacje = [s for (s,) in self._db.execute("SELECT DISTINCT stacja FROM odczyty")]
+            return sum(self._kompaktuj(stacja) for stacja in stacje)
+
+    def _bloki(self, db, warunek, parametry):
+        """Rozpakowane bloki [(seq_od, seq_do, ts_od, wiersze)] spełniające warunek, w kolejności zapytania"""
+        for seq_od, seq_do, ts_od, dane in db.execute(
+                f"SELECT seq_od, seq_do, ts_od, dane FROM bloki WHERE {warunek}", parametry):
+            yield seq_od, seq_do, ts_od, kodek.dekoduj_blok(dane)
+
+    def ostatnie(self, stacja, n):
+        """Ostatnie n odczytów stacji w kolejności rosnącej: [(seq, ts, t1, t2, hu, wi, fa)]"""
+        with self._blokada:
+            wiersze = self._db.execute(
+                f"SELECT {_KOLUMNY} FROM odczyty WHERE stacja = ? ORDER BY seq DESC LIMIT ?",
+                (stacja, n)).fetchall()
+            for _, seq_do, _, blok in self._bloki(self._db, "stacja = ? ORDER BY seq_do DESC", (stacja,)):
+                if len(wiersze) >= n and seq_do < wiersze[-1][0]:
+                    break
+                wiersze.extend(blok)
+                wiersze.sort(reverse=True)
+                del wiersze[n:]
+        wiersze.reverse()
+        return wiersze
+
+    def od_kursora(self, stacja, since, limit):
+        """Odczyty stacji z seq > since (najwyżej limit najstarszych)"""
+        with self._blokada:
+            wiersze = self._db.execute(
+                f"SELECT {_KOLUMNY} FROM odczyty WHERE stacja = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (stacja, since, limit)).fetchall()
+            for seq_od, _, _, blok in self._bloki(
+                    self._db, "stacja = ? AND seq_do > ? ORDER BY seq_od", (stacja, since)):
+                if len(wiersze) >= limit and seq_od > wiersze[-1][0]:
+                    break
+                wiersze.extend(w for w in blok if w[0] > since)
+                wiersze.sort()
+                del wiersze[limit:]
+        return wiersze
+
+    def _po_czasie(self, db, stacja, od_ts, do_ts):
+        """
+        Generator odczytów stacji z [od_ts, do_ts] w kolejności czasu -
+        scalanie wierszy z kursora SQLite z blokami rozpakowywanymi po kolei
+        (w pamięci są tylko bloki nachodzące na siebie w czasie).
+        """
+        gorace = db.execute(
+            f"SELECT {_KOLUMNY} FROM odczyty WHERE stacja = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+            (stacja, od_ts, do_ts))
+        bloki = db.execute("SELECT ts_od, rowid FROM bloki WHERE stacja = ? AND ts_do >= ? AND ts_od <= ? "
+                           "ORDER BY ts_od", (stacja, od_ts, do_ts)).fetchall()
+        kopiec = []
+        nastepny = next(gorace, None)
+        for granica, id_bloku in bloki + [(float('inf'), None)]:
+            # Wszystko sprzed początku następnego bloku jest już kompletne
+            while True:
+                if kopiec and (nastepny is None or kopiec[0][:2] <= (nastepny[1], nastepny[0])):
+                    if kopiec[0][0] >= granica:
+                        break
+                    yield heapq.heappop(kopiec)[2]
+                elif nastepny is not None and nastepny[1] < granica:
+                    yield nastepny
+                    nastepny = next(gorace, None)
+                else:
+                    break
+            if id_bloku is None:
+                break
+            (dane,) = db.execute("SELECT dane FROM bloki WHERE rowid = ?", (id_bloku,)).fetchone()
+            for w in kodek.dekoduj_blok(dane):
+                if od_ts <= w[1] <= do_ts:
+                    heapq.heappush(kopiec, (w[1], w[0], w))
+
+    def zakres(self, stacja, od_ts, do_ts):
+        """
+        Odczyty stacji z przedziału czasu [od_ts, do_ts] w kolejności czasu.
+        Na własnym połączeniu - długi zakres z rozpakowywaniem bloków nie
+        wstrzymuje zapisów; jedna transakcja odczytu daje spójny obraz
+        wierszy i bloków, nawet gdy kompaktowanie przenosi je w trakcie.
+        """
+        db = self.nowe_polaczenie()
+        try:
+            db.execute("BEGIN")
+            return list(self._po_czasie(db, stacja, od_ts, do_ts))
+        finally:
+            db.close()
+
+    def _rozpakuj(self, stacja, od_ts, do_ts):
+        """Bloki nachodzące na [od_ts, do_ts] wracają do tabeli odczyty (z tymi samymi seq)"""
+        bloki = self._db.execute("SELECT rowid, dane FROM bloki WHERE stacja = ? AND ts_do >= ? AND ts_od <= ?",
+                                 (stacja, od_ts, do_ts)).fetchall()
+        for id_bloku, dane in bloki:
+            self._db.executemany(
+                "INSERT INTO odczyty (seq, stacja, ts, t1, t2, hu, wi, fa) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(w[0], stacja) + w[1:] for w in kodek.dekoduj_blok(dane)])
+            self._db.execute("DELETE FROM bloki WHERE rowid = ?", (id_bloku,))
+
+    def zastap_zakres(self, stacja, od_ts, do_ts, wiersze):
+        """
+        Podmienia odczyty stacji z przedziału [od_ts, do_ts] na nowe
+        [(ts, t1, t2, hu, wi, fa)] w jednej transakcji. Zwraca liczbę usuniętych.
+
+        Nowe odczyty (w kolejności czasu) przejmują seq usuniętych, żeby
+        ostatnie() i kursory klientów nie widziały starych danych jako
+        najnowszych; nowe seq dostają tylko odczyty ponad liczbę usuniętych.
+        """
+        wiersze = sorted(wiersze, key=lambda w: w[0])
+        with self._blokada:
+            with self._db:
+                self._rozpakuj(stacja, od_ts, do_ts)
+                seq = [s for (s,) in self._db.execute(
+                    "SELECT seq FROM odczyty WHERE stacja = ? AND ts BETWEEN ? AND ? ORDER BY seq",
+                    (stacja, od_ts, do_ts))]
+                self._db.execute("DELETE FROM odczyty WHERE stacja = ? AND ts BETWEEN ? AND ?",
+                                 (stacja, od_ts, do_ts))
+                self._db.executemany(
+                    "INSERT INTO odczyty (seq, stacja, ts, t1, t2, hu, wi, fa) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(s, stacja) + tuple(w) for s, w in zip(seq, wiersze)])
+                self._db.executemany(
+                    "INSERT INTO odczyty (stacja, ts, t1, t2, hu, wi, fa) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(stacja,) + tuple(w) for w in wiersze[len(seq):]])
+            return len(seq)
+
+    def porcje(self, stacje, od_ts, do_ts, rozmiar_porcji=2000):
+        """
+        Generator porcji odczytów [(stacja, seq, ts, t1, t2, hu, wi, fa)]
+        dla eksportu - stacja po stacji, w kolejności czasu. Używa własnego
+        połączenia i kursora, więc pamięć nie zależy od zakresu, a bieżące
+        zapisy nie czekają na blokadę.
+        """
+        db = self.nowe_polaczenie()
+        try:
+            for stacja in stacje:
+                porcja = []
+                for w in self._po_czasie(db, stacja, od_ts, do_ts):
+                    porcja.append((stacja,) + tuple(w))
+                    if len(porcja) == rozmiar_porcji:
+                        yield porcja
+                        porcja = []
+                if porcja:
+                    yield porcja
+        finally:
+            db.close()
+
+    def statystyki(self):
+        with self._blokada:
+            odczyty = self._db.execute("SELECT COUNT(*) FROM odczyty").fetchone()[0]
+            bloki, spakowane, bajty = self._db.execute(
+                "SELECT COUNT(*), TOTAL(n), TOTAL(LENGTH(dane)) FROM bloki").fetchone()
+        return {'odczyty': odczyty, 'bloki': bloki, 'odczyty_w_blokach': int(spakowane),
+                'bajty_blokow': int(bajty)}
+
+    def zamknij(self):
+        with self._blokada:
+            self._db.close()
+
+
+def _kolumna(typ, wartosci):
+    kolumna = array(typ, wartosci)
+    if sys.byteorder == 'big':
+        kolumna.byteswap()
+    return kolumna.tobytes()
+
+
+def koduj_kolumnowo(wiersze, kursor):
+    """
+    Koduje odczyty [(seq, ts, t1, t2, hu, wi, fa)] jako binarne kolumny
+    gotowe do użycia jako typed arrays w przeglądarce (little-endian):
+      nagłówek 16 B | Ts Float64[n] | Seq Uint32[n] | T1,T2,Hu,Wi Float32[n] | Fa Int8[n]
+    Float64 jest pierwszy, bo wymaga przesunięcia podzielnego przez 8.
+    Brakujące wartości są kodowane jako NaN.
+    """
+    n = len(wiersze)
+    nan = float('nan')
+    czesci = [NAGLOWEK_KOLUMNOWY.pack(MAGIC_KOLUMNOWY, 1, 0, 0, n, kursor),
+              _kolumna('d', [w[1] for w in wiersze]),
+              _kolumna('I', [w[0] for w in wiersze])]
+    for i in range(2, 6):
+        czesci.append(_kolumna('f', [nan if w[i] is None else w[i] for w in wiersze]))
+    czesci.append(_kolumna('b', [w[6] or 0 for w in wiersze]))
+    return b''.join(czesci)
+
+
+def _samotest():
+    import random
+    import tempfile
+
+    sciezka = os.path.join(tempfile.mkdtemp(), 'historia.db')
+    magazyn = MagazynHistorii(sciezka, rozmiar_bloku=32, gorace=16)
+    los = random.Random(3)
+    t0 = 1_700_000_000.0
+    wzorzec = {0: [], 5: []}
+    for i in range(600):
+        for stacja in wzorzec:
+            ts = round(t0 + 30 * i + los.uniform(0, 0.5), DOKLADNOSC_CZASU)
+            wiersz = (ts, round(4 + los.gauss(0, 1), 1), None if i % 9 == 0 else 5.25, 80.0, 3.5, int(i % 40 == 0))
+            wzorzec[stacja].append((magazyn.zapisz(stacja, *wiersz),) + wiersz)
+    statystyki = magazyn.statystyki()
+    print(statystyki)
+    assert statystyki['bloki'] > 20 and statystyki['odczyty'] <= 2 * (2 * 32 + 16)
+
+    wzorcowe = wzorzec[5]
+    assert magazyn.ostatnie(5, 72) == wzorcowe[-72:]
+    assert magazyn.ostatnie(5, 10_000) == wzorcowe
+    assert magazyn.od_kursora(5, wzorcowe[100][0], 50) == wzorcowe[101:151]
+    assert magazyn.zakres(5, wzorcowe[40][1], wzorcowe[400][1]) == wzorcowe[40:401]
+    porcje = list(magazyn.porcje([0, 5], 0, float('inf'), rozmiar_porcji=250))
+    assert [w[1:] for p in porcje for w in p if w[0] == 5] == wzorcowe and len(porcje) == 6
+
+    # Podmiana zakresu wewnątrz bloku rozpakowuje go, reszta historii bez zmian
+    od_ts, do_ts = wzorcowe[50][1], wzorcowe[59][1]
+    nowe = [(od_ts, 1.0, 1.0, 1.0, 1.0, 0), (do_ts, 2.0, 2.0, 2.0, 2.0, 1)]
+    assert magazyn.zastap_zakres(5, od_ts, do_ts, nowe) == 10
+    zakres = magazyn.zakres(5, wzorcowe[45][1], wzorcowe[65][1])
+    assert [w[1:] for w in zakres] == [w[1:] for w in wzorcowe[45:50]] + nowe + [w[1:] for w in wzorcowe[60:66]]
+    # Nowe odczyty przejmują seq zastąpionych - najnowszy odczyt się nie zmienia
+    assert [w[0] for w in zakres[5:7]] == [wzorcowe[50][0], wzorcowe[51][0]]
+    assert magazyn.ostatnie(5, 1)[0] == wzorcowe[-1]
+    magazyn.kompaktuj()
+    assert magazyn.zakres(5, wzorcowe[45][1], wzorcowe[65][1]) == zakres
+    magazyn.zamknij()
+    print("OK")
+
+
+def _kompaktuj_plik(sciezka):
+    przed = os.path.getsize(sciezka)
+    magazyn = MagazynHistorii(sciezka)
+    bloki = magazyn.kompaktuj()
+    print(magazyn.statystyki())
+    magazyn.zamknij()
+    # Zwolnione strony wracają do systemu plików dopiero po VACUUM
+    db = sqlite3.connect(sciezka)
+    db.execute("VACUUM")
+    db.close()
+    print(f"{bloki} nowych blokow, plik {przed / 1e6:.1f} MB -> {os.path.getsize(sciezka) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        _samotest()
+    elif sys.argv[1:2] == ['kompaktuj'] and len(sys.argv) == 3:
+        _kompaktuj_plik(sys.argv[2])
+    else:
+        print("Uzycie: python3 magazyn.py test | kompaktuj <historia.db>")
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# Test obciążenia serwera WWW (ff.py) - tysiące klientów Socket.IO lokalnie.
+# Klienci łączą się z serwerem, a skrypt publikuje pomiary przez MQTT (ta sama
+# ścieżka co odbiornik LoRa). Każdy pomiar niesie znacznik w polu T1, więc
+# klient może policzyć opóźnienie od publikacji do odebrania values_update.
+#
+# Przykład:
+#   python3 ff.py --produkcja &
+#   python3 obciazenie_socketio.py --klienci 2000 --pomiary 50 --pid $!
+#
+# Wymaga: python-socketio[asyncio_client] (aiohttp), paho-mqtt
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import socketio
+import paho.mqtt.client as mqtt
+
+from pomiar import Pomiar
+
+# Stacja używana do testu (ID LoRa i indeks na stronie, patrz STATION_ID_TO_INDEX)
+STACJA_TESTOWA = "01"
+INDEKS_TESTOWY = "5"
+
+
+def pamiec_procesu(pid):
+    """Zwraca RSS procesu w kB (Linux /proc), None gdy niedostępne"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linia in f:
+                if linia.startswith("VmRSS:"):
+                    return int(linia.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentyl(dane, p):
+    if not dane:
+        return None
+    dane = sorted(dane)
+    return dane[min(len(dane) - 1, int(p / 100.0 * len(dane)))]
+
+
+class Pomiary:
+    def __init__(self):
+        self.wyslane = {}      # znacznik -> czas publikacji
+        self.opoznienia = []
+        self.odebrane = 0
+        self.polaczone = 0
+        self.bledy = 0
+
+    def odbior(self, dane):
+        teraz = time.perf_counter()
+        self.odebrane += 1
+        wartosci = dane.get(INDEKS_TESTOWY) if isinstance(dane, dict) else None
+        if not wartosci:
+            return
+        znacznik = round(wartosci[0] * 100)
+        czas_wyslania = self.wyslane.get(znacznik)
+        if czas_wyslania is not None:
+            self.opoznienia.append((teraz - czas_wyslania) * 1000.0)
+
+
+async def klient(url, pomiary, stop):
+    sio = socketio.AsyncClient(reconnection=False)
+    sio.on('values_update', pomiary.odbior)
+    try:
+        await sio.connect(url, transports=['websocket'])
+        pomiary.polaczone += 1
+        await stop.wait()
+    except Exception:
+        pomiary.bledy += 1
+    finally:
+        if sio.connected:
+            await sio.disconnect()
+
+
+async def test(args):
+    pomiary = Pomiary()
+    stop = asyncio.Event()
+
+    rss_przed = pamiec_procesu(args.pid)
+
+    print(f"Laczenie {args.klienci} klientow z {args.url} ...")
+    zadania = []
+    for i in range(args.klienci):
+        zadania.append(asyncio.create_task(klient(args.url, pomiary, stop)))
+        if i % args.paczka == args.paczka - 1:
+            await asyncio.sleep(0.05)
+    poczatek = time.time()
+    while pomiary.polaczone + pomiary.bledy < args.klienci and time.time() - poczatek < args.limit:
+        await asyncio.sleep(0.2)
+    await asyncio.sleep(1.0)
+
+    rss_po = pamiec_procesu(args.pid)
+    print(f"Polaczono: {pomiary.polaczone}, bledy: {pomiary.bledy}")
+
+    mqtt_klient = mqtt.Client()
+    mqtt_klient.connect(args.broker, args.port_mqtt, 60)
+    mqtt_klient.loop_start()
+
+    # Pierwsze odebrane migawki pochodzą z połączenia - liczymy od zera
+    pomiary.odebrane = 0
+    for seq in range(1, args.pomiary + 1):
+        znacznik = seq % 100000
+        # Czas z częścią ułamkową - serwer odrzuca odczyty nie nowsze od
+        # ostatniego (at-least-once), a pomiarów jest kilka na sekundę
+        pomiar = Pomiar(STACJA_TESTOWA, time.time(),
+                        temp_ds=znacznik / 100.0, temp_bme=10.0, wilgotnosc=80.0, wiatr=1.0)
+        pomiary.wyslane[znacznik] = time.perf_counter()
+        mqtt_klient.publish(args.temat, pomiar.koduj())
+        await asyncio.sleep(1.0 / args.czestotliwosc)
+    await asyncio.sleep(args.wybieg)
+
+    stop.set()
+    await asyncio.gather(*zadania, return_exceptions=True)
+    mqtt_klient.loop_stop()
+
+    oczekiwane = pomiary.polaczone * args.pomiary
+    print("\n=== WYNIKI ===")
+    print(f"Klienci:              {pomiary.polaczone}")
+    print(f"Pomiary MQTT:         {args.pomiary} ({args.czestotliwosc} Hz)")
+    print(f"Odebrane migawki:     {pomiary.odebrane} / {oczekiwane} "
+          f"(upuszczone nieaktualne: {max(0, oczekiwane - pomiary.odebrane)})")
+    if pomiary.opoznienia:
+        print(f"Opoznienie emit [ms]: mediana {statistics.median(pomiary.opoznienia):.1f}, "
+              f"p95 {percentyl(pomiary.opoznienia, 95):.1f}, "
+              f"p99 {percentyl(pomiary.opoznienia, 99):.1f}, "
+              f"max {max(pomiary.opoznienia):.1f}")
+    if rss_przed is not None and rss_po is not None and pomiary.polaczone:
+        print(f"Pamiec serwera:       {rss_przed} kB -> {rss_po} kB "
+              f"({(rss_po - rss_przed) / pomiary.polaczone:.1f} kB/polaczenie)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test obciazenia Socket.IO serwera przymrozkowego")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--klienci', type=int, default=1000)
+    parser.add_argument('--paczka', type=int, default=100, help="klienci laczeni naraz")
+    parser.add_argument('--limit', type=float, default=60.0, help="limit czasu laczenia [s]")
+    parser.add_argument('--pomiary', type=int, default=50)
+    parser.add_argument('--czestotliwosc', type=float, default=5.0, help="pomiary na sekunde")
+    parser.add_argument('--wybieg', type=float, default=3.0, help="czas oczekiwania po ostatnim pomiarze [s]")
+    parser.add_argument('--broker', default='127.0.0.1')
+    parser.add_argument('--port-mqtt', type=int, default=1883)
+    parser.add_argument('--temat', default='lora/pogoda/bin')
+    parser.add_argument('--pid', type=int, default=None, help="PID serwera do pomiaru pamieci")
+    asyncio.run(test(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
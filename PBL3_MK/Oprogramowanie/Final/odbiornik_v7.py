@@ -2,14 +2,32 @@
 
 # Odbiornik LoRa Pi4B - LOGIKA PRZYMROZKOWA (Radiacyjna vs Adwekcyjna)
 # Format: ID(2) + TDS(6) + TBME(6) + HUM(5) + N(2) + CZAS(6) + WIATR(5) = 32B
+# Opcjonalne rozszerzenie: PORYW(5) + ZMIENNOSC(4) = 41B
+# oraz statystyki okna: TMIN/TMAX DS + TMIN/TMAX BME + SD DS/BME = 73B
 
 import sys
-import time
 import json
+import time
 import math
-import RPi.GPIO as GPIO
-from LoRaRF import SX126x, LoRaSpi, LoRaGpio
-import paho.mqtt.client as mqtt
+import threading
+
+try:
+    import RPi.GPIO as GPIO
+    from LoRaRF import SX126x, LoRaSpi, LoRaGpio
+except ImportError:
+    # Poza Raspberry Pi (np. ponowne przetwarzanie archiwum na PC) - bez radia
+    GPIO = SX126x = LoRaSpi = LoRaGpio = None
+
+from alarmy import SilnikAlarmow
+from detekcja_awarii import DetektorAwarii, TEMAT_AWARII
+from archiwum_ramek import ArchiwumRamek, KATALOG_ARCHIWUM
+from radio_udp import RadioUDP, PinUDP, adres_udp
+from pomiar import Pomiar
+from stan_odbiornika import StanOdbiornika
+import dziennik_mqtt
+from ramka import DLUGOSC_PREAMBULY
+from kanaly import KonfiguracjaRadiow, ScalaczRamek, RADIO_DOMYSLNE, PLIK_RADIOW
+import diagnostyka
 
 # === KONFIGURACJA LOGIKI ===
 # Poniżej 2.0 m/s uznajemy przymrozek za radiacyjny (DS18B20), powyżej za adwekcyjny (BME280).
@@ -22,29 +40,38 @@ MIN_CZAS_DO_TRENDU = 600
 # Słownik do przechowywania poprzednich pomiarów dla każdej stacji
 historia_pomiarow = {}
 
-# ustawienie MQTT
+# Awarie czujników (detekcja_awarii.py) - wartości z awarią nie trafiają do
+# wyboru temperatury i alarmów. sluchacz dostaje zdarzenia początku/końca awarii.
+detektor_awarii = DetektorAwarii()
+
+# Reguły alarmu przymrozkowego i powiadomienia (patrz alarmy.py).
+# Bez pliku obowiązują reguły domyślne: próg 2.0, suche powietrze, gwałtowny spadek.
+PLIK_ALARMOW = "alarmy.json"
+
+# --diagnostyka [port]: lokalny endpoint profilera/pamięci (diagnostyka.py)
+PORT_DIAGNOSTYKI = 5002
+
+# --cicho: bez wypisywania każdej ramki (testy obciążenia, setki stacji)
+WYPISUJ_RAMKI = '--cicho' not in sys.argv
+
+# ustawienie MQTT - JSON dla Telegrafa i starszych odbiorców, binarny Pomiar dla serwera WWW
 BROKER = "127.0.0.1"
-klient = mqtt.Client()
-try:
-    klient.connect(BROKER, 1883, 60)
-    klient.loop_start()
-    print("MQTT polaczono z brokerem")
-except Exception as e:
-    print(f"Blad polaczenia MQTT: {e}")
-
-# setup pinow do modułu sx1262
-PIN_RESET = 22
-PIN_BUSY  = 17
-PIN_DIO1  = 25
-PIN_RXEN  = 5
-PIN_TXEN  = 6
-PIN_CS    = 8
-
-# parametry lory
-CZESTOTLIWOSC = 868000000
-SF = 7
-BW = 500000
-CR = 5
+PORT_MQTT = 1883
+TEMAT_MQTT = "lora/pogoda"
+TEMAT_MQTT_BINARNY = "lora/pogoda/bin"
+# Odczyty czekające na potwierdzenie brokera (QoS 1) - przetrwają restart brokera i odbiornika
+PLIK_DZIENNIKA_MQTT = "dziennik_mqtt.db"
+
+def polacz_mqtt(broker=BROKER, port=PORT_MQTT, plik_dziennika=PLIK_DZIENNIKA_MQTT):
+    """
+    Ujście MQTT z dziennikiem na dysku (dziennik_mqtt.py). Łączy się w tle
+    i ponawia połączenie, więc działa także gdy broker jest niedostępny.
+    """
+    return dziennik_mqtt.polacz(broker, port, plik_dziennika)
+
+# Piny modułu SX1262 i parametry lory (CZESTOTLIWOSC, SF, BW, CR - wspólne ze stacją,
+# ramka.py) opisuje kanaly.Radio. Bez --radia: jedno radio RADIO_DOMYSLNE,
+# z --radia [plik]: kilka modułów, każdy na swoim kanale i we własnym wątku.
 
 def obliczanie_punktu_rosy(temperatura, wilgotnosc):
     """
@@ -126,31 +153,6 @@ def wybierz_temperature_do_analizy(ds_temp, bme_temp, wiatr):
         
     return wybrana_temp, zrodlo
 
-def ocena_ryzyka_przymrozku(temp, punkt_rosy, trend):
-    """
-    Decyduje czy wysłać ALARM (1) czy OK (0).
-    Łączy temperaturę, punkt rosy i szybkość spadku.
-    """
-    if temp is None:
-        return 0
-        
-    # 1. Próg bezwzględny (już jest zimno)
-    if temp <= 2.0:
-        return 1
-        
-    # 2. Analiza Punktu Rosy (predykcja suchego powietrza)
-    if punkt_rosy is not None:
-        # Jeśli punkt rosy ujemny i temp niska -> brak hamulca termicznego -> ALARM
-        if punkt_rosy < 0.0 and temp < 5.0:
-            return 1
-            
-    # 3. Analiza Trendu (gwałtowny spadek)
-    # Jeśli spada szybciej niż 1.5 stopnia na godzinę i jest już chłodno (<3.5)
-    if trend is not None and temp <= 3.5 and trend <= -1.5:
-        return 1
-        
-    return 0
-
 def parsowanie_ramki(dane):
     try:
         tekst = dane.decode('utf-8', errors='ignore')
@@ -170,6 +172,25 @@ def parsowanie_ramki(dane):
         czas_str = tekst[21:27]
         wiatr_str = tekst[27:32]
         
+        # Rozszerzenie ramki (nowsze stacje) - poryw 3 s i zmienność wiatru
+        poryw = None
+        zmiennosc_wiatru = None
+        if len(tekst) >= 41:
+            poryw = parsowanie_float(tekst[32:37])
+            zmiennosc_wiatru = parsowanie_float(tekst[37:41])
+        
+        # Statystyki okna pomiarowego (min/max/odchylenie)
+        statystyki = {}
+        if len(tekst) >= 73:
+            statystyki = {
+                'temp_ds18b20_min': parsowanie_float(tekst[41:47]),
+                'temp_ds18b20_max': parsowanie_float(tekst[47:53]),
+                'temp_bme280_min': parsowanie_float(tekst[53:59]),
+                'temp_bme280_max': parsowanie_float(tekst[59:65]),
+                'temp_ds18b20_sd': parsowanie_float(tekst[65:69]),
+                'temp_bme280_sd': parsowanie_float(tekst[69:73]),
+            }
+        
         return {
             'station_id': id_stacji,
             'temp_ds18b20': parsowanie_float(temp_ds_str),
@@ -177,22 +198,26 @@ def parsowanie_ramki(dane):
             'humidity': parsowanie_float(wilg_str),
             'samples': int(probki_str),
             'remote_time': f"{czas_str[0:2]}:{czas_str[2:4]}:{czas_str[4:6]}",
-            'wiatr': parsowanie_float(wiatr_str)
+            'wiatr': parsowanie_float(wiatr_str),
+            'poryw': poryw,
+            'zmiennosc_wiatru': zmiennosc_wiatru,
+            'statystyki': statystyki
         }
     except:
         return None
 
-def inicjalizacja_lory():
+def inicjalizacja_lory(radio=RADIO_DOMYSLNE):
     GPIO.setmode(GPIO.BCM)
     GPIO.setwarnings(False)
     
-    spi = LoRaSpi(0, 0)
-    cs = LoRaGpio(PIN_CS, 1)
-    reset = LoRaGpio(PIN_RESET, 1)
-    busy = LoRaGpio(PIN_BUSY, 0)
-    dio1 = LoRaGpio(PIN_DIO1, 0)
-    txen = LoRaGpio(PIN_TXEN, 1)
-    rxen = LoRaGpio(PIN_RXEN, 1)
+    piny = radio.piny
+    spi = LoRaSpi(*radio.spi)
+    cs = LoRaGpio(piny['cs'], 1)
+    reset = LoRaGpio(piny['reset'], 1)
+    busy = LoRaGpio(piny['busy'], 0)
+    dio1 = LoRaGpio(piny['dio1'], 0)
+    txen = LoRaGpio(piny['txen'], 1)
+    rxen = LoRaGpio(piny['rxen'], 1)
     
     lora = SX126x(spi, cs, reset, busy, dio1, txen, rxen)
     
@@ -210,10 +235,10 @@ def inicjalizacja_lory():
     lora.calibrate(0xFF)
     time.sleep(0.05)
     
-    lora.setFrequency(CZESTOTLIWOSC)
+    lora.setFrequency(radio.czestotliwosc)
     lora.setRxGain(SX126x.RX_GAIN_BOOSTED)
-    lora.setLoRaModulation(SF, BW, CR)
-    lora.setLoRaPacket(SX126x.HEADER_EXPLICIT, 12, 255, True, False)
+    lora.setLoRaModulation(radio.sf, radio.bw, radio.cr)
+    lora.setLoRaPacket(SX126x.HEADER_EXPLICIT, DLUGOSC_PREAMBULY, 255, True, False)
     lora.setSyncWord(SX126x.LORA_SYNC_WORD_PRIVATE)
     
     lora.clearIrqStatus(0x03FF)
@@ -225,92 +250,256 @@ def inicjalizacja_lory():
     
     return lora, rxen
 
-def main():    
-    lora, rxen = inicjalizacja_lory()
-    if not lora:
-        print("LoRa: inicjalizacja nieudana")
-        return
-    
-    print("LoRa: ustawiono tryb RX")
+def przetworz_ramke(dane_bajty, unix_time, silnik_alarmow):
+    """
+    Pełne przetwarzanie ramki: parsowanie, wybór temperatury, punkt rosy,
+    trend i alarm. Zwraca Pomiar (pomiar.py) albo None gdy ramki nie da
+    się sparsować. Wspólne dla trybu MQTT i trybu zintegrowanego z serwerem WWW.
+    """
+    sparsowane = parsowanie_ramki(dane_bajty)
+    if not sparsowane:
+        return None
+
+    # 0. Awarie czujników - wartości zamrożone, poza zakresem lub ze skokiem odpadają
+    ocena = detektor_awarii.ocen(
+        sparsowane['station_id'], unix_time,
+        sparsowane['temp_ds18b20'], sparsowane['temp_bme280'], sparsowane['humidity'])
+    if ocena.flagi and WYPISUJ_RAMKI:
+        print(f"         Awarie czujnikow: {', '.join(ocena.flagi)}")
+
+    # 1. Wybór temperatury (Wiatr)
+    temp_do_analizy, zrodlo_temp = wybierz_temperature_do_analizy(
+        ocena.temp_ds,
+        ocena.temp_bme,
+        sparsowane['wiatr']
+    )
+    detektor_awarii.przestrzennie(sparsowane['station_id'], unix_time, temp_do_analizy)
+
+    # 2. Obliczenia
+    punkt_rosy = obliczanie_punktu_rosy(temp_do_analizy, ocena.wilgotnosc)
     
-    rxen.output(GPIO.HIGH)
+    if temp_do_analizy is not None:
+        cooling_rate = obliczanie_szybkosci_chlodzenia(sparsowane['station_id'], temp_do_analizy, unix_time)
+    else:
+        cooling_rate = 0.0
+
+    # 3. Decyzja o alarmie - reguły z histerezą, zmiany stanu idą do powiadomień
+    czy_jest_przymrozek = silnik_alarmow.ocen(
+        sparsowane['station_id'], unix_time,
+        temp=temp_do_analizy, punkt_rosy=punkt_rosy, trend=cooling_rate,
+        wiatr=sparsowane['wiatr'], wilgotnosc=ocena.wilgotnosc)
+
+    statystyki = sparsowane['statystyki']
+    return Pomiar(
+        sparsowane['station_id'], unix_time,
+        probki=sparsowane['samples'],
+        zrodlo=Pomiar.kod_zrodla(zrodlo_temp),
+        alarm=czy_jest_przymrozek,  # <--- 0 lub 1
+        temp_ds=sparsowane['temp_ds18b20'],
+        temp_bme=sparsowane['temp_bme280'],
+        wilgotnosc=sparsowane['humidity'],
+        temp_wybrana=temp_do_analizy,
+        punkt_rosy=punkt_rosy,
+        trend=cooling_rate,
+        wiatr=sparsowane['wiatr'],
+        poryw=sparsowane['poryw'],
+        zmiennosc=sparsowane['zmiennosc_wiatru'],
+        temp_ds_min=statystyki.get('temp_ds18b20_min'),
+        temp_ds_max=statystyki.get('temp_ds18b20_max'),
+        temp_bme_min=statystyki.get('temp_bme280_min'),
+        temp_bme_max=statystyki.get('temp_bme280_max'),
+        temp_ds_sd=statystyki.get('temp_ds18b20_sd'),
+        temp_bme_sd=statystyki.get('temp_bme280_sd'),
+    )
+
+def publikuj_mqtt(dziennik, pomiar):
+    """Odczyt do dziennika MQTT - wysyłka z QoS 1 w tle, bez czekania na brokera"""
+    try:
+        dziennik.dopisz(TEMAT_MQTT, pomiar.jako_json())
+        dziennik.dopisz(TEMAT_MQTT_BINARNY, pomiar.koduj())
+    except Exception as e:
+        print(f"Blad zapisu do dziennika MQTT {e}")
+
+def publikuj_awarie(dziennik, zdarzenie):
+    """Zdarzenie awarii czujnika do dziennika MQTT (serwer WWW: /api/stations/faults)"""
+    try:
+        dziennik.dopisz(TEMAT_AWARII, json.dumps(zdarzenie))
+    except Exception as e:
+        print(f"Blad zapisu do dziennika MQTT {e}")
+
+def metryki_odbioru(lora):
+    """RSSI i SNR ostatniego pakietu, None gdy moduł ich nie podał"""
+    try:
+        return lora.packetRssi(), lora.snr()
+    except Exception:
+        return None, None
+
+def nasluch_radia(lora, rxen, nazwa, ujscie, stop):
+    """
+    Pętla odbioru jednego radia (osobny wątek): każdą ramkę, także z błędem
+    CRC, przekazuje jako ujscie(czas, nazwa, dane, rssi, snr, crc_ok).
+    """
+    rxen.output(1)  # GPIO.HIGH - tor odbiorczy anteny
     lora.setBufferBaseAddress(128, 0)
     lora.setRx(0xFFFFFF)  
     
+    while not stop.is_set():
+        flagi_irq = lora.getIrqStatus()
+        
+        if flagi_irq & lora.IRQ_RX_DONE:
+            lora.clearIrqStatus(0x03FF)
+            crc_ok = not flagi_irq & lora.IRQ_CRC_ERR
+            dlugosc_danych, wskaznik_startu = lora.getRxBufferStatus()
+            if dlugosc_danych > 0:
+                dane = lora.readBuffer(wskaznik_startu, dlugosc_danych)
+                czas_odbioru = time.time()
+                rssi, snr = metryki_odbioru(lora)
+                ujscie(czas_odbioru, nazwa, bytes(dane), rssi, snr, crc_ok)
+            lora.setRx(0xFFFFFF)
+        else:
+            # Po odebranej ramce od razu sprawdzamy następną
+            time.sleep(0.01)
+
+def obsluz_ramke(odebrana, silnik_alarmow, obsluga, archiwum=None, stan=None, konfiguracja=None):
+    """
+    Ramka ze scalonego strumienia radiów: archiwum, przetworzenie, obsluga(pomiar).
+    Wywoływane z jednego wątku - historia trendu i silnik alarmów nie są współdzielone.
+    """
+    if archiwum is not None:
+        archiwum.dopisz(odebrana.czas, odebrana.dane, odebrana.rssi, odebrana.snr, odebrana.crc_ok)
+    if not odebrana.crc_ok:
+        return
+    
+    znacznik_czasu = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(odebrana.czas))
+    unix_time = int(odebrana.czas)
+    if WYPISUJ_RAMKI:
+        print(f"[{znacznik_czasu}] Ramka ({odebrana.radio}): "
+              f"{odebrana.dane.decode('utf-8', errors='ignore').strip()}")
+    
+    pomiar = przetworz_ramke(odebrana.dane, unix_time, silnik_alarmow)
+    if pomiar:
+        pomiar.rssi, pomiar.snr = odebrana.rssi, odebrana.snr
+        if konfiguracja is not None and konfiguracja.radio_stacji(pomiar.stacja).nazwa != odebrana.radio:
+            obce_kanaly[odebrana.radio] = obce_kanaly.get(odebrana.radio, 0) + 1
+        if WYPISUJ_RAMKI:
+            print(f"         JSON: {pomiar.jako_json()}")
+        obsluga(pomiar)
+        if stan is not None:
+            stan.moze_zapisz(odebrana.czas)
+    else:
+        print(" Blad przy parsowaniu")
+
+# Ramki stacji odebrane przez radio innego kanału niż przydzielony (radia.json)
+obce_kanaly = {}
+
+def petla_wielu_radii(radia, silnik_alarmow, obsluga, archiwum=None, stan=None,
+                      konfiguracja=None, scalacz=None):
+    """
+    Nasłuch kilku radiów [(nazwa, lora, rxen)] - wątek na radio, ramki
+    scalone w kolejności czasu odbioru (ScalaczRamek) i przetwarzane po
+    kolei jak z jednego radia. Blokuje do KeyboardInterrupt.
+    """
+    if scalacz is None:
+        # Jedno radio - kolejność i tak zachowana, bez wstrzymywania ramek
+        scalacz = ScalaczRamek(0.0) if len(radia) == 1 else ScalaczRamek()
+    stop = threading.Event()
+    watki = [threading.Thread(target=nasluch_radia, args=(lora, rxen, nazwa, scalacz.dodaj, stop),
+                              name=f"radio-{nazwa}", daemon=True)
+             for nazwa, lora, rxen in radia]
+    for watek in watki:
+        watek.start()
+    print(f"LoRa: ustawiono tryb RX ({', '.join(nazwa for nazwa, _, _ in radia)})")
+    
     try:
         while True:
-            flagi_irq = lora.getIrqStatus()
-            
-            if flagi_irq & SX126x.IRQ_RX_DONE:
-                lora.clearIrqStatus(0x03FF)
-                                
-                if flagi_irq & SX126x.IRQ_CRC_ERR:
-                    lora.setRx(0xFFFFFF)
-                    continue
-
-                dlugosc_danych, wskaznik_startu = lora.getRxBufferStatus()
-                if dlugosc_danych > 0:
-                    dane = lora.readBuffer(wskaznik_startu, dlugosc_danych)
-                    dane_bajty = bytes(dane)
-                    
-                    sparsowane = parsowanie_ramki(dane_bajty)
-                    znacznik_czasu = time.strftime("%Y-%m-%d %H:%M:%S")
-                    unix_time = int(time.time())
-                    print(f"[{znacznik_czasu}] Ramka: {dane_bajty.decode('utf-8', errors='ignore').strip()}")
-                    
-                    if sparsowane:
-                        # 1. Wybór temperatury (Wiatr)
-                        temp_do_analizy, zrodlo_temp = wybierz_temperature_do_analizy(
-                            sparsowane['temp_ds18b20'],
-                            sparsowane['temp_bme280'],
-                            sparsowane['wiatr']
-                        )
-
-                        # 2. Obliczenia
-                        punkt_rosy = obliczanie_punktu_rosy(temp_do_analizy, sparsowane['humidity'])
-                        
-                        if temp_do_analizy is not None:
-                            cooling_rate = obliczanie_szybkosci_chlodzenia(sparsowane['station_id'], temp_do_analizy, unix_time)
-                        else:
-                            cooling_rate = 0.0
-
-                        # 3. Decyzja o alarmie (Nowa funkcja!)
-                        czy_jest_przymrozek = ocena_ryzyka_przymrozku(temp_do_analizy, punkt_rosy, cooling_rate)
-
-                        wyjscie = {
-                            'station_id': sparsowane['station_id'],
-                            'temp_ds18b20': sparsowane['temp_ds18b20'],
-                            'temp_bme280': sparsowane['temp_bme280'],
-                            'selected_temp': temp_do_analizy,
-                            'temp_source': zrodlo_temp,
-                            'humidity': sparsowane['humidity'],
-                            'dew_point': punkt_rosy,
-                            'cooling_rate': cooling_rate,
-                            'frost_alert': czy_jest_przymrozek, # <--- 0 lub 1
-                            'wiatr': sparsowane['wiatr'],
-                            'timestamp': unix_time
-                        }
-                        
-                        print(f"         JSON: {json.dumps(wyjscie, ensure_ascii=False)}")
-                        
-                        try:                            
-                            temat = f"lora/pogoda"
-                            wiadomosc = json.dumps(wyjscie)
-                            klient.publish(temat, wiadomosc)
-                        except Exception as e:
-                            print(f"Blad z MQTT {e}")
-                    else:
-                        print(" Blad przy parsowaniu")
-                
-                lora.setRx(0xFFFFFF)
-            
-            time.sleep(0.01)
-            
+            for odebrana in scalacz.pobierz(1.0):
+                obsluz_ramke(odebrana, silnik_alarmow, obsluga, archiwum, stan, konfiguracja)
     except KeyboardInterrupt:
         print("\nZatrzymano program")
     
-    lora.setStandby(SX126x.STANDBY_RC)
-    GPIO.cleanup()
+    stop.set()
+    for watek in watki:
+        watek.join(1.0)
+    if stan is not None:
+        stan.zapisz()
+    for _, lora, _ in radia:
+        lora.setStandby(lora.STANDBY_RC)
+    if GPIO is not None:
+        GPIO.cleanup()
+
+def petla_radia(lora, rxen, silnik_alarmow, obsluga, archiwum=None, stan=None):
+    """
+    Nasłuch jednego radia - każdy przetworzony odczyt (Pomiar) trafia do obsluga(pomiar).
+    Surowe ramki (także z błędem CRC) są dopisywane do archiwum, jeśli podane.
+    Stan pochodny (StanOdbiornika) jest zapisywany okresowo i na koniec.
+    Blokuje do KeyboardInterrupt.
+    """
+    petla_wielu_radii([(RADIO_DOMYSLNE.nazwa, lora, rxen)], silnik_alarmow, obsluga, archiwum, stan)
+
+def wybierz_radio(argumenty):
+    """
+    Moduł LoRa albo udawane radio UDP (--radio-udp [host:]port) - np. dla
+    generator_stacji.py lub testów bez Raspberry Pi. Zwraca (lora, rxen).
+    """
+    if '--radio-udp' in argumenty:
+        i = argumenty.index('--radio-udp')
+        adres = adres_udp(argumenty[i + 1] if i + 1 < len(argumenty) else '')
+        print(f"Radio UDP: nasluch na {adres[0]}:{adres[1]}")
+        return RadioUDP(adres), PinUDP()
+    return inicjalizacja_lory()
+
+def wybierz_radia(argumenty):
+    """
+    Radia z pliku (--radia [plik], domyślnie radia.json) albo jedno radio
+    jak w wybierz_radio(). Zwraca ([(nazwa, lora, rxen)], KonfiguracjaRadiow
+    lub None). Radio z polem "udp" w pliku to udawane radio UDP.
+    """
+    if '--radia' not in argumenty:
+        lora, rxen = wybierz_radio(argumenty)
+        return ([(RADIO_DOMYSLNE.nazwa, lora, rxen)] if lora else []), None
+    i = argumenty.index('--radia')
+    sciezka = argumenty[i + 1] if i + 1 < len(argumenty) and not argumenty[i + 1].startswith('--') else PLIK_RADIOW
+    konfiguracja = KonfiguracjaRadiow.z_pliku(sciezka)
+    radia = []
+    for radio in konfiguracja.radia:
+        if radio.udp:
+            adres = adres_udp(radio.udp)
+            print(f"Radio {radio.nazwa}: UDP {adres[0]}:{adres[1]}")
+            lora, rxen = RadioUDP(adres), PinUDP()
+        else:
+            print(f"Radio {radio.nazwa}: {radio.czestotliwosc / 1e6:.3f} MHz SF{radio.sf} "
+                  f"BW {radio.bw / 1000:.0f} kHz, CS GPIO{radio.piny['cs']}")
+            lora, rxen = inicjalizacja_lory(radio)
+        if not lora:
+            print(f"LoRa: inicjalizacja radia {radio.nazwa} nieudana")
+            continue
+        radia.append((radio.nazwa, lora, rxen))
+    return radia, konfiguracja
+
+def main():    
+    silnik_alarmow = SilnikAlarmow.z_pliku(PLIK_ALARMOW)
+    # Ciepły restart - trend i histereza alarmów od razu jak przed restartem
+    stan = StanOdbiornika(historia_pomiarow, silnik_alarmow, detektor_awarii)
+    stan.zaladuj()
+    klient = polacz_mqtt()
+    detektor_awarii.sluchacz = lambda zdarzenie: publikuj_awarie(klient, zdarzenie)
+    radia, konfiguracja = wybierz_radia(sys.argv)
+    if not radia:
+        print("LoRa: inicjalizacja nieudana")
+        return
+    scalacz = ScalaczRamek(0.0) if len(radia) == 1 else ScalaczRamek()
+    diagnostyka.z_argumentow(sys.argv, PORT_DIAGNOSTYKI, {
+        'historia_pomiarow': lambda: len(historia_pomiarow),
+        'stany_alarmow': lambda: len(silnik_alarmow.stany),
+        'dziennik_mqtt': klient.statystyki,
+        'stan_odbiornika': stan.statystyki,
+        'radia': scalacz.statystyki,
+        'obce_kanaly': lambda: dict(obce_kanaly),
+        'awarie_czujnikow': detektor_awarii.statystyki,
+    })
+    
+    petla_wielu_radii(radia, silnik_alarmow, lambda pomiar: publikuj_mqtt(klient, pomiar),
+                      ArchiwumRamek(KATALOG_ARCHIWUM), stan, konfiguracja, scalacz)
 
 if __name__ == "__main__":
     main()
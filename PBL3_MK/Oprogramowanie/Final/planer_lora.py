@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+# Planowanie sieci LoRa przed instalacją sprzętu: czas nadawania ramki,
+# wykorzystanie kanału, prawdopodobieństwo kolizji (ALOHA) dla N stacji
+# oraz zapas względem limitów wypełnienia (duty cycle) pasma EU 868 MHz.
+# Domyślne parametry i długość ramki pochodzą z ramka.py - tak jak nadaje
+# kod_zero.py i odbiera odbiornik_v7.py.
+#
+#   python3 planer_lora.py plan --stacje 200
+#   python3 planer_lora.py plan --stacje 50 --sf 9 --bw 125000 --interwal 600
+#   python3 planer_lora.py przeglad --max-kolizje 0.01
+#   python3 planer_lora.py test
+#
+# Model: jeden kanał (odbiornik SX1262 słucha na jednej częstotliwości i SF),
+# stacje nadają niezależnie w losowej fazie - czysta ALOHA, ramka ginie gdy
+# nakłada się na inną. Efekt przechwytywania (capture) pomijamy - wynik
+# jest ostrożny.
+
+import sys
+import math
+import argparse
+from collections import namedtuple
+
+from ramka import (koduj_ramke, DLUGOSC_RAMKI, DLUGOSC_RAMKI_PODSTAWOWEJ,
+                   CZESTOTLIWOSC, SF, BW, CR, DLUGOSC_PREAMBULY, INTERWAL_WYSYLANIA)
+
+# Podpasma ETSI EN 300 220 (SRD 863-870 MHz) dopuszczone dla LoRa - limit wypełnienia
+PODPASMA_EU868 = (
+    (863.0e6, 865.0e6, 0.001, "h1.3 (863-865 MHz)"),
+    (865.0e6, 868.0e6, 0.01, "h1.4 (865-868 MHz)"),
+    (868.0e6, 868.6e6, 0.01, "g1 (868.0-868.6 MHz)"),
+    (868.7e6, 869.2e6, 0.001, "g2 (868.7-869.2 MHz)"),
+    (869.4e6, 869.65e6, 0.1, "g3 (869.4-869.65 MHz)"),
+    (869.7e6, 870.0e6, 0.01, "g4 (869.7-870.0 MHz)"),
+)
+
+# Minimalny SNR demodulacji SX126x dla SF (dB) i szum własny odbiornika
+SNR_GRANICZNY = {5: -2.5, 6: -5.0, 7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+SZUM_ODBIORNIKA = 6.0  # [dB] NF SX1262 z LNA w trybie boosted
+
+# Przegląd domyślny: to, co SX1262 i pasmo 868 realnie dopuszczają
+PRZEGLAD_SF = (7, 8, 9, 10, 11, 12)
+PRZEGLAD_BW = (125000, 250000, 500000)
+PRZEGLAD_CR = (5, 8)
+
+Plan = namedtuple('Plan', 'sf bw cr dlugosc czas_nadawania wypelnienie limit_wypelnienia '
+                          'min_interwal obciazenie kolizje maks_stacji czulosc podpasmo')
+
+
+def czas_symbolu(sf, bw):
+    return (1 << sf) / bw
+
+
+def czy_ldro(sf, bw):
+    """Optymalizacja niskiej szybkości (LDRO) - zalecana od symbolu 16.38 ms"""
+    return czas_symbolu(sf, bw) >= 16.38e-3
+
+
+def czas_nadawania(dlugosc, sf=SF, bw=BW, cr=CR, preambula=DLUGOSC_PREAMBULY,
+                   jawny_naglowek=True, crc=True, ldro=None):
+    """
+    Czas nadawania ramki [s] wg noty SX126x (rozdz. 6.1.4). cr w konwencji
+    LoRaRF: 5..8 = 4/5..4/8. ldro=None - jak zaleca Semtech dla sf/bw.
+    """
+    if ldro is None:
+        ldro = czy_ldro(sf, bw)
+    naglowek = 20 if jawny_naglowek else 0
+    if sf < 7:
+        bity = 8 * dlugosc + 16 * crc - 4 * sf + naglowek
+        symbole_preambuly = preambula + 6.25
+    else:
+        bity = 8 * dlugosc + 16 * crc - 4 * sf + 8 + naglowek
+        symbole_preambuly = preambula + 4.25
+    na_symbol = 4 * (sf - 2 * ldro) if sf >= 7 else 4 * sf
+    symbole_danych = 8 + math.ceil(max(bity, 0) / na_symbol) * cr
+    return (symbole_preambuly + symbole_danych) * czas_symbolu(sf, bw)
+
+
+def czulosc(sf, bw):
+    """Przybliżona czułość odbiornika [dBm]"""
+    return -174.0 + 10.0 * math.log10(bw) + SZUM_ODBIORNIKA + SNR_GRANICZNY[sf]
+
+
+def podpasmo(czestotliwosc=CZESTOTLIWOSC, bw=BW):
+    """(limit, nazwa) podpasma zawierającego cały kanał, None gdy kanał wychodzi poza podpasmo"""
+    dol, gora = czestotliwosc - bw / 2, czestotliwosc + bw / 2
+    for od, do, limit, nazwa in PODPASMA_EU868:
+        if od <= dol and gora <= do:
+            return limit, nazwa
+    return None
+
+
+def limit_wypelnienia(czestotliwosc=CZESTOTLIWOSC, bw=BW):
+    """(limit, nazwa) dla kanału - poza podpasmem najostrzejszy limit pasma"""
+    pasmo = podpasmo(czestotliwosc, bw)
+    return pasmo if pasmo else (min(p[2] for p in PODPASMA_EU868), "POZA PODPASMEM")
+
+
+def prawdopodobienstwo_kolizji(obciazenie):
+    """Czysta ALOHA: ramka przeżywa, gdy nikt nie nadaje w oknie 2 x czas nadawania"""
+    return 1.0 - math.exp(-2.0 * obciazenie)
+
+
+def maks_stacji(czas, interwal, max_kolizje):
+    """Największe N z prawdopodobieństwem kolizji ramki <= max_kolizje"""
+    obciazenie = -math.log(1.0 - max_kolizje) / 2.0
+    return int(obciazenie * interwal / czas)
+
+
+def planuj(stacje, interwal=INTERWAL_WYSYLANIA, sf=SF, bw=BW, cr=CR, dlugosc=DLUGOSC_RAMKI,
+           max_kolizje=0.01, czestotliwosc=CZESTOTLIWOSC):
+    czas = czas_nadawania(dlugosc, sf, bw, cr)
+    limit, nazwa = limit_wypelnienia(czestotliwosc, bw)
+    obciazenie = stacje * czas / interwal
+    return Plan(sf, bw, cr, dlugosc, czas, czas / interwal, limit, czas / limit, obciazenie,
+                prawdopodobienstwo_kolizji(obciazenie), maks_stacji(czas, interwal, max_kolizje),
+                czulosc(sf, bw), nazwa)
+
+
+def przeglad(interwal=INTERWAL_WYSYLANIA, dlugosc=DLUGOSC_RAMKI, max_kolizje=0.01,
+             sfy=PRZEGLAD_SF, bw=PRZEGLAD_BW, cry=PRZEGLAD_CR, czestotliwosc=CZESTOTLIWOSC):
+    """Plany dla wszystkich kombinacji (stacje=0 - liczy się maks_stacji)"""
+    return [planuj(0, interwal, s, b, c, dlugosc, max_kolizje, czestotliwosc)
+            for s in sfy for b in bw for c in cry]
+
+
+def _wypisz_plan(plan, stacje, interwal, max_kolizje):
+    print(f"SF{plan.sf}, BW {plan.bw / 1000:.0f} kHz, CR 4/{plan.cr}, ramka {plan.dlugosc} B, "
+          f"interwal {interwal:.0f} s, podpasmo {plan.podpasmo}")
+    print(f"  Czas nadawania ramki:  {plan.czas_nadawania * 1000:.1f} ms")
+    print(f"  Czulosc odbiornika:    {plan.czulosc:.1f} dBm")
+    print(f"  Wypelnienie stacji:    {plan.wypelnienie * 100:.4f}% "
+          f"(limit {plan.limit_wypelnienia * 100:g}%, zapas x{plan.limit_wypelnienia / plan.wypelnienie:.0f})")
+    print(f"  Min. interwal (limit): {plan.min_interwal:.1f} s")
+    print(f"  {stacje} stacji: obciazenie kanalu {plan.obciazenie * 100:.2f}%, "
+          f"kolizja ramki {plan.kolizje * 100:.2f}%, dostarczone {100 - plan.kolizje * 100:.2f}%")
+    print(f"  Maks. stacji przy kolizjach <= {max_kolizje * 100:g}%: {plan.maks_stacji}")
+    if plan.wypelnienie > plan.limit_wypelnienia:
+        print("  UWAGA: interwal krotszy niz pozwala limit wypelnienia")
+    if plan.podpasmo == "POZA PODPASMEM":
+        print("  UWAGA: kanal nie miesci sie w jednym podpasmie EU868 - zmien czestotliwosc lub BW")
+
+
+def _wypisz_przeglad(plany, interwal, max_kolizje):
+    print(f"Interwal {interwal:.0f} s, kolizje <= {max_kolizje * 100:g}%")
+    print(f"{'SF':>3} {'BW kHz':>7} {'CR':>4} {'ToA ms':>8} {'czulosc':>8} {'wypeln. %':>10} "
+          f"{'limit %':>8} {'min int. s':>11} {'maks stacji':>12}  podpasmo")
+    for p in plany:
+        print(f"{p.sf:>3} {p.bw / 1000:>7.0f} {'4/' + str(p.cr):>4} {p.czas_nadawania * 1000:>8.1f} "
+              f"{p.czulosc:>8.1f} {p.wypelnienie * 100:>10.4f} {p.limit_wypelnienia * 100:>8g} "
+              f"{p.min_interwal:>11.1f} {p.maks_stacji:>12}  {p.podpasmo}"
+              + ("  (poza limitem)" if p.wypelnienie > p.limit_wypelnienia else ""))
+
+
+def _test():
+    # Wartości referencyjne kalkulatora Semtech (preambuła 8, nagłówek jawny, CRC)
+    assert abs(czas_nadawania(13, 12, 125000, 5, 8) - 1.155072) < 1e-6
+    assert abs(czas_nadawania(20, 7, 125000, 5, 8) - 0.056576) < 1e-6
+    # Długość ramki z kodeka zgadza się z DLUGOSC_RAMKI
+    assert len(koduj_ramke("01", 1.0, 2.0, 80.0, 10, 3.0)) == DLUGOSC_RAMKI
+    plan = planuj(100)
+    assert plan.maks_stacji == maks_stacji(plan.czas_nadawania, INTERWAL_WYSYLANIA, 0.01)
+    # Przy maks_stacji kolizje nie przekraczają progu, przy +1 już tak
+    n = plan.maks_stacji
+    assert planuj(n).kolizje <= 0.01 < planuj(n + 1).kolizje
+    assert podpasmo(868.3e6, 125000)[1].startswith("g1") and podpasmo(868.6e6, 500000) is None
+    _wypisz_plan(plan, 100, INTERWAL_WYSYLANIA, 0.01)
+    print("OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planer czasu nadawania i pojemnosci sieci LoRa")
+    polecenia = parser.add_subparsers(dest='polecenie', required=True)
+
+    def wspolne(p):
+        p.add_argument('--interwal', type=float, default=INTERWAL_WYSYLANIA, help="[s] miedzy ramkami stacji")
+        p.add_argument('--dlugosc', type=int, default=DLUGOSC_RAMKI,
+                       help=f"[B] ramka ({DLUGOSC_RAMKI} pelna, {DLUGOSC_RAMKI_PODSTAWOWEJ} podstawowa)")
+        p.add_argument('--max-kolizje', type=float, default=0.01, help="dopuszczalne prawdopodobienstwo kolizji")
+        p.add_argument('--czestotliwosc', type=float, default=CZESTOTLIWOSC, help="[Hz]")
+
+    p = polecenia.add_parser('plan', help="jedna konfiguracja dla N stacji (domyslnie jak w kodzie)")
+    wspolne(p)
+    p.add_argument('--stacje', type=int, default=7)
+    p.add_argument('--sf', type=int, default=SF)
+    p.add_argument('--bw', type=int, default=BW)
+    p.add_argument('--cr', type=int, default=CR, help="5..8 = 4/5..4/8")
+
+    p = polecenia.add_parser('przeglad', help="maks. liczba stacji dla kombinacji SF/BW/CR")
+    wspolne(p)
+    p.add_argument('--sf', type=int, nargs='+', default=PRZEGLAD_SF)
+    p.add_argument('--bw', type=int, nargs='+', default=PRZEGLAD_BW)
+    p.add_argument('--cr', type=int, nargs='+', default=PRZEGLAD_CR)
+
+    polecenia.add_parser('test', help="sprawdzenie wzorow na wartosciach referencyjnych")
+
+    args = parser.parse_args()
+    if args.polecenie == 'test':
+        _test()
+    elif args.polecenie == 'plan':
+        plan = planuj(args.stacje, args.interwal, args.sf, args.bw, args.cr, args.dlugosc,
+                      args.max_kolizje, args.czestotliwosc)
+        _wypisz_plan(plan, args.stacje, args.interwal, args.max_kolizje)
+    else:
+        _wypisz_przeglad(przeglad(args.interwal, args.dlugosc, args.max_kolizje, args.sf, args.bw,
+                                  args.cr, args.czestotliwosc), args.interwal, args.max_kolizje)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# Jeden typ odczytu stacji dla całego potoku: odbiornik (parsowanie ramki,
+# analiza), MQTT, serwer WWW i magazyn historii. Jednostki są stałe:
+#   temperatury, punkt rosy  [°C]
+#   wilgotność               [%]
+#   wiatr, poryw, zmienność  [km/h] - tak mierzy stacja, bez przeliczeń
+#   trend                    [°C/h]
+#   rssi [dBm], snr [dB]     - jakość odbioru ramki (brak poza radiem)
+#   ts                       [s] unix, czas odbioru ramki
+# Brak odczytu to zawsze None (w formacie binarnym NaN) - nigdy 0.0.
+#
+# Format binarny (82 B, little-endian) czyta się bez kopiowania przez
+# struct.unpack_from na buforze wiadomości MQTT:
+#   wersja B | stacja 2s | ts d | 17 x f32 | probki B | zrodlo B | alarm B
+
+import json
+import math
+import struct
+
+WERSJA_BINARNA = 2
+
+# Kolejność pól float w formacie binarnym
+POLA_LICZBOWE = (
+    'temp_ds', 'temp_bme', 'wilgotnosc', 'temp_wybrana', 'punkt_rosy', 'trend',
+    'wiatr', 'poryw', 'zmiennosc',
+    'temp_ds_min', 'temp_ds_max', 'temp_bme_min', 'temp_bme_max', 'temp_ds_sd', 'temp_bme_sd',
+    'rssi', 'snr',
+)
+STRUKTURA = struct.Struct('<B2sd' + 'f' * len(POLA_LICZBOWE) + 'BBB')
+
+# Atrybut -> klucz JSON na temacie lora/pogoda (zgodny z Telegrafem i starszymi odbiornikami)
+KLUCZE_JSON = {
+    'stacja': 'station_id',
+    'ts': 'timestamp',
+    'temp_ds': 'temp_ds18b20',
+    'temp_bme': 'temp_bme280',
+    'wilgotnosc': 'humidity',
+    'probki': 'samples',
+    'temp_wybrana': 'selected_temp',
+    'zrodlo': 'temp_source',
+    'punkt_rosy': 'dew_point',
+    'trend': 'cooling_rate',
+    'alarm': 'frost_alert',
+    'wiatr': 'wiatr',
+    'poryw': 'poryw',
+    'zmiennosc': 'zmiennosc_wiatru',
+    'temp_ds_min': 'temp_ds18b20_min',
+    'temp_ds_max': 'temp_ds18b20_max',
+    'temp_bme_min': 'temp_bme280_min',
+    'temp_bme_max': 'temp_bme280_max',
+    'temp_ds_sd': 'temp_ds18b20_sd',
+    'temp_bme_sd': 'temp_bme280_sd',
+    'rssi': 'rssi',
+    'snr': 'snr',
+}
+
+# Źródło temperatury do analizy (wybór czujnika w odbiorniku)
+ZRODLA_TEMPERATURY = (
+    "BRAK",
+    "BME280 (Wiatr > Prog)",
+    "DS18B20 (Wiatr <= Prog)",
+    "BME280 (Awaria DS)",
+    "DS18B20 (Awaria BME)",
+)
+_KOD_ZRODLA = {z: i for i, z in enumerate(ZRODLA_TEMPERATURY)}
+
+_NAN = float('nan')
+
+
+def _na_binarny(v):
+    return _NAN if v is None else v
+
+
+def _z_binarnego(v):
+    # f32 -> zaokrąglenie do precyzji ramki (0.01), żeby 2.3 nie wracało jako 2.2999999523
+    return None if math.isnan(v) else round(v, 2)
+
+
+class Pomiar:
+    """Odczyt stacji wraz z wynikami analizy odbiornika"""
+    __slots__ = ('stacja', 'ts', 'probki', 'zrodlo', 'alarm') + POLA_LICZBOWE
+
+    def __init__(self, stacja, ts, probki=0, zrodlo=0, alarm=0, **wartosci):
+        self.stacja = stacja
+        self.ts = ts
+        self.probki = probki
+        self.zrodlo = zrodlo
+        self.alarm = alarm
+        for pole in POLA_LICZBOWE:
+            setattr(self, pole, wartosci.pop(pole, None))
+        if wartosci:
+            raise TypeError(f"nieznane pola pomiaru: {', '.join(wartosci)}")
+
+    def __repr__(self):
+        return f"Pomiar({self.stacja!r}, {self.ts}, T_DS={self.temp_ds}, T_BME={self.temp_bme}, " \
+               f"Hu={self.wilgotnosc}, Wi={self.wiatr}, alarm={self.alarm})"
+
+    @property
+    def zrodlo_tekst(self):
+        return ZRODLA_TEMPERATURY[self.zrodlo] if self.zrodlo < len(ZRODLA_TEMPERATURY) else "BRAK"
+
+    @staticmethod
+    def kod_zrodla(tekst):
+        return _KOD_ZRODLA.get(tekst, 0)
+
+    # --- format binarny ---
+
+    def koduj_do(self, bufor, przesuniecie=0):
+        STRUKTURA.pack_into(bufor, przesuniecie, WERSJA_BINARNA, self.stacja.encode('ascii'), self.ts,
+                            *[_na_binarny(getattr(self, p)) for p in POLA_LICZBOWE],
+                            min(self.probki, 255), self.zrodlo, self.alarm)
+
+    def koduj(self):
+        bufor = bytearray(STRUKTURA.size)
+        self.koduj_do(bufor)
+        return bytes(bufor)
+
+    @classmethod
+    def dekoduj(cls, bufor, przesuniecie=0):
+        wartosci = STRUKTURA.unpack_from(bufor, przesuniecie)
+        if wartosci[0] != WERSJA_BINARNA:
+            raise ValueError(f"nieobslugiwana wersja pomiaru: {wartosci[0]}")
+        pomiar = cls.__new__(cls)
+        pomiar.stacja = wartosci[1].decode('ascii')
+        pomiar.ts = wartosci[2]
+        for pole, v in zip(POLA_LICZBOWE, wartosci[3:]):
+            setattr(pomiar, pole, _z_binarnego(v))
+        pomiar.probki, pomiar.zrodlo, pomiar.alarm = wartosci[-3:]
+        return pomiar
+
+    # --- JSON (temat lora/pogoda) ---
+
+    def jako_slownik(self):
+        slownik = {klucz: getattr(self, atrybut) for atrybut, klucz in KLUCZE_JSON.items()}
+        slownik['temp_source'] = self.zrodlo_tekst
+        return slownik
+
+    def jako_json(self):
+        return json.dumps(self.jako_slownik(), ensure_ascii=False)
+
+    @classmethod
+    def z_slownika(cls, slownik):
+        """Z JSON odbiornika (także starszego - brakujące pola to None)"""
+        pomiar = cls.__new__(cls)
+        for atrybut, klucz in KLUCZE_JSON.items():
+            setattr(pomiar, atrybut, slownik.get(klucz))
+        pomiar.zrodlo = cls.kod_zrodla(pomiar.zrodlo)
+        pomiar.probki = pomiar.probki or 0
+        pomiar.alarm = int(pomiar.alarm or 0)
+        if pomiar.ts is None:
+            raise ValueError("pomiar bez znacznika czasu")
+        return pomiar
+
+    # --- magazyn ---
+
+    def wiersz_historii(self):
+        """(ts, T1, T2, Hu, Wi, Fa) dla MagazynHistorii - T1=DS18B20, T2=BME280, Wi w km/h"""
+        return self.ts, self.temp_ds, self.temp_bme, self.wilgotnosc, self.wiatr, self.alarm
+
+    def pola_liczbowe(self):
+        """Obecne pola liczbowe pod kluczami JSON (eksport do InfluxDB)"""
+        pola = {KLUCZE_JSON[p]: getattr(self, p) for p in POLA_LICZBOWE if getattr(self, p) is not None}
+        pola['frost_alert'] = self.alarm
+        pola['samples'] = self.probki
+        return pola
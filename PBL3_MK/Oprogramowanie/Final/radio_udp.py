@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Udawane radio SX126x dla odbiornika: ramki przychodzą jako datagramy UDP
+# (np. z generator_stacji.py) zamiast z modułu LoRa. Udostępnia tylko te
+# metody i stałe SX126x, których używa pętla radia w odbiornik_v7.py,
+# więc cały potok odbiornika można testować na zwykłym komputerze.
+#
+# Datagram: nagłówek <Bhh (flagi, RSSI [0.1 dBm], SNR [0.1 dB]) + bajty ramki.
+
+import socket
+import struct
+
+NAGLOWEK_UDP = struct.Struct('<Bhh')
+FLAGA_BLAD_CRC = 0x01
+PORT_DOMYSLNY = 1700
+
+
+def adres_udp(tekst):
+    """'host:port' lub 'port' -> (host, port)"""
+    host, _, port = tekst.rpartition(':')
+    return host or '127.0.0.1', int(port or PORT_DOMYSLNY)
+
+
+def pakiet_udp(dane, rssi=-90.0, snr=8.0, blad_crc=False):
+    return NAGLOWEK_UDP.pack(FLAGA_BLAD_CRC if blad_crc else 0,
+                             int(round(rssi * 10)), int(round(snr * 10))) + dane
+
+
+class PinUDP:
+    """Zastępuje LoRaGpio (RXEN) - przełączanie toru antenowego nic nie robi"""
+    def output(self, wartosc):
+        pass
+
+
+class RadioUDP:
+    """Podzbiór interfejsu LoRaRF.SX126x na gnieździe UDP"""
+    IRQ_RX_DONE = 0x0002
+    IRQ_CRC_ERR = 0x0040
+    STANDBY_RC = 0x00
+
+    def __init__(self, adres=('127.0.0.1', PORT_DOMYSLNY)):
+        self.adres = adres
+        self._gniazdo = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._gniazdo.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self._gniazdo.bind(adres)
+        self._gniazdo.setblocking(False)
+        self._ramka = None
+        self._flagi = 0
+        self._rssi = None
+        self._snr = None
+
+    def getIrqStatus(self):
+        if self._ramka is None:
+            try:
+                pakiet = self._gniazdo.recv(2048)
+            except BlockingIOError:
+                return 0
+            if len(pakiet) < NAGLOWEK_UDP.size:
+                return 0
+            self._flagi, rssi, snr = NAGLOWEK_UDP.unpack_from(pakiet)
+            self._rssi, self._snr = rssi / 10.0, snr / 10.0
+            self._ramka = pakiet[NAGLOWEK_UDP.size:]
+        return self.IRQ_RX_DONE | (self.IRQ_CRC_ERR if self._flagi & FLAGA_BLAD_CRC else 0)
+
+    def clearIrqStatus(self, maska):
+        pass
+
+    def getRxBufferStatus(self):
+        return (len(self._ramka) if self._ramka is not None else 0), 0
+
+    def readBuffer(self, poczatek, dlugosc):
+        return list(self._ramka[poczatek:poczatek + dlugosc])
+
+    def packetRssi(self):
+        return self._rssi
+
+    def snr(self):
+        return self._snr
+
+    def setBufferBaseAddress(self, tx, rx):
+        pass
+
+    def setRx(self, limit_czasu):
+        # Ponowne uzbrojenie odbioru = bieżąca ramka obsłużona
+        self._ramka = None
+
+    def setStandby(self, tryb):
+        self._gniazdo.close()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Kodowanie ramki stacji (wspólne dla stacji, generatora obciążenia
+# i narzędzi planowania). Ramka 73B BEZ SEPARATORÓW - stałe pozycje pól.
+# Format: ID(2) + TDS(6) + TBME(6) + HUM(5) + N(2) + CZAS(6) + WIATR(5) = 32B
+#         + PORYW(5) + ZMIENNOSC(4) = 41B
+#         + TMIN_DS(6) + TMAX_DS(6) + TMIN_BME(6) + TMAX_BME(6)
+#         + SD_DS(4) + SD_BME(4) = 73B
+# Pierwsze 32B jest zgodne ze starszymi odbiornikami.
+#
+# Tu są też parametry łącza LoRa wspólne dla stacji i odbiornika - muszą się
+# zgadzać po obu stronach, a planer_lora.py liczy z nich czas nadawania.
+
+import time
+
+DLUGOSC_RAMKI = 73
+DLUGOSC_RAMKI_PODSTAWOWEJ = 32
+
+# Parametry łącza (LoRaRF: CR 5 = 4/5)
+CZESTOTLIWOSC = 868000000
+SF = 7
+BW = 500000
+CR = 5
+DLUGOSC_PREAMBULY = 12
+# Co ile sekund stacja nadaje ramkę
+INTERWAL_WYSYLANIA = 5 * 60
+
+BRAK_STATYSTYK = (None, None, None)
+
+
+def format_temp(t):
+    if t is None:
+        return "  N/A "
+    znak = "+" if t >= 0 else "-"
+    return f"{znak}{abs(t):05.1f}"
+
+def format_wilg(h):
+    if h is None:
+        return " N/A "
+    return f"{h:05.1f}"
+
+def format_wiatr(w):
+    """Formatuje prędkość wiatru do 5 znaków: XXX.X"""
+    if w is None:
+        return " N/A "
+    # Ograniczenie do 999.9 km/h
+    w = min(w, 999.9)
+    return f"{w:05.1f}"
+
+def format_zmiennosc(z):
+    """Formatuje zmienność wiatru do 4 znaków: XX.X"""
+    if z is None:
+        return "N/A "
+    return f"{min(z, 99.9):04.1f}"
+
+def format_odchylenie(sd):
+    """Formatuje odchylenie standardowe temperatury do 4 znaków: X.XX"""
+    if sd is None:
+        return "N/A "
+    return f"{min(sd, 9.99):04.2f}"
+
+def koduj_ramke(id_stacji, temp_ds, temp_bme, wilg_bme, liczba_probek, wiatr,
+                poryw=None, zmiennosc=None, statystyki_ds=BRAK_STATYSTYK,
+                statystyki_bme=BRAK_STATYSTYK, czas=None):
+    """
+    Buduje ramkę 73B. statystyki_* = (min, max, odchylenie) okna pomiarowego,
+    czas = unix ts nadania (domyślnie teraz, czas lokalny HHMMSS).
+    """
+    min_ds, max_ds, sd_ds = statystyki_ds
+    min_bme, max_bme, sd_bme = statystyki_bme
+    czas = time.strftime("%H%M%S", time.localtime(czas))
+    ramka = (
+        f"{id_stacji:2s}"           # 0-1:   ID stacji (2)
+        f"{format_temp(temp_ds)}"   # 2-7:   Temp DS18B20 (6)
+        f"{format_temp(temp_bme)}"  # 8-13:  Temp BME280 (6)
+        f"{format_wilg(wilg_bme)}"  # 14-18: Wilgotność (5)
+        f"{liczba_probek:02d}"      # 19-20: Liczba próbek (2)
+        f"{czas}"                   # 21-26: Czas HHMMSS (6)
+        f"{format_wiatr(wiatr)}"    # 27-31: Wiatr km/h (5)
+        f"{format_wiatr(poryw)}"    # 32-36: Poryw 3 s km/h (5)
+        f"{format_zmiennosc(zmiennosc)}"  # 37-40: Zmienność wiatru km/h (4)
+        f"{format_temp(min_ds)}"          # 41-46: Min DS18B20 w oknie (6)
+        f"{format_temp(max_ds)}"          # 47-52: Max DS18B20 w oknie (6)
+        f"{format_temp(min_bme)}"         # 53-58: Min BME280 w oknie (6)
+        f"{format_temp(max_bme)}"         # 59-64: Max BME280 w oknie (6)
+        f"{format_odchylenie(sd_ds)}"     # 65-68: Odch. std DS (4)
+        f"{format_odchylenie(sd_bme)}"    # 69-72: Odch. std BME (4)
+    )
+    return ramka.encode('utf-8')[:DLUGOSC_RAMKI].ljust(DLUGOSC_RAMKI)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# Rozsyłanie migawek danych do klientów Socket.IO z kolejką na klienta.
+# Każdy klient ma jedno miejsce na najnowszą migawkę każdego zdarzenia
+# (wartości, stan stacji) - wolny klient (słabe WiFi w sadzie) dostaje
+# zawsze najświeższe dane, a nieaktualne migawki są po prostu nadpisywane
+# zamiast rosnąć w pamięci serwera.
+# Backpressure czyta prywatną kolejkę engine.io (Server.sockets[sid].queue)
+# - sprawdzone z python-engineio 4.x, inne wersje dają ostrzeżenie na starcie.
+
+import threading
+from importlib import metadata
+
+# Ile pakietów może czekać w kolejce engine.io klienta, zanim uznamy go za wolnego
+LIMIT_ZALEGLOSCI = 2
+# Co ile sekund sprawdzamy, czy wolny klient odebrał zaległe pakiety
+OKRES_SPRAWDZANIA = 0.05
+# Wersje python-engineio (główne), z którymi działa _zaleglosci()
+WERSJE_ENGINEIO = (4,)
+
+
+def sprawdz_engineio():
+    """Ostrzeżenie, gdy zainstalowany python-engineio jest spoza sprawdzonych wersji"""
+    try:
+        wersja = metadata.version('python-engineio')
+    except metadata.PackageNotFoundError:
+        return
+    if int(wersja.split('.')[0]) not in WERSJE_ENGINEIO:
+        print(f"Uwaga: python-engineio {wersja} nie był sprawdzany (obsługiwane: "
+              f"{', '.join(f'{w}.x' for w in WERSJE_ENGINEIO)}) - backpressure może nie działać")
+
+
+class _Klient:
+    __slots__ = ('sid', 'oczekujace', 'sygnal', 'aktywny', 'wyslane', 'upuszczone')
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.oczekujace = {}  # zdarzenie -> najnowsze dane
+        self.sygnal = threading.Event()
+        self.aktywny = True
+        self.wyslane = 0
+        self.upuszczone = 0
+
+
+class RozsylaczMigawek:
+    """
+    Rozsyła zdarzenia do klientów przez osobne zadanie na klienta.
+    publikuj() nigdy nie blokuje - tylko podmienia migawkę w slocie klienta
+    (slot na zdarzenie). Jeśli klient nie nadąża, poprzednia niewysłana
+    migawka tego samego zdarzenia jest upuszczana.
+    """
+    def __init__(self, socketio, namespace='/'):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.klienci = {}
+        self._blokada = threading.Lock()
+        self._blad_zaleglosci = False
+        sprawdz_engineio()
+
+    def dodaj_klienta(self, sid):
+        klient = _Klient(sid)
+        with self._blokada:
+            self.klienci[sid] = klient
+        self.socketio.start_background_task(self._petla_klienta, klient)
+
+    def usun_klienta(self, sid):
+        with self._blokada:
+            klient = self.klienci.pop(sid, None)
+        if klient is not None:
+            klient.aktywny = False
+            klient.sygnal.set()
+
+    def publikuj(self, zdarzenie, dane):
+        with self._blokada:
+            klienci = list(self.klienci.values())
+        for klient in klienci:
+            if zdarzenie in klient.oczekujace:
+                klient.upuszczone += 1
+            klient.oczekujace[zdarzenie] = dane
+            klient.sygnal.set()
+
+    def _zaleglosci(self, sid):
+        # Liczba pakietów czekających w kolejce engine.io danego klienta.
+        # Klient już rozłączony (brak sid) nie ma zaległości; gdy zmieniło się
+        # wewnętrzne API, backpressure jest wyłączone - zgłaszamy to raz.
+        try:
+            serwer = self.socketio.server
+            eio_sid = serwer.manager.eio_sid_from_sid(sid, self.namespace)
+            return serwer.eio.sockets[eio_sid].queue.qsize()
+        except KeyError:
+            return 0
+        except Exception as e:
+            if not self._blad_zaleglosci:
+                self._blad_zaleglosci = True
+                print(f"Backpressure wylaczone - brak kolejki engine.io ({type(e).__name__}: {e})")
+            return 0
+
+    def _petla_klienta(self, klient):
+        while klient.aktywny:
+            klient.sygnal.wait()
+            klient.sygnal.clear()
+            if not klient.aktywny:
+                break
+            # Backpressure - czekamy aż klient odbierze poprzednie pakiety,
+            # w międzyczasie nowsze migawki nadpisują slot
+            while klient.aktywny and self._zaleglosci(klient.sid) > LIMIT_ZALEGLOSCI:
+                self.socketio.sleep(OKRES_SPRAWDZANIA)
+            # popitem() jest atomowe - publikuj() może w tym czasie dopisywać
+            while klient.aktywny and klient.oczekujace:
+                zdarzenie, dane = klient.oczekujace.popitem()
+                try:
+                    self.socketio.emit(zdarzenie, dane, to=klient.sid, namespace=self.namespace)
+                    klient.wyslane += 1
+                except Exception as e:
+                    print(f"Blad wysylania do {klient.sid}: {e}")
+
+    def statystyki(self):
+        with self._blokada:
+            klienci = list(self.klienci.values())
+        return {
+            'klienci': len(klienci),
+            'wyslane': sum(k.wyslane for k in klienci),
+            'upuszczone': sum(k.upuszczone for k in klienci),
+            'backpressure': not self._blad_zaleglosci,
+        }
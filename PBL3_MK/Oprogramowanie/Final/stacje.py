@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+# Wspólne dla serwera WWW i narzędzi offline (przetwarzanie archiwum ramek):
+# mapowanie ID stacji LoRa na indeksy stron. Przeliczenie odczytu na wiersz
+# historii: Pomiar.wiersz_historii() w pomiar.py.
+
+# Mapowanie station_id (LoRa) → indeksy stron (0-7)
+STATION_ID_TO_INDEX = {
+    "01": 5,  # Pi Zero
+    "02": 0,  # Sym1
+    "03": 1,  # Sym4
+    "04": 2,  # Sym2
+    "05": 3,  # Sym3
+    "06": 6,  # Sym5
+    "07": 7   # Sym6
+}
+
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Współdzielony stan serwera WWW jako niezmienne, wersjonowane migawki.
+# Wątek MQTT (pisarz) buduje nową migawkę i podmienia jedną referencję,
+# wątki Flask i Socket.IO (czytelnicy) biorą bieżącą migawkę bez blokad -
+# nie ma rozdartych odczytów ani "deque mutated during iteration".
+# Pochodne (JSON, gzip) liczone są raz na wersję i współdzielone przez klientów.
+
+import json
+import threading
+
+
+class _ZPochodnymi:
+    """Leniwie liczone i zapamiętywane dane pochodne niezmiennego obiektu"""
+    __slots__ = ()
+
+    def pochodna(self, klucz, funkcja):
+        # Wyścig dwóch czytelników jest nieszkodliwy - obaj policzą to samo
+        wynik = self._pochodne.get(klucz)
+        if wynik is None:
+            wynik = funkcja()
+            self._pochodne[klucz] = wynik
+        return wynik
+
+
+class HistoriaStacji(_ZPochodnymi):
+    """Ostatnie odczyty jednej stacji: krotka wierszy (seq, ts, t1, t2, hu, wi, fa)"""
+    __slots__ = ('wersja', 'wiersze', '_pochodne')
+
+    def __init__(self, wersja, wiersze):
+        self.wersja = wersja
+        self.wiersze = wiersze
+        self._pochodne = {}
+
+
+class Migawka(_ZPochodnymi):
+    """Spójny stan wszystkich stacji w danej wersji - nigdy nie modyfikowany"""
+    __slots__ = ('wersja', 'wartosci', 'historie', '_pochodne')
+
+    def __init__(self, wersja, wartosci, historie):
+        self.wersja = wersja
+        self.wartosci = wartosci
+        self.historie = historie
+        self._pochodne = {}
+
+    def json_wartosci(self):
+        """Wartości bieżące zakodowane raz na wersję (tekst JSON)"""
+        return self.pochodna('json', lambda: json.dumps(self.wartosci, separators=(',', ':')))
+
+
+class StanWspoldzielony:
+    """
+    Kontener copy-on-write. Pisarze są szeregowani blokadą (MQTT, symulacja),
+    czytelnicy wołają tylko migawka() - odczyt referencji jest atomowy.
+    """
+    def __init__(self, klucze, rozmiar_historii):
+        self.rozmiar_historii = rozmiar_historii
+        self._blokada_zapisu = threading.Lock()
+        self._migawka = Migawka(
+            0,
+            {k: () for k in klucze},
+            {k: HistoriaStacji(0, ()) for k in klucze},
+        )
+
+    def migawka(self):
+        return self._migawka
+
+    def zaladuj_historie(self, klucz, wiersze, wersja=0):
+        """Początkowe wypełnienie historii (np. z magazynu po restarcie)"""
+        with self._blokada_zapisu:
+            stara = self._migawka
+            historie = dict(stara.historie)
+            historie[klucz] = HistoriaStacji(wersja, tuple(wiersze)[-self.rozmiar_historii:])
+            self._migawka = Migawka(max(stara.wersja, wersja), stara.wartosci, historie)
+
+    def opublikuj(self, klucz, wartosci, wiersz, wersja=0):
+        """
+        Dodaje odczyt stacji i publikuje nową migawkę, którą zwraca.
+        `wersja` pozwala wiązać wersje z trwałym licznikiem (np. seq z magazynu),
+        żeby ETagi nie powtarzały się po restarcie - wersje zawsze rosną.
+        """
+        with self._blokada_zapisu:
+            stara = self._migawka
+            wersja = max(stara.wersja + 1, wersja)
+            nowe_wartosci = dict(stara.wartosci)
+            nowe_wartosci[klucz] = tuple(wartosci)
+            historie = dict(stara.historie)
+            poprzednia = historie.get(klucz)
+            wiersze = poprzednia.wiersze if poprzednia is not None else ()
+            historie[klucz] = HistoriaStacji(wersja, (wiersze + (wiersz,))[-self.rozmiar_historii:])
+            nowa = Migawka(wersja, nowe_wartosci, historie)
+            self._migawka = nowa
+            return nowa
+
+
+class SurowyJSON:
+    """Gotowy tekst JSON wstawiany do pakietu Socket.IO bez ponownego kodowania"""
+    __slots__ = ('tekst',)
+
+    def __init__(self, tekst):
+        self.tekst = tekst
+
+
+class JsonSocketIO:
+    """
+    Moduł JSON dla python-socketio (parametr json=). Pakiet zdarzenia to
+    lista [nazwa, dane] - gdy dane są SurowyJSON, tekst jest doklejany
+    bez serializacji, więc rozesłanie do N klientów koduje migawkę raz.
+    """
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        if isinstance(obj, list) and any(isinstance(x, SurowyJSON) for x in obj):
+            return '[' + ','.join(x.tekst if isinstance(x, SurowyJSON) else json.dumps(x, *args, **kwargs)
+                                  for x in obj) + ']'
+        return json.dumps(obj, *args, **kwargs)
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return json.loads(*args, **kwargs)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# Ciepły restart odbiornika. Stan pochodny stacji - punkt odniesienia trendu
+# (historia_pomiarow: ostatnia temperatura, czas, ostatni trend), histereza
+# reguł alarmu (SilnikAlarmow) i detektory awarii czujników (DetektorAwarii:
+# linie bazowe, czasy zamrożenia, aktywne awarie) - jest trzymany tylko
+# w pamięci. Bez migawki po każdym restarcie trend wynosi 0.0 przez 10 minut,
+# alarmy startują od zera (reguła "gwaltowny_spadek" milknie akurat podczas
+# przymrozku), a aktywne awarie nigdy nie dostają zdarzenia końca.
+#
+# Migawka to mały plik JSON zapisywany atomowo (plik tymczasowy + fsync +
+# os.replace) - po awarii zasilania zostaje stara albo nowa migawka, nigdy
+# urwana. Zapis najwyżej co INTERWAL_ZAPISU s przy odebranej ramce i przy
+# zatrzymaniu pętli radia, odczyt przy starcie trwa milisekundy.
+#
+#   python3 stan_odbiornika.py test    - zapis/odczyt 3843 stacji, atomowość
+
+import os
+import sys
+import json
+import time
+
+PLIK_STANU = "stan_odbiornika.json"
+WERSJA_STANU = 2
+INTERWAL_ZAPISU = 30.0    # [s]
+# Starsza migawka jest pomijana - trend z tak starego punktu odniesienia
+# i histereza sprzed godzin nic nie mówią o obecnej sytuacji
+MAKS_WIEK = 3 * 3600.0    # [s]
+
+
+class StanOdbiornika:
+    """
+    Migawka słownika historii trendu, stanów silnika alarmów i detektora awarii.
+    zaladuj() przy starcie, moze_zapisz() po każdej ramce, zapisz() na koniec.
+    """
+    def __init__(self, historia, silnik_alarmow, detektor_awarii, sciezka=PLIK_STANU,
+                 interwal=INTERWAL_ZAPISU, maks_wiek=MAKS_WIEK):
+        self.historia = historia
+        self.silnik_alarmow = silnik_alarmow
+        self.detektor_awarii = detektor_awarii
+        self.sciezka = sciezka
+        self.interwal = interwal
+        self.maks_wiek = maks_wiek
+        self.ostatni_zapis = 0.0
+        self.zapisy = 0
+        self.czas_zapisu_ms = None
+        self.czas_odczytu_ms = None
+
+    def zaladuj(self, teraz=None):
+        """Przywraca stan z pliku, zwraca liczbę stacji (0 gdy brak lub za stara migawka)"""
+        teraz = time.time() if teraz is None else teraz
+        start = time.perf_counter()
+        try:
+            with open(self.sciezka, encoding='utf-8') as f:
+                zapis = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except ValueError as e:
+            print(f"Stan odbiornika: uszkodzony plik {self.sciezka}: {e}")
+            return 0
+        if zapis.get('wersja') != WERSJA_STANU:
+            return 0
+        wiek = teraz - zapis['czas']
+        if wiek > self.maks_wiek:
+            print(f"Stan odbiornika: migawka sprzed {wiek / 60:.0f} min - pomijam")
+            return 0
+        self.historia.update(zapis['historia'])
+        self.silnik_alarmow.przywroc_stan(zapis['alarmy'])
+        self.detektor_awarii.przywroc_stan(zapis['awarie'])
+        self.czas_odczytu_ms = round((time.perf_counter() - start) * 1000, 2)
+        stacje = len(set(zapis['historia']) | set(zapis['alarmy']) | set(zapis['awarie']['stacje']))
+        print(f"Stan odbiornika: {stacje} stacji z migawki sprzed {wiek:.0f} s ({self.czas_odczytu_ms} ms)")
+        return stacje
+
+    def zapisz(self, teraz=None):
+        teraz = time.time() if teraz is None else teraz
+        start = time.perf_counter()
+        zapis = {
+            'wersja': WERSJA_STANU,
+            'czas': teraz,
+            'historia': dict(self.historia),
+            'alarmy': self.silnik_alarmow.stan_do_zapisu(),
+            'awarie': self.detektor_awarii.stan_do_zapisu(),
+        }
+        tymczasowy = self.sciezka + ".tmp"
+        with open(tymczasowy, 'w', encoding='utf-8') as f:
+            json.dump(zapis, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tymczasowy, self.sciezka)
+        self.ostatni_zapis = teraz
+        self.zapisy += 1
+        self.czas_zapisu_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    def moze_zapisz(self, teraz=None):
+        """Zapis, jeśli od poprzedniego minęło co najmniej `interwal` sekund"""
+        teraz = time.time() if teraz is None else teraz
+        if teraz - self.ostatni_zapis >= self.interwal:
+            try:
+                self.zapisz(teraz)
+            except OSError as e:
+                print(f"Stan odbiornika: blad zapisu {e}")
+
+    def statystyki(self):
+        return {'zapisy': self.zapisy, 'ostatni_zapis': self.ostatni_zapis,
+                'czas_zapisu_ms': self.czas_zapisu_ms, 'czas_odczytu_ms': self.czas_odczytu_ms}
+
+
+def _samotest():
+    import tempfile
+    from alarmy import SilnikAlarmow
+    from detekcja_awarii import DetektorAwarii
+
+    sciezka = os.path.join(tempfile.mkdtemp(), PLIK_STANU)
+    t0 = 1_700_000_000.0
+    historia = {}
+    silnik = SilnikAlarmow()
+    detektor = DetektorAwarii()
+    alfabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    stacje = [a + b for a in alfabet for b in alfabet][1:]
+    for i, stacja in enumerate(stacje):
+        historia[stacja] = {'temp': 3.0, 'time': t0 - 300, 'last_trend': -2.0}
+        silnik.ocen(stacja, t0, temp=1.0 if i % 2 else 6.0, punkt_rosy=-1.0, trend=-2.0)
+        detektor.ocen(stacja, t0, 3.0, 3.5, 150.0 if i % 3 == 0 else 80.0)
+    stan = StanOdbiornika(historia, silnik, detektor, sciezka)
+    stan.zapisz(t0)
+    print(f"{len(stacje)} stacji: zapis {stan.czas_zapisu_ms} ms, {os.path.getsize(sciezka)} B")
+
+    # Restart: nowy słownik i silnik, alarm i trend jak przed restartem
+    historia2 = {}
+    silnik2 = SilnikAlarmow()
+    detektor2 = DetektorAwarii()
+    stan2 = StanOdbiornika(historia2, silnik2, detektor2, sciezka)
+    assert stan2.zaladuj(t0 + 60) == len(stacje)
+    assert historia2 == historia
+    assert silnik2.stan_do_zapisu() == silnik.stan_do_zapisu()
+    assert detektor2.stan_do_zapisu() == detektor.stan_do_zapisu()
+    # Awaria sprzed restartu kończy się zdarzeniem końca
+    assert detektor2.flagi(stacje[0]) == ['wilg:zakres']
+    detektor2.ocen(stacje[0], t0 + 60, 3.0, 3.5, 80.0)
+    migawka = detektor2.rejestr.migawka(stacje[0])
+    assert migawka['aktywne'] == [] and migawka['zdarzenia'][0]['koniec']
+    # Histereza: stacja w alarmie wychodzi dopiero powyżej 2.5 °C, bez migawki nie weszłaby w alarm
+    assert silnik2.ocen(stacje[1], t0 + 60, temp=2.2) == 1
+    assert SilnikAlarmow().ocen(stacje[1], t0 + 60, temp=2.2) == 0
+    print(f"odczyt {stan2.czas_odczytu_ms} ms")
+
+    # Za stara migawka i urwany plik tymczasowy nie psują startu
+    assert StanOdbiornika({}, SilnikAlarmow(), DetektorAwarii(), sciezka).zaladuj(t0 + MAKS_WIEK + 1) == 0
+    with open(sciezka + ".tmp", 'w') as f:
+        f.write('{"wersja": 2, "cz')
+    assert StanOdbiornika({}, SilnikAlarmow(), DetektorAwarii(), sciezka).zaladuj(t0 + 60) == len(stacje)
+    stan.moze_zapisz(t0 + 10)
+    assert stan.zapisy == 1
+    stan.moze_zapisz(t0 + INTERWAL_ZAPISU)
+    assert stan.zapisy == 2
+    print("OK")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        _samotest()
+    else:
+        print("Uzycie: python3 stan_odbiornika.py test")
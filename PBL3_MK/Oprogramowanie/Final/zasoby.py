@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Zasoby statyczne offline i pomocnicze funkcje cache HTTP dla serwera WWW.
+# Biblioteki JS (socket.io, Chart.js) są trzymane lokalnie w static/vendor,
+# bo sieć w sadzie nie ma dostępu do internetu. Pliki są serwowane pod adresem
+# zawierającym skrót treści, więc przeglądarka może je trzymać w cache na stałe.
+#
+# Pliki (z wersjami .gz) są częścią repozytorium - serwer bez nich nie
+# startuje, bo zapasowy CDN w sadzie i tak jest nieosiągalny. Pobranie lub
+# zmiana wersji bibliotek (na komputerze z internetem, potem commit):
+#   python3 zasoby.py pobierz [katalog_static_vendor]
+
+import os
+import sys
+import gzip
+import hashlib
+import mimetypes
+import urllib.request
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Nazwa lokalna -> przypięta wersja w CDN (źródło dla `pobierz`)
+ZASOBY = {
+    'socket.io.min.js': 'https://cdn.socket.io/4.5.4/socket.io.min.js',
+    'chart.min.js': 'https://cdn.jsdelivr.net/npm/chart.js@3.9.1/dist/chart.min.js',
+}
+
+# Zasoby z hashem w adresie nigdy się nie zmieniają
+CACHE_ZASOBU = "public, max-age=31536000, immutable"
+# Strony i API - przeglądarka zawsze pyta, ale dostaje 304 gdy nic się nie zmieniło
+CACHE_REWALIDACJA = "no-cache"
+
+# Mniejszych odpowiedzi nie opłaca się kompresować
+MIN_ROZMIAR_KOMPRESJI = 512
+
+
+def kompresuj(dane, poziom_gzip=6):
+    """Zwraca warianty skompresowane {kodowanie: bajty}"""
+    warianty = {}
+    if len(dane) >= MIN_ROZMIAR_KOMPRESJI:
+        warianty['gzip'] = gzip.compress(dane, compresslevel=poziom_gzip, mtime=0)
+        if brotli is not None:
+            warianty['br'] = brotli.compress(dane)
+    return warianty
+
+
+def wybierz_kodowanie(warianty):
+    """Wybiera najlepsze kodowanie akceptowane przez klienta"""
+    akceptowane = request.headers.get('Accept-Encoding', '')
+    for kodowanie in ('br', 'gzip'):
+        if kodowanie in warianty and kodowanie in akceptowane:
+            return kodowanie
+    return None
+
+
+def odpowiedz_http(dane, typ, etag, cache_control=CACHE_REWALIDACJA, warianty=None):
+    """
+    Buduje odpowiedź z ETag i kompresją. Gdy klient ma aktualną wersję
+    (If-None-Match), zwraca samo 304 bez treści.
+    """
+    etag_http = f'"{etag}"'
+    if etag_http in request.headers.get('If-None-Match', ''):
+        odp = Response(status=304)
+    else:
+        kodowanie = wybierz_kodowanie(warianty) if warianty else None
+        odp = Response(warianty[kodowanie] if kodowanie else dane, mimetype=typ)
+        if kodowanie:
+            odp.headers['Content-Encoding'] = kodowanie
+    odp.headers['ETag'] = etag_http
+    odp.headers['Cache-Control'] = cache_control
+    odp.headers['Vary'] = 'Accept-Encoding'
+    return odp
+
+
+class _Zasob:
+    __slots__ = ('nazwa', 'skrot', 'dane', 'warianty', 'typ')
+
+    def __init__(self, nazwa, dane, warianty):
+        self.nazwa = nazwa
+        self.dane = dane
+        self.skrot = hashlib.sha256(dane).hexdigest()[:16]
+        self.warianty = warianty
+        self.typ = mimetypes.guess_type(nazwa)[0] or 'application/octet-stream'
+
+
+class MapaZasobow:
+    """
+    Ładuje pliki z static/vendor do pamięci razem z wersjami .gz/.br
+    (gotowymi z dysku lub skompresowanymi raz przy starcie) i podaje
+    adresy z hashem treści do szablonów. Brak pliku to błąd startu -
+    strona bez bibliotek w sieci offline po cichu by nie działała.
+    """
+    def __init__(self, katalog):
+        self.katalog = katalog
+        self.zasoby = {}
+        self.zaladuj()
+
+    def zaladuj(self):
+        self.zasoby = {}
+        brakujace = [n for n in ZASOBY if not os.path.isfile(os.path.join(self.katalog, n))]
+        if brakujace:
+            raise FileNotFoundError(
+                f"Brak bibliotek JS w {self.katalog}: {', '.join(brakujace)} - "
+                f"pobierz je (python3 zasoby.py pobierz {self.katalog}) na komputerze z internetem")
+        for nazwa in ZASOBY:
+            sciezka = os.path.join(self.katalog, nazwa)
+            with open(sciezka, 'rb') as f:
+                dane = f.read()
+            warianty = {}
+            for kodowanie, rozszerzenie in (('gzip', '.gz'), ('br', '.br')):
+                if os.path.isfile(sciezka + rozszerzenie):
+                    with open(sciezka + rozszerzenie, 'rb') as f:
+                        warianty[kodowanie] = f.read()
+            for kodowanie, skompresowane in kompresuj(dane, poziom_gzip=9).items():
+                warianty.setdefault(kodowanie, skompresowane)
+            self.zasoby[nazwa] = _Zasob(nazwa, dane, warianty)
+
+    def url(self, nazwa):
+        """Adres zasobu do szablonu - lokalny, z hashem treści"""
+        return f"/zasoby/{self.zasoby[nazwa].skrot}/{nazwa}"
+
+    def odpowiedz(self, skrot, nazwa):
+        zasob = self.zasoby.get(nazwa)
+        if zasob is None or zasob.skrot != skrot:
+            return None
+        return odpowiedz_http(zasob.dane, zasob.typ, zasob.skrot, CACHE_ZASOBU, zasob.warianty)
+
+
+def pobierz(katalog):
+    """Pobiera biblioteki z CDN i zapisuje je wraz z wersjami skompresowanymi"""
+    os.makedirs(katalog, exist_ok=True)
+    for nazwa, url in ZASOBY.items():
+        print(f"Pobieranie {url}")
+        with urllib.request.urlopen(url, timeout=30) as odp:
+            dane = odp.read()
+        sciezka = os.path.join(katalog, nazwa)
+        with open(sciezka, 'wb') as f:
+            f.write(dane)
+        for kodowanie, skompresowane in kompresuj(dane, poziom_gzip=9).items():
+            with open(sciezka + ('.gz' if kodowanie == 'gzip' else '.br'), 'wb') as f:
+                f.write(skompresowane)
+        print(f"  zapisano {sciezka} ({len(dane)} B)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == 'pobierz':
+        domyslny = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'vendor')
+        pobierz(sys.argv[2] if len(sys.argv) >= 3 else domyslny)
+    else:
+        print("Uzycie: python3 zasoby.py pobierz [katalog]")
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+# Żywotność stacji i jakość łącza. Dla każdej stacji monitor uczy się
+# oczekiwanego odstępu między ramkami i ustawia termin w kole czasowym
+# (hashed timer wheel): po 2 odstępach bez ramki stacja jest "opozniona",
+# po 4 - "offline". Ustawienie/przesunięcie terminu i takt koła kosztują O(1)
+# niezależnie od liczby stacji, więc tysiące stacji nie spowalniają serwera.
+#
+# Ramka nie ma licznika sekwencji (N to liczba poprawnych próbek w oknie),
+# więc zgubione ramki liczymy z odstępu między kolejnymi ramkami względem
+# nauczonego interwału. RSSI/SNR to średnia i minimum z ostatnich ramek.
+#
+#   python3 zywotnosc.py test    - test koła i monitora na 10000 stacji
+
+import sys
+import time
+import threading
+from collections import deque
+
+from ramka import INTERWAL_WYSYLANIA
+
+# Odstęp nadawania stacji - punkt startowy nauki interwału
+INTERWAL_DOMYSLNY = float(INTERWAL_WYSYLANIA)
+MNOZNIK_OPOZNIENIA = 2.0
+MNOZNIK_OFFLINE = 4.0
+# Odstęp > 1.5 interwału = zgubione ramki, krótszy koryguje interwał (EWMA)
+PROG_ZGUBIENIA = 1.5
+WAGA_INTERWALU = 0.2
+OKNO_LACZA = 20
+
+OK = "ok"
+OPOZNIONA = "opozniona"
+OFFLINE = "offline"
+
+
+class KoloCzasowe:
+    """
+    Koło czasowe z haszowaniem: slot = numer taktu % liczba slotów. Termin
+    dalszy niż jeden obrót czeka w slocie kolejne obroty. Jeden termin
+    na klucz - ustaw() przesuwa poprzedni.
+    """
+    def __init__(self, rozdzielczosc=1.0, sloty=512, teraz=None):
+        self.rozdzielczosc = rozdzielczosc
+        self._sloty = [{} for _ in range(sloty)]
+        self._slot_klucza = {}
+        self._takt = int((time.time() if teraz is None else teraz) / rozdzielczosc)
+
+    def __len__(self):
+        return len(self._slot_klucza)
+
+    def ustaw(self, klucz, termin):
+        self.usun(klucz)
+        # Takt już miniony - do najbliższego odwiedzanego slotu
+        takt = max(int(termin / self.rozdzielczosc), self._takt)
+        slot = takt % len(self._sloty)
+        self._sloty[slot][klucz] = termin
+        self._slot_klucza[klucz] = slot
+
+    def usun(self, klucz):
+        slot = self._slot_klucza.pop(klucz, None)
+        if slot is not None:
+            del self._sloty[slot][klucz]
+
+    def tik(self, teraz):
+        """Usuwa i zwraca [(klucz, termin)] z terminem <= teraz"""
+        wygasle = []
+        koniec = int(teraz / self.rozdzielczosc)
+        # Po długiej przerwie wystarczy jeden pełny obrót
+        takty = min(koniec - self._takt + 1, len(self._sloty))
+        for t in range(self._takt, self._takt + takty):
+            slot = self._sloty[t % len(self._sloty)]
+            if not slot:
+                continue
+            for klucz, termin in [(k, v) for k, v in slot.items() if v <= teraz]:
+                del slot[klucz]
+                del self._slot_klucza[klucz]
+                wygasle.append((klucz, termin))
+        self._takt = max(self._takt, koniec)
+        return wygasle
+
+
+class _StanStacji:
+    __slots__ = ('stan', 'ostatnia', 'interwal', 'odebrane', 'zgubione', 'probki',
+                 'rssi', 'snr', 'suma_rssi', 'suma_snr')
+
+    def __init__(self, interwal):
+        self.stan = OK
+        self.ostatnia = None
+        self.interwal = interwal
+        self.odebrane = 0
+        self.zgubione = 0
+        self.probki = None
+        self.rssi = deque()
+        self.snr = deque()
+        self.suma_rssi = 0.0
+        self.suma_snr = 0.0
+
+
+def _dopisz(okno, suma, wartosc):
+    """Dopisuje do okna stałej długości, zwraca nową sumę"""
+    if wartosc is None:
+        return suma
+    okno.append(wartosc)
+    suma += wartosc
+    if len(okno) > OKNO_LACZA:
+        suma -= okno.popleft()
+    return suma
+
+
+class MonitorStacji:
+    """
+    Stan stacji: ok -> opozniona -> offline, z powrotem do ok po ramce.
+    odebrano() i tik() zwracają zmiany stanu, żeby wołający mógł je rozesłać.
+    Bezpieczny dla wątków (wątek MQTT i wątek taktu).
+    """
+    def __init__(self, interwal=INTERWAL_DOMYSLNY, mnoznik_opoznienia=MNOZNIK_OPOZNIENIA,
+                 mnoznik_offline=MNOZNIK_OFFLINE, teraz=None):
+        self.interwal = interwal
+        self.mnoznik_opoznienia = mnoznik_opoznienia
+        self.mnoznik_offline = mnoznik_offline
+        self.kolo = KoloCzasowe(teraz=teraz)
+        self.stacje = {}
+        self._blokada = threading.Lock()
+
+    def __len__(self):
+        return len(self.stacje)
+
+    def zarejestruj(self, klucz, ostatnia):
+        """Stacja znana z historii (restart serwera) - termin liczony od ostatniego odczytu"""
+        with self._blokada:
+            if klucz in self.stacje:
+                return
+            stacja = self.stacje[klucz] = _StanStacji(self.interwal)
+            stacja.ostatnia = ostatnia
+            self.kolo.ustaw(klucz, ostatnia + self.mnoznik_opoznienia * stacja.interwal)
+
+    def odebrano(self, klucz, teraz, probki=None, rssi=None, snr=None):
+        """Ramka stacji. Zwraca [(klucz, stan)] - pustą, gdy stan się nie zmienił."""
+        with self._blokada:
+            stacja = self.stacje.get(klucz)
+            nowa = stacja is None
+            if nowa:
+                stacja = self.stacje[klucz] = _StanStacji(self.interwal)
+            elif stacja.odebrane:
+                odstep = teraz - stacja.ostatnia
+                if stacja.odebrane == 1:
+                    # Pierwszy odstęp - interwał nie większy niż domyślny (mógł zginąć pakiet)
+                    stacja.interwal = max(min(odstep, stacja.interwal), self.kolo.rozdzielczosc)
+                elif odstep >= PROG_ZGUBIENIA * stacja.interwal:
+                    stacja.zgubione += max(int(round(odstep / stacja.interwal)) - 1, 0)
+                elif odstep > 0:
+                    stacja.interwal += WAGA_INTERWALU * (odstep - stacja.interwal)
+            stacja.ostatnia = teraz
+            stacja.odebrane += 1
+            stacja.probki = probki
+            stacja.suma_rssi = _dopisz(stacja.rssi, stacja.suma_rssi, rssi)
+            stacja.suma_snr = _dopisz(stacja.snr, stacja.suma_snr, snr)
+            self.kolo.ustaw(klucz, teraz + self.mnoznik_opoznienia * stacja.interwal)
+            if nowa or stacja.stan != OK:
+                stacja.stan = OK
+                return [(klucz, OK)]
+            return []
+
+    def tik(self, teraz):
+        """Przesuwa koło do `teraz`, zwraca [(klucz, nowy stan)]"""
+        zmiany = []
+        with self._blokada:
+            for klucz, termin in self.kolo.tik(teraz):
+                stacja = self.stacje[klucz]
+                if stacja.stan == OK:
+                    stacja.stan = OPOZNIONA
+                    self.kolo.ustaw(klucz, stacja.ostatnia + self.mnoznik_offline * stacja.interwal)
+                else:
+                    stacja.stan = OFFLINE
+                zmiany.append((klucz, stacja.stan))
+        return zmiany
+
+    def migawka(self, teraz=None, klucze=None):
+        """Stan stacji jako słownik do JSON (wszystkie albo podane klucze)"""
+        teraz = time.time() if teraz is None else teraz
+        wynik = {}
+        with self._blokada:
+            for klucz in (self.stacje if klucze is None else klucze):
+                stacja = self.stacje.get(klucz)
+                if stacja is None:
+                    continue
+                oczekiwane = stacja.odebrane + stacja.zgubione
+                wynik[klucz] = {
+                    'stan': stacja.stan,
+                    'wiek': round(teraz - stacja.ostatnia, 1),
+                    'interwal': round(stacja.interwal, 1),
+                    'odebrane': stacja.odebrane,
+                    'zgubione': stacja.zgubione,
+                    'dostarczalnosc': round(stacja.odebrane / oczekiwane, 3) if oczekiwane else None,
+                    'probki': stacja.probki,
+                    'rssi': round(stacja.suma_rssi / len(stacja.rssi), 1) if stacja.rssi else None,
+                    'rssi_min': min(stacja.rssi) if stacja.rssi else None,
+                    'snr': round(stacja.suma_snr / len(stacja.snr), 1) if stacja.snr else None,
+                }
+        return wynik
+
+    def statystyki(self):
+        with self._blokada:
+            stany = [s.stan for s in self.stacje.values()]
+        return {'stacje': len(stany), 'terminy': len(self.kolo),
+                OK: stany.count(OK), OPOZNIONA: stany.count(OPOZNIONA), OFFLINE: stany.count(OFFLINE)}
+
+
+def _test():
+    n = 10000
+    t0 = 1_000_000.0
+    monitor = MonitorStacji(teraz=t0)
+    # Wszystkie stacje co 60 s z rozłożoną fazą, stacja 0 milknie po 10 min,
+    # stacja 1 gubi co trzecią ramkę
+    start = time.perf_counter()
+    ramki = 0
+    zmiany = []
+    for sekunda in range(0, 1800):
+        teraz = t0 + sekunda
+        for s in range(sekunda % 60, n, 60):
+            if s == 0 and sekunda > 600:
+                continue
+            if s == 1 and (sekunda // 60) % 3 == 2:
+                continue
+            zmiany += monitor.odebrano(s, teraz, probki=10, rssi=-100.0 - s % 20, snr=5.0)
+            ramki += 1
+        zmiany += monitor.tik(teraz)
+    czas = time.perf_counter() - start
+    stan = monitor.migawka(t0 + 1800, [0, 1, 2])
+    print(f"{ramki} ramek, {n} stacji, 1800 taktow: {czas:.2f} s ({ramki / czas:.0f} ramek/s)")
+    print(stan)
+    print(monitor.statystyki())
+    assert stan[0]['stan'] == OFFLINE and stan[2]['stan'] == OK
+    assert stan[1]['zgubione'] >= 9 and stan[1]['stan'] == OK
+    assert [z for z in zmiany if z[1] != OK] == [(0, OPOZNIONA), (0, OFFLINE)]
+    assert abs(stan[2]['interwal'] - 60.0) < 1.0
+
+    # Restart serwera: stacja z historii bez nowych ramek przechodzi w offline
+    monitor = MonitorStacji(teraz=t0)
+    monitor.zarejestruj('x', t0 - 3600)
+    assert monitor.tik(t0) == [('x', OPOZNIONA)] and monitor.tik(t0 + 1) == [('x', OFFLINE)]
+    assert monitor.odebrano('x', t0 + 2) == [('x', OK)] and monitor.migawka(t0 + 2)['x']['zgubione'] == 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        _test()
+    else:
+        print("Uzycie: python3 zywotnosc.py test")